@@ -0,0 +1,163 @@
+#--------------------------------
+# Name:         cascade_benchmark.py
+# Purpose:      Compare the NumPy cascade routing to the CRT cascades
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import cascade_functions as cascade
+import prms_param_functions as prms_param
+
+
+def cascade_benchmark(cascade_path, gis_path, cols, flowflg=3, dpit=0.01):
+    """Compare the NumPy cascade routing to the CRT cascades
+
+    The HRU types and elevations are read from the GIS derived parameter
+    file and the stream cells are the HRUs that CRT cascaded to a stream
+    segment (one stream cell per cascade, like STREAM_CELLS.DAT).
+    Duplicate cascades (HRUs with several reaches of the same segment)
+    are merged before comparing.
+
+    Parameters
+    ----------
+    cascade_path : str
+        CRT (or PRMS) parameter file with the hru cascade parameters.
+    gis_path : str
+        PRMS parameter file with the hru_type and hru_elev parameters.
+    cols : int
+        Number of columns in the model grid.
+    flowflg : int
+        CRT FLOWFLG.
+    dpit : float
+        CRT DPIT.
+
+    Returns
+    -------
+    None
+
+    """
+    logging.info('CRT cascades: {}'.format(cascade_path))
+    crt_file = prms_param.ParamFile(cascade_path)
+    crt_dict = {name: crt_file.read(name) for name in crt_file.params}
+    logging.info('GIS parameters: {}'.format(gis_path))
+    gis_file = prms_param.ParamFile(gis_path)
+    gis_dict = {
+        name: gis_file.read(name) for name in ['hru_type', 'hru_elev']}
+    hru_type_array = gis_dict['hru_type'].reshape(-1, cols)
+    elev_array = gis_dict['hru_elev'].reshape(-1, cols)
+    logging.info('  Shape: {} x {}  ({} HRUs)'.format(
+        hru_type_array.shape[0], hru_type_array.shape[1],
+        hru_type_array.size))
+
+    # Stream cells (and outflow cells) cascade out of the grid
+    crt_up = crt_dict['hru_up_id']
+    crt_seg = crt_dict['hru_strmseg_down_id']
+    crt_down = crt_dict['hru_down_id']
+    stream_row, stream_col = np.divmod(crt_up[crt_seg > 0] - 1, cols)
+    outflow_array = np.zeros(hru_type_array.size, dtype=np.bool)
+    outflow_array[crt_up[(crt_seg == 0) & (crt_down <= 0)] - 1] = True
+
+    logging.info('\ncascade.cascade_routing (FLOWFLG={}, DPIT={})'.format(
+        flowflg, dpit))
+    clock = time.clock()
+    np_dict = cascade.cascade_routing(
+        hru_type_array, elev_array, stream_row + 1, stream_col + 1,
+        crt_seg[crt_seg > 0], outflow_array.reshape(hru_type_array.shape),
+        flowflg=flowflg, dpit=dpit)
+    logging.info('  Time: {:.3f} s'.format(time.clock() - clock))
+
+    # Merge duplicate cascades using a single integer key
+    key_dims = [
+        max(crt_up.max(), np_dict['up_id'].max()) + 1,
+        max(crt_down.max(), np_dict['down_id'].max()) + 1,
+        max(crt_seg.max(), np_dict['strmseg_down_id'].max()) + 1]
+
+    def merge_cascades(up, down, seg, pct):
+        """Sum the percents of duplicate cascades"""
+        key_array, inverse = np.unique(
+            np.ravel_multi_index((up, down, seg), key_dims),
+            return_inverse=True)
+        return key_array, np.bincount(inverse, pct)
+
+    crt_keys, crt_pct = merge_cascades(
+        crt_up, crt_down, crt_seg, crt_dict['hru_pct_up'])
+    np_keys, np_pct = merge_cascades(
+        np_dict['up_id'], np_dict['down_id'], np_dict['strmseg_down_id'],
+        np_dict['pct_up'])
+    match_mask = np.in1d(crt_keys, np_keys)
+    np_index = np.searchsorted(np_keys, crt_keys[match_mask])
+    pct_diff = np.abs(crt_pct[match_mask] - np_pct[np_index])
+
+    # HRUs with a different set of cascades
+    diff_up = np.union1d(
+        np.unravel_index(crt_keys[~match_mask], key_dims)[0],
+        np.unravel_index(np_keys[~np.in1d(np_keys, crt_keys)], key_dims)[0])
+
+    logging.info('\nComparison')
+    logging.info('  Cascades (CRT):        {}'.format(crt_up.size))
+    logging.info('  Cascades (NumPy):      {}'.format(np_dict['up_id'].size))
+    logging.info('  Merged cascades (CRT): {}'.format(crt_keys.size))
+    logging.info('  Matching cascades:     {}'.format(int(np.sum(match_mask))))
+    logging.info('  HRUs that differ:      {}'.format(diff_up.size))
+    if diff_up.size:
+        logging.info('    {}'.format(', '.join(map(str, diff_up[:20]))))
+    logging.info('  Max pct difference:    {:.3f}'.format(
+        np.max(pct_diff) if pct_diff.size else 0))
+    logging.info('  Cells filled (NumPy):  {}'.format(
+        int(np.sum(np_dict['fill'] > 0))))
+    logging.info('  Swale cells (NumPy):   {}'.format(np_dict['swale_count']))
+
+
+def arg_parse():
+    """"""
+    save_ws = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'examples',
+        'sagehen', 'save')
+    parser = argparse.ArgumentParser(
+        description='Cascade Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--cascade', metavar='PATH', help='CRT cascade parameter file',
+        default=os.path.join(save_ws, 'cascade.param.save'))
+    parser.add_argument(
+        '--gis', metavar='PATH', help='GIS derived parameter file',
+        default=os.path.join(save_ws, 'gis_derived_parameters.param.save'))
+    parser.add_argument(
+        '--cols', default=84, type=int, help='Number of model grid columns')
+    parser.add_argument(
+        '--flowflg', default=3, type=int, help='CRT FLOWFLG')
+    parser.add_argument(
+        '--dpit', default=0.01, type=float, help='CRT DPIT')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+    args.cascade = os.path.abspath(args.cascade)
+    args.gis = os.path.abspath(args.gis)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    cascade_benchmark(
+        cascade_path=args.cascade, gis_path=args.gis, cols=args.cols,
+        flowflg=args.flowflg, dpit=args.dpit)
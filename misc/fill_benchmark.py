@@ -0,0 +1,114 @@
+#--------------------------------
+# Name:         fill_benchmark.py
+# Purpose:      Compare the NumPy priority-flood fill to arcpy.sa.Fill
+# Notes:        ArcGIS 10.2+ Version
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sys
+import time
+
+import arcpy
+import numpy as np
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import flow_functions as flow
+
+
+def fill_benchmark(dem_path, epsilon=0):
+    """Compare the NumPy priority-flood fill to arcpy.sa.Fill
+
+    Parameters
+    ----------
+    dem_path : str
+        DEM raster path.
+    epsilon : float
+        Elevation increment for the priority-flood fill.
+
+    Returns
+    -------
+    None
+
+    """
+    arcpy.CheckOutExtension('Spatial')
+    arcpy.env.overwriteOutput = True
+
+    logging.info('DEM: {}'.format(dem_path))
+    dem_obj = arcpy.sa.Raster(dem_path)
+    dem_nodata = dem_obj.noDataValue
+    dem_array = arcpy.RasterToNumPyArray(dem_obj).astype(np.float64)
+    if dem_nodata is not None:
+        dem_array[dem_array == dem_nodata] = np.nan
+    logging.info('  Shape: {} x {}  ({} cells)'.format(
+        dem_array.shape[0], dem_array.shape[1], dem_array.size))
+
+    logging.info('\narcpy.sa.Fill')
+    clock = time.clock()
+    arc_fill_obj = arcpy.sa.Fill(dem_obj)
+    arc_fill_array = arcpy.RasterToNumPyArray(arc_fill_obj).astype(np.float64)
+    arc_fill_array[arc_fill_array == arc_fill_obj.noDataValue] = np.nan
+    arc_seconds = time.clock() - clock
+    logging.info('  Time: {:.3f} s'.format(arc_seconds))
+    del arc_fill_obj
+
+    logging.info('\nflow.priority_flood_fill (epsilon={})'.format(epsilon))
+    clock = time.clock()
+    np_fill_array = flow.priority_flood_fill(dem_array, epsilon)
+    np_seconds = time.clock() - clock
+    logging.info('  Time: {:.3f} s'.format(np_seconds))
+
+    # Fill output from ArcGIS is single precision
+    data_mask = np.isfinite(arc_fill_array) & np.isfinite(np_fill_array)
+    diff_array = np_fill_array[data_mask] - arc_fill_array[data_mask]
+    logging.info('\nComparison')
+    logging.info('  Nodata cells match:  {}'.format(np.array_equal(
+        np.isnan(arc_fill_array), np.isnan(np_fill_array))))
+    logging.info('  Cells filled (Arc):  {}'.format(
+        np.sum(arc_fill_array[data_mask] > dem_array[data_mask])))
+    logging.info('  Cells filled (NumPy): {}'.format(
+        np.sum(np_fill_array[data_mask] > dem_array[data_mask])))
+    logging.info('  Max abs. difference: {:.6f}'.format(
+        np.max(np.abs(diff_array)) if diff_array.size else 0))
+    logging.info('  Cells > 0.001:       {}'.format(
+        np.sum(np.abs(diff_array) > 0.001)))
+    logging.info('  Speedup:             {:.2f}x'.format(
+        arc_seconds / np_seconds))
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='Fill Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--dem', metavar='PATH', help='DEM raster path',
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), '..', 'examples',
+            'sagehen', 'dem', 'ned10m_nad83.img'))
+    parser.add_argument(
+        '--epsilon', default=0, type=float,
+        help='Priority-flood fill elevation increment')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+    args.dem = os.path.abspath(args.dem)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    fill_benchmark(dem_path=args.dem, epsilon=args.epsilon)
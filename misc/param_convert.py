@@ -0,0 +1,85 @@
+#--------------------------------
+# Name:         param_convert.py
+# Purpose:      Convert PRMS parameter files between the ASCII and NPZ formats
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import prms_param_functions as prms_param
+
+
+def param_convert(input_path, output_path, compress_flag=True):
+    """Convert a PRMS parameter file between the ASCII and NPZ formats
+
+    The format of each file is set by the extension (".npz" for the
+    compressed NumPy archive written by prms_template_fill when
+    param_output_format = NPZ, otherwise the ASCII format PRMS reads).
+
+    Parameters
+    ----------
+    input_path : str
+        Input parameter file path.
+    output_path : str
+        Output parameter file path.
+    compress_flag : bool
+        If True, compress the NPZ arrays.
+
+    Returns
+    -------
+    None
+
+    """
+    logging.info('Input:  {}'.format(input_path))
+    logging.info('Output: {}'.format(output_path))
+    if not os.path.isfile(input_path):
+        logging.error('\nERROR: The input file does not exist\n')
+        sys.exit()
+    elif input_path == output_path:
+        logging.error('\nERROR: The input and output files are the same\n')
+        sys.exit()
+    prms_param.convert_param_file(
+        input_path, output_path, compress_flag=compress_flag)
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='PRMS Parameter File Converter',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        'input', metavar='PATH', help='Input parameter file')
+    parser.add_argument(
+        'output', metavar='PATH', help='Output parameter file')
+    parser.add_argument(
+        '--no_compress', default=True, action='store_false',
+        dest='compress', help='Don\'t compress the NPZ arrays')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+    args.input = os.path.abspath(args.input)
+    args.output = os.path.abspath(args.output)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    param_convert(
+        input_path=args.input, output_path=args.output,
+        compress_flag=args.compress)
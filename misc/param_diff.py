@@ -0,0 +1,105 @@
+#--------------------------------
+# Name:         param_diff.py
+# Purpose:      Compare two PRMS parameter files
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import prms_param_functions as prms_param
+
+
+def param_diff(param_path_a, param_path_b, atol=0.000001, rtol=0,
+               all_flag=False):
+    """Compare two PRMS parameter files
+
+    Each dimension and parameter is read once and the number of values
+    that are different (outside the tolerance), the maximum difference
+    and the mean difference are reported.
+
+    Parameters
+    ----------
+    param_path_a : str
+        Parameter file path.
+    param_path_b : str
+        Reference parameter file path.
+    atol : float
+        Absolute tolerance.
+    rtol : float
+        Relative tolerance (of the reference values).
+    all_flag : bool
+        If True, also report the parameters that match.
+
+    Returns
+    -------
+    int: number of dimensions and parameters that are different
+
+    """
+    logging.info('File A: {}'.format(param_path_a))
+    logging.info('File B: {}'.format(param_path_b))
+    logging.info('Tolerance: abs(A - B) > {} + {} * abs(B)'.format(atol, rtol))
+
+    diff_list = prms_param.param_diff(
+        param_path_a, param_path_b, atol=atol, rtol=rtol)
+    output_f = '  {:<24s} {:<7s} {:>10s} {:>14s} {:>14s}'
+    logging.info('\n' + output_f.format(
+        'NAME', 'STATUS', 'DIFF_COUNT', 'MAX_DIFF', 'MEAN_DIFF'))
+    for name, status, diff_count, max_diff, mean_diff in diff_list:
+        if status == 'OK' and not all_flag:
+            continue
+        logging.info(output_f.format(
+            name, status, str(diff_count), '{:.6g}'.format(max_diff),
+            '{:.6g}'.format(mean_diff)))
+
+    diff_count = len([d for d in diff_list if d[1] != 'OK'])
+    logging.info('\n  {} of {} dimensions/parameters are different'.format(
+        diff_count, len(diff_list)))
+    return diff_count
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='PRMS Parameter File Diff',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        'param_a', metavar='PATH', help='Parameter file')
+    parser.add_argument(
+        'param_b', metavar='PATH', help='Reference parameter file')
+    parser.add_argument(
+        '--atol', default=0.000001, type=float, help='Absolute tolerance')
+    parser.add_argument(
+        '--rtol', default=0, type=float, help='Relative tolerance')
+    parser.add_argument(
+        '--all', default=False, action='store_true',
+        help='Report parameters that match')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+    args.param_a = os.path.abspath(args.param_a)
+    args.param_b = os.path.abspath(args.param_b)
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    # Exit status is 1 if the files are different
+    sys.exit(1 if param_diff(
+        param_path_a=args.param_a, param_path_b=args.param_b,
+        atol=args.atol, rtol=args.rtol, all_flag=args.all) else 0)
@@ -0,0 +1,213 @@
+#--------------------------------
+# Name:         param_writer_benchmark.py
+# Purpose:      Benchmark the PRMS parameter file writer
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import datetime as dt
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import prms_param_functions as prms_param
+
+
+def param_writer_benchmark(hru_count=1000000, cols=1000, legacy_flag=True):
+    """Benchmark the PRMS parameter file writer on a synthetic model
+
+    The synthetic model has gridded HRU parameters, monthly HRU parameters
+    and HRU cascades (two per HRU) split between four parameter files
+    like the template PARAM_FILE values.  The files are written one value
+    at a time (like prms_template_fill used to), one file at a time and
+    with a thread per file, and the file hashes are compared.
+
+    Parameters
+    ----------
+    hru_count : int
+        Number of HRUs.
+    cols : int
+        Number of columns (values per line of the nhru parameters).
+    legacy_flag : bool
+        If True, also write the files one value at a time.
+
+    Returns
+    -------
+    None
+
+    """
+    header_str = 'PRMS parameter file generated with gsflow-arcpy-tools version X\n'
+    param_file_dict = build_param_files(hru_count, cols)
+    value_count = sum(
+        p[4].size for dimen_list, param_list in param_file_dict.values()
+        for p in param_list)
+    logging.info('  HRUs:   {}'.format(hru_count))
+    logging.info('  Values: {}'.format(value_count))
+
+    temp_ws = tempfile.mkdtemp()
+    try:
+        hash_dict = dict()
+        time_dict = dict()
+        method_list = ['threaded', 'serial']
+        if legacy_flag:
+            method_list.append('legacy')
+        for method in method_list:
+            output_ws = os.path.join(temp_ws, method)
+            os.makedirs(output_ws)
+            output_dict = {
+                os.path.join(output_ws, name): value
+                for name, value in param_file_dict.items()}
+            logging.info('\n{}'.format(method.title()))
+            clock = time.time()
+            if method == 'threaded':
+                prms_param.write_param_files(output_dict, header_str)
+            elif method == 'serial':
+                prms_param.write_param_files(
+                    output_dict, header_str, thread_flag=False)
+            elif method == 'legacy':
+                for output_path, (dimen_list, param_list) in sorted(
+                        output_dict.items()):
+                    legacy_write_param_file(
+                        output_path, header_str, dimen_list, param_list)
+            time_dict[method] = time.time() - clock
+            logging.info('  Time: {:.2f} s'.format(time_dict[method]))
+            hash_dict[method] = [
+                file_hash(os.path.join(output_ws, name))
+                for name in sorted(param_file_dict.keys())]
+
+        logging.info('\nComparison')
+        for method in method_list[1:]:
+            logging.info('  {} files match {}: {}'.format(
+                method_list[0].title(), method,
+                hash_dict[method_list[0]] == hash_dict[method]))
+        if legacy_flag:
+            logging.info('  Speedup (legacy / threaded): {:.1f}x'.format(
+                time_dict['legacy'] / time_dict['threaded']))
+    finally:
+        shutil.rmtree(temp_ws)
+
+
+def build_param_files(hru_count, cols):
+    """Synthetic parameter files (see prms_param.write_param_files())"""
+    rs = np.random.RandomState(0)
+    nhru = ['nhru']
+    monthly = ['nhru', 'nmonths']
+
+    def hru_param(name, dimen_names, param_type, values, n=cols):
+        return (name, dimen_names, values.size, param_type, values, n)
+
+    gis_list = [
+        hru_param('hru_area', nhru, 2, np.full(hru_count, 24.710538)),
+        hru_param('hru_elev', nhru, 2, 1500 + 1000 * rs.rand(hru_count)),
+        hru_param('hru_slope', nhru, 2, rs.rand(hru_count)),
+        hru_param('hru_type', nhru, 1, rs.randint(
+            0, 4, hru_count).astype(np.int32)),
+        hru_param('cov_type', nhru, 1, rs.randint(
+            0, 5, hru_count).astype(np.int32))]
+    calib_list = [
+        hru_param(name, monthly, 2, np.asfortranarray(
+            0.5 + rs.rand(hru_count, 12)))
+        for name in ['rain_adj', 'snow_adj', 'tmax_adj', 'tmin_adj']]
+    default_list = [
+        hru_param('soil_moist_max', nhru, 2, 10 * rs.rand(hru_count)),
+        hru_param('ssr2gw_rate', nhru, 2, rs.rand(hru_count)),
+        ('tmax_index', ['nmonths'], 12, 2, 50 + 30 * rs.rand(12), 1)]
+
+    cascade_count = 2 * hru_count
+    up_id = np.repeat(np.arange(1, hru_count + 1), 2).astype(np.int32)
+    cascade_list = [
+        ('hru_up_id', ['ncascade'], cascade_count, 1, up_id, 1),
+        ('hru_strmseg_down_id', ['ncascade'], cascade_count, 1,
+         np.zeros(cascade_count, dtype=np.int32), 1),
+        ('hru_down_id', ['ncascade'], cascade_count, 1,
+         np.minimum(up_id + 1, hru_count).astype(np.int32), 1),
+        ('hru_pct_up', ['ncascade'], cascade_count, 2,
+         np.round(rs.rand(cascade_count), 3), 1)]
+
+    return {
+        'gis_derived_parameters.param': (
+            [('nhru', hru_count), ('nmonths', 12)], gis_list),
+        'calibration_parameters.param': ([], calib_list),
+        'default_values.param': ([('one', 1)], default_list),
+        'cascade.param': ([('ncascade', cascade_count)], cascade_list)}
+
+
+def legacy_write_param_file(output_path, header_str, dimen_list, param_list):
+    """Write a parameter file one value at a time"""
+    param_formats = {1: '{:d}', 2: '{:f}', 3: '{:f}', 4: '{}'}
+    with open(output_path, 'w') as output_f:
+        output_f.write(header_str + '\n')
+        if dimen_list:
+            output_f.write(prms_param.DIMEN_HEADER + '\n')
+        for dimen_name, dimen_size in dimen_list:
+            output_f.write(prms_param.BREAK_STR + '\n')
+            output_f.write(dimen_name + '\n')
+            output_f.write(str(dimen_size) + '\n')
+        if param_list:
+            output_f.write(prms_param.PARAM_HEADER + '\n')
+        for name, dimen_names, value_count, param_type, values, n in \
+                param_list:
+            output_f.write(prms_param.BREAK_STR + '\n')
+            output_f.write('{}\n'.format(name))
+            output_f.write('{}\n'.format(len(dimen_names)))
+            for dimen_name in dimen_names:
+                output_f.write(dimen_name + '\n')
+            output_f.write(str(value_count) + '\n')
+            output_f.write(str(param_type) + '\n')
+            value_list = np.ravel(values, order='F').tolist()
+            for i in range(0, len(value_list), n):
+                values_str = ' '.join([
+                    param_formats[param_type].format(v)
+                    for v in value_list[i:i + n]])
+                output_f.write(values_str + '\n')
+
+
+def file_hash(file_path):
+    """MD5 hash of a file"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as input_f:
+        for block in iter(lambda: input_f.read(2 ** 20), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='PRMS Parameter Writer Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--hru', default=1000000, type=int, help='Number of HRUs')
+    parser.add_argument(
+        '--cols', default=1000, type=int, help='Number of model grid columns')
+    parser.add_argument(
+        '--no_legacy', default=True, action='store_false', dest='legacy',
+        help='Skip writing the files one value at a time')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    param_writer_benchmark(
+        hru_count=args.hru, cols=args.cols, legacy_flag=args.legacy)
@@ -0,0 +1,210 @@
+#--------------------------------
+# Name:         cascade_functions.py
+# Purpose:      GSFLOW NumPy cascade routing functions (CRT alternative)
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import logging
+
+import numpy as np
+
+import flow_functions as flow
+
+
+# Cascade parameter names and dimension of the surface (HRU) and
+#   groundwater (GW) cascades (as written by CRT)
+HRU_CASCADE_PARAMS = [
+    'hru_up_id', 'hru_strmseg_down_id', 'hru_down_id', 'hru_pct_up']
+GW_CASCADE_PARAMS = [
+    'gw_up_id', 'gw_strmseg_down_id', 'gw_down_id', 'gw_pct_up']
+
+
+def cascade_routing(hru_type_array, elev_array, stream_row, stream_col,
+                    stream_iseg, outflow_mask, hruflg=0, flowflg=1,
+                    dpit=0.01, outitmax=100000):
+    """Fill the land surface and build the HRU cascades (like CRT)
+
+    Each model cell is an HRU (CRT HRUFLG = 0) and the HRU ID is the
+    flat (row major) index of the cell + 1.
+    Stream cells cascade to their stream segments (split evenly between
+    the segments in the cell), outflow cells cascade out of the model, and
+    lake/swale cells don't cascade.
+    All other active cells cascade to their lower neighbors:
+        FLOWFLG 1 - only to the steepest neighbor (drop / distance)
+        FLOWFLG 2/3 - to all lower neighbors, split by the elevation drop
+            (matches the CRT FLOWFLG 3 cascades of the Sagehen example)
+
+    Only the FLOWFLG 3 cascades have been checked against CRT, so a
+    warning is logged for FLOWFLG 1 and 2 (other values are not supported).
+
+    Cells that can't drain are filled with the Priority-Flood algorithm,
+    raising each filled cell DPIT above its spill point.  Unlike CRT the
+    fill is not iterative, so OUTITMAX is not used (a warning is logged).
+
+    Args:
+        hru_type_array (np.array): HRU types (0-inactive, 1-land, 2-lake,
+            3-swale)
+        elev_array (np.array): Land surface elevations (DEM_ADJ)
+        stream_row (np.array): Stream cell row indices (1 based)
+        stream_col (np.array): Stream cell column indices (1 based)
+        stream_iseg (np.array): Stream cell segments (one value per
+            stream reach, like STREAM_CELLS.DAT)
+        outflow_mask (np.array): Boolean array of the outflow HRUs
+        hruflg (int): CRT HRUFLG, only 0 is supported
+        flowflg (int): CRT FLOWFLG (1, 2 or 3)
+        dpit (float): CRT DPIT, fill elevation increment (must be > 0)
+        outitmax (int): CRT OUTITMAX
+
+    Returns:
+        dict: 'elev' (filled elevations), 'fill' (fill depths),
+            'up_id', 'down_id', 'strmseg_down_id', 'pct_up' (cascades),
+            'swale_count' (active cells that can't cascade)
+    """
+    if hruflg != 0:
+        raise ValueError('Only HRUFLG 0 (cell HRUs) is supported')
+    elif dpit <= 0:
+        raise ValueError('DPIT must be greater than 0')
+    elif flowflg not in [1, 2, 3]:
+        raise ValueError('FLOWFLG must be 1, 2 or 3')
+    elif outitmax <= 0:
+        raise ValueError('OUTITMAX must be greater than 0')
+    if flowflg != 3:
+        logging.warning(
+            '  WARNING: The FLOWFLG {} cascades are approximated '
+            '(only FLOWFLG 3 matches CRT)'.format(flowflg))
+    logging.warning(
+        '  WARNING: OUTITMAX is not used, the land surface is filled in '
+        'a single pass')
+    rows, cols = hru_type_array.shape
+
+    active_mask = hru_type_array > 0
+    stream_index = (
+        (np.asarray(stream_row, dtype=np.int64) - 1) * cols +
+        np.asarray(stream_col, dtype=np.int64) - 1)
+    stream_iseg = np.asarray(stream_iseg, dtype=np.int64)
+    stream_mask = np.zeros(active_mask.shape, dtype=np.bool)
+    stream_mask.flat[stream_index] = True
+    stream_mask &= active_mask
+    sink_mask = active_mask & ~stream_mask & np.in1d(
+        hru_type_array, [2, 3]).reshape(active_mask.shape)
+    outflow_mask = active_mask & ~stream_mask & ~sink_mask & outflow_mask
+    land_mask = active_mask & ~(stream_mask | sink_mask | outflow_mask)
+
+    # Fill the pits so that every land cell drains to an outlet
+    logging.debug('  Filling land surface')
+    input_array = np.where(active_mask, elev_array, np.nan).astype(np.float64)
+    filled_array = flow.priority_flood_fill(
+        input_array, epsilon=dpit,
+        outlet_mask=stream_mask | sink_mask | outflow_mask)
+    fill_array = np.where(active_mask, filled_array - input_array, 0)
+    fill_array[fill_array < 0] = 0
+
+    # Drop to each of the 8 neighbors (drops to inactive cells are NaN)
+    z_array = flow.pad_array(filled_array)
+    drop_list = []
+    dist_list = []
+    for code, i, j in flow.D8_DIRECTIONS:
+        drop_list.append(
+            z_array[1:-1, 1:-1] - z_array[1 + i:rows + 1 + i,
+                                          1 + j:cols + 1 + j])
+        dist_list.append(np.hypot(i, j))
+    drop_array = np.array(drop_list).reshape(8, -1)
+    drop_array[:, ~land_mask.ravel()] = np.nan
+    with np.errstate(invalid='ignore'):
+        lower_mask = drop_array > 0
+    drop_array[~lower_mask] = 0
+
+    if flowflg == 1:
+        slope_array = drop_array / np.array(dist_list)[:, np.newaxis]
+        steep_index = np.argmax(slope_array, axis=0)
+        steep_mask = np.zeros(lower_mask.shape, dtype=np.bool)
+        steep_mask[steep_index, np.arange(steep_index.size)] = True
+        lower_mask &= steep_mask
+        drop_array[~lower_mask] = 0
+        del slope_array, steep_index, steep_mask
+    drop_sum = drop_array.sum(axis=0)
+    swale_mask = land_mask.ravel() & (drop_sum <= 0)
+    if np.any(swale_mask):
+        logging.debug(
+            '  {} cells could not be filled to an outlet'.format(
+                int(np.sum(swale_mask))))
+
+    # Land cascades, in HRU ID and D8 direction order
+    dir_index, cell_index = np.nonzero(lower_mask)
+    offset_array = np.array(
+        [i * cols + j for code, i, j in flow.D8_DIRECTIONS])
+    sort_index = np.lexsort((dir_index, cell_index))
+    dir_index = dir_index[sort_index]
+    cell_index = cell_index[sort_index]
+    land_up = cell_index + 1
+    land_down = cell_index + offset_array[dir_index] + 1
+    land_pct = np.round(
+        drop_array[dir_index, cell_index] / drop_sum[cell_index], 3)
+    del drop_array, drop_sum, lower_mask
+
+    # Stream and outflow cells cascade completely out of the grid
+    stream_index_mask = stream_mask.flat[stream_index]
+    stream_index = stream_index[stream_index_mask]
+    stream_iseg = stream_iseg[stream_index_mask]
+    outflow_index = np.flatnonzero(outflow_mask)
+    exit_index = np.concatenate([stream_index, outflow_index])
+    exit_seg = np.concatenate([
+        stream_iseg, np.zeros(outflow_index.size, dtype=np.int64)])
+    exit_pct = np.round(1.0 / np.bincount(
+        exit_index, minlength=rows * cols)[exit_index], 3)
+
+    up_array = np.concatenate([land_up, exit_index + 1])
+    sort_index = np.argsort(up_array, kind='mergesort')
+    return {
+        'elev': filled_array,
+        'fill': fill_array,
+        'up_id': up_array[sort_index].astype(np.int64),
+        'down_id': np.concatenate([
+            land_down, np.zeros(exit_index.size)])[sort_index].astype(
+                np.int64),
+        'strmseg_down_id': np.concatenate([
+            np.zeros(land_up.size), exit_seg])[sort_index].astype(np.int64),
+        'pct_up': np.concatenate([
+            land_pct, exit_pct])[sort_index],
+        'swale_count': int(np.sum(swale_mask))}
+
+
+def write_cascade_param(output_path, cascade_dict, prefix='hru',
+                        dimen_name='ncascade'):
+    """Write the cascade parameters in the CRT cascade.param format
+
+    Args:
+        output_path (str): Output file path
+        cascade_dict (dict): Cascades from cascade_routing()
+        prefix (str): Parameter name prefix ('hru' or 'gw')
+        dimen_name (str): Dimension name ('ncascade' or 'ncascdgw')
+
+    Returns:
+        None
+    """
+    count = cascade_dict['up_id'].size
+    with open(output_path, 'w') as output_f:
+        for key, value_fmt, param_type in [
+                ('up_id', '%d', 1), ('strmseg_down_id', '%d', 1),
+                ('down_id', '%d', 1), ('pct_up', '%f', 2)]:
+            output_f.write('####\n{}_{}\n1\n{}\n{}\n{}\n'.format(
+                prefix, key, dimen_name, count, param_type))
+            if count:
+                output_f.write('\n'.join(np.char.mod(
+                    value_fmt, cascade_dict[key]).tolist()) + '\n')
+
+
+def write_cascade_dimensions(output_path, dimen_name, count):
+    """Write the cascade dimension in the CRT parameter_dimensions.txt format
+
+    Args:
+        output_path (str): Output file path
+        dimen_name (str): Dimension name ('ncascade' or 'ncascdgw')
+        count (int): Number of cascades
+
+    Returns:
+        None
+    """
+    with open(output_path, 'w') as output_f:
+        output_f.write('####\n{}\n{}\n'.format(dimen_name, count))
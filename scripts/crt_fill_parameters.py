@@ -6,7 +6,6 @@
 #--------------------------------
 
 import argparse
-from collections import defaultdict
 import ConfigParser
 import datetime as dt
 import logging
@@ -14,12 +13,14 @@ import math
 import os
 import pprint
 import shutil
-import subprocess
 import sys
 
 import arcpy
 from arcpy import env
+import numpy as np
 
+import cascade_functions as cascade
+import crt_functions as crt
 import support_functions as support
 
 
@@ -33,7 +34,7 @@ def crt_fill_parameters(config_path):
 
     Returns
     -------
-    None
+    int: number of cells filled by CRT
 
     """
     # Initialize hru_parameters class
@@ -101,21 +102,50 @@ def crt_fill_parameters(config_path):
         logging.info(
             '  Missing INI parameter, setting {} = {}'.format(
                 'crt_outitmax', crt_outitmax))
+    try:
+        crt_cache_flag = inputs_cfg.getboolean('INPUTS', 'crt_cache_flag')
+    except ConfigParser.NoOptionError:
+        crt_cache_flag = True
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_cache_flag', crt_cache_flag))
+    try:
+        crt_timeout = inputs_cfg.getfloat('INPUTS', 'crt_timeout')
+    except ConfigParser.NoOptionError:
+        crt_timeout = 0
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_timeout', crt_timeout))
 
-    # Intentionally not allowing user to change this value
-    crt_iprn = 1
+    try:
+        crt_engine = inputs_cfg.get('INPUTS', 'crt_engine').upper()
+    except ConfigParser.NoOptionError:
+        crt_engine = 'EXE'
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_engine', crt_engine))
 
     # CRT Fill Parameters
     fill_ws_name = 'fill_work'
-    fill_strmflg = 0
-    fill_visflg = 0
-    fill_ifill = 1
 
     # CRT Executable
-    crt_exe_path = inputs_cfg.get('INPUTS', 'crt_exe_path')
-    output_name = 'outputstat.txt'
+    if crt_engine == 'EXE':
+        crt_exe_path = inputs_cfg.get('INPUTS', 'crt_exe_path')
 
     # Check input paths
+    if crt_engine not in ['EXE', 'PYTHON']:
+        logging.error(
+            '\nERROR: crt_engine must be EXE or PYTHON\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_hruflg != 0:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_hruflg = 0\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_flowflg not in [1, 2, 3]:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_flowflg = '
+            '1, 2 or 3\n')
+        sys.exit()
     if not arcpy.Exists(hru.polygon_path):
         logging.error(
             '\nERROR: Fishnet ({}) does not exist\n'.format(
@@ -154,20 +184,15 @@ def crt_fill_parameters(config_path):
         os.makedirs(fill_ws)
 
     # Copy CRT executable if necessary
-    crt_exe_name = os.path.basename(crt_exe_path)
-    if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
-        shutil.copy(crt_exe_path, fill_ws)
-    if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
-        logging.error(
-            '\nERROR: CRT executable ({}) does not exist\n'.format(
-                os.path.join(fill_ws, crt_exe_name)))
-        sys.exit()
-
-    # Fill files
-    fill_hru_casc_path = os.path.join(fill_ws, 'HRU_CASC.DAT')
-    fill_outflow_hru_path = os.path.join(fill_ws, 'OUTFLOW_HRU.DAT')
-    fill_land_elev_path = os.path.join(fill_ws, 'LAND_ELEV.DAT')
-    fill_xy_path = os.path.join(fill_ws, 'XY.DAT')
+    if crt_engine == 'EXE':
+        crt_exe_name = os.path.basename(crt_exe_path)
+        if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
+            shutil.copy(crt_exe_path, fill_ws)
+        if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
+            logging.error(
+                '\nERROR: CRT executable ({}) does not exist\n'.format(
+                    os.path.join(fill_ws, crt_exe_name)))
+            sys.exit()
 
     # Output names
     # dem_adj_raster_name = 'dem_adj'
@@ -249,101 +274,13 @@ def crt_fill_parameters(config_path):
             int(row[9]), int(row[4]), support.next_row_col(int(row[6]), cell),
             float(row[5]), 0, 0, 0]
 
-    # Build list of unique segments
-    iseg_list = sorted(list(set([v[1] for v in cell_dict.values()])))
-    print(iseg_list)
-
     # Calculate IREACH and OUTSEG
+    # Cells are grouped by segment once (instead of once per segment)
     logging.info('Calculate {} and {}'.format(
         hru.reach_field, hru.outseg_field))
-    outseg_dict = dict()
-    for iseg in sorted(iseg_list):
-        logging.debug('    Segment: {}'.format(iseg))
-
-        # Subset of cell_dict for current iseg
-        iseg_dict = dict([(k, v) for k, v in cell_dict.items() if v[1] == iseg])
-
-        # List of all cells in current iseg
-        iseg_cells = iseg_dict.keys()
-
-        # List of out_cells for all cells in current iseg
-        out_cells = [value[2] for value in iseg_dict.values()]
-
-        # Every iseg will (should?) have one out_cell
-        out_cell = list(set(out_cells) - set(iseg_cells))
-
-        # Process streams and lakes separately
-        # Streams
-        if iseg > 0:
-            # If there is more than one out_cell
-            #   there is a problem with the stream network
-            if len(out_cell) != 1:
-                logging.error(
-                    '\nERROR: ISEG {} has more than one out put cell'
-                    '\n  Out cells: {}'
-                    '\n  Check for streams exiting then re-entering a lake'
-                    '\n  Lake cell elevations may not be constant\n'.format(
-                        iseg, out_cell))
-                sys.exit()
-
-            # If not output cell, assume edge of domain
-            try:
-                outseg = cell_dict[out_cell[0]][1]
-            except KeyError:
-                outseg = exit_seg
-
-            # Track sub-basin outseg
-            outseg_dict[iseg] = outseg
-
-            # Calculate reach number for each cell
-            reach_dict = dict()
-            start_cell = list(set(iseg_cells) - set(out_cells))[0]
-            for i in range(len(out_cells)):
-                # logging.debug('    Reach: {}  Cell: {}'.format(i+1, start_cell))
-                reach_dict[start_cell] = i + 1
-                start_cell = iseg_dict[start_cell][2]
-            # For each cell in iseg, save outseg, reach, & maxreach
-            for iseg_cell in iseg_cells:
-                cell_dict[iseg_cell][4:] = [
-                    outseg, reach_dict[iseg_cell], len(iseg_cells)]
-            del reach_dict, start_cell
-        # Lakes
-        else:
-            # For lake cells, there can be multiple outlets if all of them
-            #   are to inactive cells or out of the model
-            # Otherwise, like streams, there should only be one outcell per iseg
-            logging.debug('  Length: {}'.format(len(out_cells)))
-            if len(out_cell) == 1:
-                try:
-                    outseg = cell_dict[out_cell[0]][1]
-                except KeyError:
-                    outseg = exit_seg
-            elif (len(out_cell) != 1 and
-                  all(x[0] not in cell_dict.keys() for x in out_cell)):
-                outseg = exit_seg
-                logging.debug(
-                    '  All out cells are inactive, setting outseg '
-                    'to exit_seg {}'.format(exit_seg))
-            else:
-                logging.error(
-                    '\nERROR: ISEG {} has more than one out put cell'
-                    '\n  Out cells: {}'
-                    '\n  Check for streams exiting then re-entering a lake'
-                    '\n  Lake cell elevations may not be constant\n'.format(
-                        iseg, out_cell))
-                raw_input('ENTER')
-
-            # Track sub-basin outseg
-            outseg_dict[iseg] = outseg
-
-            # For each lake segment cell, only save outseg
-            # All lake cells are routed directly to the outseg
-            for iseg_cell in iseg_cells:
-                cell_dict[iseg_cell][4:] = [outseg, 0, 0]
-            del outseg
-
-        del iseg_dict, iseg_cells, iseg
-        del out_cells, out_cell
+    seg_topo = support.SegmentTopology(cell_dict)
+    seg_topo.calc_outseg_reach(cell_dict, exit_seg)
+    del seg_topo
 
     # Saving ireach and outseg
     logging.info('Save {} and {}'.format(hru.reach_field, hru.outseg_field))
@@ -393,6 +330,100 @@ def crt_fill_parameters(config_path):
     # arcpy.RasterToASCII_conversion(hru_type_raster, hru_type_ascii)
     # arcpy.RasterToASCII_conversion(dem_adj_raster, dem_adj_ascii)
 
+    # All of the fields are read in a single pass (in fishnet order)
+    crt_field_dict = support.read_table_fields(hru.polygon_path, [
+        hru.id_field, hru.type_field, hru.outflow_field,
+        hru.row_field, hru.col_field, hru.dem_adj_field,
+        hru.x_field, hru.y_field])
+    crt_params = {
+        'HRUFLG': crt_hruflg, 'FLOWFLG': crt_flowflg,
+        'DPIT': crt_dpit, 'OUTITMAX': crt_outitmax}
+    if crt_engine == 'PYTHON':
+        crt_exe_name = None
+    crt_grid_dict = crt_fill_func(
+        hru, crt_field_dict, fill_ws, crt_engine, crt_params,
+        crt_exe_name, crt_cache_flag, crt_timeout)
+    del crt_field_dict
+
+    # Write CRT values to hru_polygon
+    logging.info('Writing CRT data to fishnet')
+    hru_table = support.HRUTable(hru, [
+        hru.row_field, hru.col_field, hru.crt_elev_field,
+        hru.crt_fill_field, hru.dem_adj_field])
+    row_array = hru_table[hru.row_field].astype(np.int64) - 1
+    col_array = hru_table[hru.col_field].astype(np.int64) - 1
+    crt_dem_array = crt_grid_dict[crt.CRT_DEM_SECTION][row_array, col_array]
+    crt_fill_array = crt_grid_dict[crt.CRT_FILL_SECTION][row_array, col_array]
+    del crt_grid_dict
+
+    # If DEM values are too large for CRT, they may be symbols that
+    #   will be skipped
+    update_mask = ~(
+        np.ma.getmaskarray(crt_dem_array) | np.ma.getmaskarray(crt_fill_array))
+    crt_dem_array = crt_dem_array.filled(0)
+    crt_fill_array = crt_fill_array.filled(0)
+    hru_table[hru.crt_elev_field] = np.where(
+        update_mask, crt_dem_array, hru_table[hru.crt_elev_field])
+    hru_table[hru.crt_fill_field] = np.where(
+        update_mask, crt_fill_array, hru_table[hru.crt_fill_field])
+    fill_mask = update_mask & (crt_fill_array > 0)
+    fill_count = int(np.sum(fill_mask))
+    logging.info('  Cells filled: {}'.format(fill_count))
+    logging.debug('  {:<4s} {:<4s} {:>7s}'.format('ROW', 'COL', 'FILL'))
+    for i in hru_table.cursor_index(fill_mask):
+        logging.debug('  {:>4d} {:>4d} {:>7.2f}'.format(
+            row_array[i] + 1, col_array[i] + 1, crt_fill_array[i]))
+    if use_crt_fill_flag:
+        hru_table[hru.dem_adj_field] = np.where(
+            fill_mask, crt_dem_array, hru_table[hru.dem_adj_field])
+    hru_table.flush()
+    del hru_table
+    return fill_count
+
+
+def crt_fill_func(hru, crt_field_dict, fill_ws, crt_engine, crt_params,
+                  crt_exe_name=None, crt_cache_flag=True, crt_timeout=0):
+    """Fill the land surface with CRT (or the NumPy cascade engine)
+
+    Parameters
+    ----------
+    hru : class
+        support.HRUParameters instance.
+    crt_field_dict : dict
+        HRU field arrays (in fishnet order) of the ID, TYPE, OUTFLOW,
+        ROW, COL, DEM_ADJ, X and Y fields.
+    fill_ws : str
+        CRT fill workspace (with the CRT executable).
+    crt_engine : str
+        'EXE' to run the CRT executable or 'PYTHON' to fill in process.
+    crt_params : dict
+        CRT HRUFLG, FLOWFLG, DPIT and OUTITMAX values.
+    crt_exe_name : str, optional
+        CRT executable file name (only used by the EXE engine).
+    crt_cache_flag : bool, optional
+        If True, reuse the CRT outputs if the inputs have not changed.
+    crt_timeout : float, optional
+        Maximum CRT run time in seconds (0 for no limit).
+
+    Returns
+    -------
+    dict: filled DEM and fill depth grids (masked arrays), keyed by the
+        crt.CRT_DEM_SECTION and crt.CRT_FILL_SECTION titles
+
+    """
+    # Intentionally not allowing user to change these values
+    crt_iprn = 1
+    fill_strmflg = 0
+    fill_visflg = 0
+    fill_ifill = 1
+    output_name = 'outputstat.txt'
+
+    # Fill files
+    fill_hru_casc_path = os.path.join(fill_ws, 'HRU_CASC.DAT')
+    fill_outflow_hru_path = os.path.join(fill_ws, 'OUTFLOW_HRU.DAT')
+    fill_land_elev_path = os.path.join(fill_ws, 'LAND_ELEV.DAT')
+    fill_xy_path = os.path.join(fill_ws, 'XY.DAT')
+
     logging.debug('\nRemoving existing CRT fill files')
     if os.path.isfile(fill_outflow_hru_path):
         os.remove(fill_outflow_hru_path)
@@ -405,30 +436,24 @@ def crt_fill_parameters(config_path):
 
     # Input parameters files for Cascade Routing Tool (CRT)
     logging.info('\nBuilding output CRT fill files')
+    row_array = crt_field_dict[hru.row_field].astype(np.int64)
+    col_array = crt_field_dict[hru.col_field].astype(np.int64)
+    hru_type_array = crt_field_dict[hru.type_field].astype(np.int64)
 
     # Generate OUTFLOW_HRU.DAT for CRT
     # Outflow cells exit the model to inactive cells or out of the domain
     #   Outflow field is set in dem_2_streams
     logging.info('  {}'.format(os.path.basename(fill_outflow_hru_path)))
-    outflow_hru_list = []
-    fields = [
-        hru.type_field, hru.outflow_field, hru.subbasin_field,
-        hru.row_field, hru.col_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        if int(row[0]) != 0 and int(row[1]) == 1:
-            outflow_hru_list.append([int(row[3]), int(row[4])])
-    if outflow_hru_list:
-        with open(fill_outflow_hru_path, 'w+') as f:
-            f.write('{}    NUMOUTFLOWHRU\n'.format(
-                len(outflow_hru_list)))
-            for i, outflow_hru in enumerate(outflow_hru_list):
-                f.write('{} {} {}   OUTFLOW_ID ROW COL\n'.format(
-                    i + 1, outflow_hru[0], outflow_hru[1]))
-        f.close()
+    outflow_mask = (
+        (hru_type_array != 0) & (crt_field_dict[hru.outflow_field] == 1))
+    if np.any(outflow_mask):
+        crt.write_outflow_hru(
+            fill_outflow_hru_path, row_array[outflow_mask],
+            col_array[outflow_mask])
     else:
         logging.error('\nERROR: No OUTFLOWHRU points, exiting')
         sys.exit()
-    del outflow_hru_list
+    del outflow_mask
 
     # # DEADBEEF - Old method for setting OUTFLOW_HRU.DAT
     # #   Only streams that flow to real gauges are used
@@ -456,29 +481,17 @@ def crt_fill_parameters(config_path):
 
     # Generate HRU_CASC.DAT for CRT from hru_polygon
     logging.info('  {}'.format(os.path.basename(fill_hru_casc_path)))
-    hru_type_dict = defaultdict(dict)
-    for row in sorted(arcpy.da.SearchCursor(
-            hru.polygon_path,
-            [hru.row_field, hru.col_field, hru.type_field, hru.dem_adj_field])):
-        # Calculate CRT fill for all non-lake and non-ocean (elev > 0) cells
-        # if row[3] > 0 and row[2] == 0:
-        #    hru_type_dict[int(row[0])][int(row[1])] = 1
-        # else: hru_type_dict[int(row[0])][int(row[1])] = row[2]
-        # Calculate CRT fill for all active cells
-        hru_type_dict[int(row[0])][int(row[1])] = row[2]
-    hru_casc_header = (
-        '{} {} {} {} {} {} {} {}     '
-        'HRUFLG STRMFLG FLOWFLG VISFLG IPRN IFILL DPIT OUTITMAX\n').format(
-            crt_hruflg, fill_strmflg, crt_flowflg, fill_visflg,
-            crt_iprn, fill_ifill, crt_dpit, crt_outitmax)
-    with open(fill_hru_casc_path, 'w+') as f:
-        f.write(hru_casc_header)
-        for row, col_data in sorted(hru_type_dict.items()):
-            f.write(
-                ' '.join([str(t) for c, t in sorted(col_data.items())]) +
-                '\n')
-    f.close()
-    del hru_casc_header, hru_type_dict
+    # Calculate CRT fill for all active cells
+    hru_casc_header = crt.hru_casc_header(
+        crt_params['HRUFLG'], fill_strmflg, crt_params['FLOWFLG'],
+        fill_visflg, crt_iprn, fill_ifill, crt_params['DPIT'],
+        crt_params['OUTITMAX'])
+    crt.write_hru_casc(
+        fill_hru_casc_path,
+        crt.grid_array(
+            row_array, col_array, hru_type_array, hru.rows, hru.cols),
+        hru_casc_header)
+    del hru_casc_header
     # # Generate HRU_CASC.DATA for CRT from raster/ascii
     # with open(hru_type_ascii, 'r') as f: ascii_data = f.readlines()
     # f.close()
@@ -496,20 +509,10 @@ def crt_fill_parameters(config_path):
 
     # Generate LAND_ELEV.DAT for CRT from hru_polygon
     logging.info('  {}'.format(os.path.basename(fill_land_elev_path)))
-    dem_adj_dict = defaultdict(dict)
-    for row in sorted(arcpy.da.SearchCursor(
-            hru.polygon_path, [hru.row_field, hru.col_field, hru.dem_adj_field])):
-        dem_adj_dict[int(row[0])][int(row[1])] = row[2]
-    with open(fill_land_elev_path, 'w+') as f:
-        row_first = dem_adj_dict.keys()[0]
-        f.write('{} {}       NROW NCOL\n'.format(
-            len(dem_adj_dict.keys()), len(dem_adj_dict[row_first])))
-        for row, col_data in sorted(dem_adj_dict.items()):
-            f.write(
-                ' '.join(['{:10.6f}'.format(t) for c, t in sorted(col_data.items())]) +
-                '\n')
-    f.close()
-    del dem_adj_dict
+    dem_adj_grid = crt.grid_array(
+        row_array, col_array, crt_field_dict[hru.dem_adj_field],
+        hru.rows, hru.cols, dtype=np.float64)
+    crt.write_land_elev(fill_land_elev_path, dem_adj_grid)
     # # Generate LAND_ELEV.DAT for CRT from raster/ascii
     # logging.info('  {}'.format(os.path.basename(fill_land_elev_path)))
     # with open(dem_adj_ascii, 'r') as f: ascii_data = f.readlines()
@@ -523,85 +526,75 @@ def crt_fill_parameters(config_path):
 
     # Generate XY.DAT for CRT
     logging.info('  {}'.format(os.path.basename(fill_xy_path)))
-    xy_list = [
-        map(int, row)
-        for row in sorted(arcpy.da.SearchCursor(
-            hru.polygon_path, [hru.id_field, hru.x_field, hru.y_field]))]
-    with open(fill_xy_path, 'w+') as f:
-        for line in sorted(xy_list):
-            f.write(' '.join(map(str, line)) + '\n')
-    f.close()
-    del xy_list
-
-    # Run CRT
-    logging.info('\nRunning CRT')
-    subprocess.check_output(crt_exe_name, cwd=fill_ws, shell=True)
-
-    # Read in outputstat.txt and get filled DEM
-    logging.info('\nReading CRT {}'.format(output_name))
-    output_path = os.path.join(fill_ws, output_name)
-    with open(output_path, 'r') as f:
-        output_data = [l.strip() for l in f.readlines()]
-    f.close()
-
-    # Determine where filled data is in the file
-    try:
-        crt_dem_i = output_data.index(
-            'CRT FILLED LAND SURFACE MODEL USED TO GENERATE CASCADES')
-        crt_fill_i = output_data.index(
-            'DIFFERENCES BETWEEN FILLED AND UNFILLED LAND SURFACE MODELS')
-    except ValueError:
+    crt.write_xy(
+        fill_xy_path, crt_field_dict[hru.id_field],
+        crt_field_dict[hru.x_field], crt_field_dict[hru.y_field])
+
+    if crt_engine == 'PYTHON':
+        # Fill the land surface in process (no stream cells, like STRMFLG 0)
+        logging.info('\nFilling land surface')
+        outflow_grid = crt.grid_array(
+            row_array, col_array, crt_field_dict[hru.outflow_field],
+            hru.rows, hru.cols) == 1
+        hru_type_grid = crt.grid_array(
+            row_array, col_array, hru_type_array, hru.rows, hru.cols)
+        empty_array = np.zeros(0, dtype=np.int64)
+        cascade_dict = cascade.cascade_routing(
+            hru_type_grid, dem_adj_grid, empty_array, empty_array,
+            empty_array, outflow_grid, hruflg=crt_params['HRUFLG'],
+            flowflg=crt_params['FLOWFLG'], dpit=crt_params['DPIT'],
+            outitmax=crt_params['OUTITMAX'])
+        if cascade_dict['swale_count']:
+            logging.warning(
+                '  {} HRUs could not be filled to an outlet'.format(
+                    cascade_dict['swale_count']))
+        crt_grid_dict = {
+            crt.CRT_DEM_SECTION: np.ma.masked_invalid(cascade_dict['elev']),
+            crt.CRT_FILL_SECTION: np.ma.masked_invalid(cascade_dict['fill'])}
+        del cascade_dict, outflow_grid, hru_type_grid, empty_array
+    del row_array, col_array, hru_type_array, dem_adj_grid
+
+    if crt_engine == 'EXE':
+        # Run CRT
+        logging.info('\nRunning CRT')
+        # Outputs are restored from the cache if the inputs haven't changed
+        if crt_cache_flag:
+            crt_cache_params = crt_params
+        else:
+            crt_cache_params = None
+        crt_result = crt.run_crt_jobs(
+            crt_exe_name, [fill_ws], timeout=crt_timeout or None,
+            output_name=output_name, cache_params=crt_cache_params)[fill_ws]
+        if crt_result['timeout']:
+            logging.error(
+                '\nERROR: CRT did not finish in {} seconds\n'.format(
+                    crt_timeout))
+            sys.exit()
+        elif crt_result['returncode'] != 0:
+            logging.error(
+                '\nERROR: CRT exited with return code {}\n'
+                '  Check the CRT crt_stderr.txt file\n  {}\n'.format(
+                    crt_result['returncode'],
+                    os.path.join(fill_ws, 'crt_stderr.txt')))
+            sys.exit()
+        del crt_result
+
+        # Read in outputstat.txt and get filled DEM
+        logging.info('\nReading CRT {}'.format(output_name))
+        output_path = os.path.join(fill_ws, output_name)
+        crt_grid_dict = crt.read_outputstat_grids(
+            output_path, hru.rows, hru.cols,
+            [crt.CRT_DEM_SECTION, crt.CRT_FILL_SECTION])
+    if (crt.CRT_DEM_SECTION not in crt_grid_dict or
+            crt.CRT_FILL_SECTION not in crt_grid_dict):
         logging.error(
             '\nERROR: CRT didn\'t completely run\n'
             '  Check the CRT outputstat.txt file\n')
         sys.exit()
-
-    logging.info('  Break indices: {}, {}'.format(
-        crt_dem_i, crt_fill_i))
-    crt_dem_data = [
-        r.split() for r in output_data[crt_dem_i+1: crt_dem_i+hru.rows+1]]
-    crt_fill_data = [
-        r.split() for r in output_data[crt_fill_i+1: crt_fill_i+hru.rows+1]]
     logging.info('  ROWS/COLS: {}/{}'.format(
-        len(crt_dem_data), len(crt_dem_data[0])))
-    logging.info('  ROWS/COLS: {}/{}'.format(
-        len(crt_fill_data), len(crt_fill_data[0])))
-
-    #   crt_type_i = crt_fill_i + (crt_fill_i - crt_dem_i)
-
-    #    crt_dem_data = [
-    #        r.split() for r in output_data[crt_dem_i+1: crt_dem_i+hru.rows+1]]
-    #    crt_fill_data = [
-    #        r.split() for r in output_data[crt_fill_i+1: crt_type_i-1]]
+        *crt_grid_dict[crt.CRT_DEM_SECTION].shape))
+    return crt_grid_dict
 
-    # Build dictionaries of the CRT data
-    crt_dem_dict = defaultdict(dict)
-    crt_fill_dict = defaultdict(dict)
-    for i, r in enumerate(crt_dem_data):
-        crt_dem_dict[i + 1] = dict(
-            [(j + 1, c) for j, c in enumerate(crt_dem_data[i])])
-    for i, r in enumerate(crt_fill_data):
-        crt_fill_dict[i + 1] = dict(
-            [(j + 1, c) for j, c in enumerate(crt_fill_data[i])])
-
-    # Write CRT values to hru_polygon
-    logging.info('Writing CRT data to fishnet')
-    logging.debug('  {:<4s} {:<4s} {:>7s}'.format('ROW', 'COL', 'FILL'))
-    fields = [
-        hru.row_field, hru.col_field, hru.crt_elev_field, hru.crt_fill_field,
-        hru.dem_adj_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            # If DEM values are too large for CRT, they may be symbols that will be skipped
-            if support.is_number(crt_dem_dict[int(row[0])][int(row[1])]):
-                row[2] = float(crt_dem_dict[int(row[0])][int(row[1])])
-                row[3] = float(crt_fill_dict[int(row[0])][int(row[1])])
-                if float(row[3]) > 0:
-                    logging.debug('  {:>4d} {:>4d} {:>7.2f}'.format(
-                        row[0], row[1], float(row[3])))
-                if use_crt_fill_flag and float(row[3]) > 0:
-                    row[4] = row[2]
-                update_c.updateRow(row)
 
 
 def cell_distance(cell_a, cell_b, cs):
@@ -0,0 +1,522 @@
+#--------------------------------
+# Name:         crt_functions.py
+# Purpose:      Cascade Routing Tool (CRT) input file functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+
+# CRT input files (hashed for the cache key)
+CRT_INPUT_NAMES = [
+    'HRU_CASC.DAT', 'LAND_ELEV.DAT', 'STREAM_CELLS.DAT',
+    'OUTFLOW_HRU.DAT', 'XY.DAT']
+# outputstat.txt sections with the filled DEM and the fill depths
+CRT_DEM_SECTION = 'CRT FILLED LAND SURFACE MODEL USED TO GENERATE CASCADES'
+CRT_FILL_SECTION = (
+    'DIFFERENCES BETWEEN FILLED AND UNFILLED LAND SURFACE MODELS')
+# CRT output files that are saved in (and restored from) the cache
+CRT_OUTPUT_NAMES = [
+    'outputstat.txt', 'cascade.param', 'groundwater_cascade.param',
+    'parameter_dimensions.txt']
+
+
+def grid_array(row_array, col_array, value_array, rows, cols,
+               fill_value=0, dtype=None):
+    """Build a model grid array from HRU row/col indexed values
+
+    Args:
+        row_array (np.array): HRU row indices (1 based)
+        col_array (np.array): HRU column indices (1 based)
+        value_array (np.array): HRU values
+        rows (int): Number of rows in the model grid
+        cols (int): Number of columns in the model grid
+        fill_value: Value for cells without an HRU
+        dtype: Output dtype (defaults to the dtype of value_array)
+
+    Returns:
+        np.array
+    """
+    value_array = np.asarray(value_array)
+    if dtype is None:
+        dtype = value_array.dtype
+    output_array = np.empty((rows, cols), dtype=dtype)
+    output_array.fill(fill_value)
+    output_array[
+        np.asarray(row_array, dtype=np.int64) - 1,
+        np.asarray(col_array, dtype=np.int64) - 1] = value_array
+    return output_array
+
+
+def write_table(output_f, value_list, value_fmt):
+    """Write columns of values with a single formatting operation
+
+    Args:
+        output_f: Open file object
+        value_list (list): Column arrays (all the same length)
+        value_fmt (str): % style format string of a single line
+            (including the line ending)
+
+    Returns:
+        None
+    """
+    if not len(value_list) or not len(value_list[0]):
+        return
+    line_count = len(value_list[0])
+    value_array = np.column_stack([np.asarray(v) for v in value_list])
+    if value_array.dtype.kind in 'iub':
+        value_array = value_array.astype(np.int64)
+    output_f.write(
+        (value_fmt * line_count) % tuple(value_array.ravel().tolist()))
+
+
+def write_grid(output_f, input_array, value_fmt):
+    """Write a 2D array as space delimited rows (one line per row)
+
+    Args:
+        output_f: Open file object
+        input_array (np.array): Model grid values
+        value_fmt (str): % style format string of a single value
+
+    Returns:
+        None
+    """
+    rows, cols = input_array.shape
+    line_fmt = ' '.join([value_fmt] * cols) + '\n'
+    # Write in blocks of rows so that the formatted string stays small
+    block_rows = max(1, 1000000 // max(cols, 1))
+    for row_i in range(0, rows, block_rows):
+        block_array = input_array[row_i:row_i + block_rows]
+        output_f.write((line_fmt * block_array.shape[0]) % tuple(
+            block_array.ravel().tolist()))
+
+
+def hru_casc_header(hruflg, strmflg, flowflg, visflg, iprn, ifill, dpit,
+                    outitmax):
+    """First line of HRU_CASC.DAT"""
+    return (
+        '{} {} {} {} {} {} {} {}     '
+        'HRUFLG STRMFLG FLOWFLG VISFLG IPRN IFILL DPIT OUTITMAX\n').format(
+            hruflg, strmflg, flowflg, visflg, iprn, ifill, dpit, outitmax)
+
+
+def write_hru_casc(output_path, hru_type_array, header):
+    """Write the CRT HRU_CASC.DAT file
+
+    Args:
+        output_path (str): File path of HRU_CASC.DAT
+        hru_type_array (np.array): Model grid of HRU_TYPE values
+        header (str): First line of the file (see hru_casc_header())
+
+    Returns:
+        None
+    """
+    logging.debug('    Writing {}'.format(output_path))
+    with open(output_path, 'w') as output_f:
+        output_f.write(header)
+        write_grid(output_f, hru_type_array.astype(np.int64), '%d')
+
+
+def write_land_elev(output_path, elev_array, value_fmt='%10.6f'):
+    """Write the CRT LAND_ELEV.DAT file
+
+    Args:
+        output_path (str): File path of LAND_ELEV.DAT
+        elev_array (np.array): Model grid of the land surface elevations
+        value_fmt (str): % style format string of a single elevation
+
+    Returns:
+        None
+    """
+    logging.debug('    Writing {}'.format(output_path))
+    with open(output_path, 'w') as output_f:
+        output_f.write('{} {}       NROW NCOL\n'.format(*elev_array.shape))
+        write_grid(output_f, elev_array.astype(np.float64), value_fmt)
+
+
+def write_stream_cells(output_path, row_array, col_array, iseg_array,
+                       reach_array):
+    """Write the CRT STREAM_CELLS.DAT file
+
+    Stream cells are sorted by row, column, segment and reach.
+
+    Args:
+        output_path (str): File path of STREAM_CELLS.DAT
+        row_array (np.array): Stream cell rows
+        col_array (np.array): Stream cell columns
+        iseg_array (np.array): Stream cell segment IDs
+        reach_array (np.array): Stream cell reach IDs
+
+    Returns:
+        int: Number of stream cells (NREACH)
+    """
+    logging.debug('    Writing {}'.format(output_path))
+    sort_i = np.lexsort((reach_array, iseg_array, col_array, row_array))
+    value_list = [
+        np.asarray(row_array)[sort_i], np.asarray(col_array)[sort_i],
+        np.asarray(iseg_array)[sort_i], np.asarray(reach_array)[sort_i],
+        np.ones(sort_i.size, dtype=np.int64)]
+    with open(output_path, 'w') as output_f:
+        output_f.write('{}    NREACH\n'.format(sort_i.size))
+        write_table(output_f, value_list, '%d %d %d %d %d\n')
+    return sort_i.size
+
+
+def write_outflow_hru(output_path, row_array, col_array):
+    """Write the CRT OUTFLOW_HRU.DAT file
+
+    Args:
+        output_path (str): File path of OUTFLOW_HRU.DAT
+        row_array (np.array): Outflow HRU rows
+        col_array (np.array): Outflow HRU columns
+
+    Returns:
+        int: Number of outflow HRUs (NUMOUTFLOWHRU)
+    """
+    logging.debug('    Writing {}'.format(output_path))
+    outflow_count = len(row_array)
+    with open(output_path, 'w') as output_f:
+        output_f.write('{}    NUMOUTFLOWHRU\n'.format(outflow_count))
+        write_table(
+            output_f,
+            [np.arange(1, outflow_count + 1), row_array, col_array],
+            '%d %d %d   OUTFLOW_ID ROW COL\n')
+    return outflow_count
+
+
+def write_xy(output_path, hru_id_array, x_array, y_array):
+    """Write the CRT XY.DAT file
+
+    Args:
+        output_path (str): File path of XY.DAT
+        hru_id_array (np.array): HRU IDs
+        x_array (np.array): HRU X coordinates (written as integers)
+        y_array (np.array): HRU Y coordinates (written as integers)
+
+    Returns:
+        None
+    """
+    logging.debug('    Writing {}'.format(output_path))
+    sort_i = np.argsort(hru_id_array, kind='mergesort')
+    value_list = [
+        np.asarray(hru_id_array)[sort_i],
+        np.asarray(x_array).astype(np.int64)[sort_i],
+        np.asarray(y_array).astype(np.int64)[sort_i]]
+    with open(output_path, 'w') as output_f:
+        write_table(output_f, value_list, '%d %d %d\n')
+
+
+def outputstat_status(output_path):
+    """Check the status of a CRT run from the outputstat.txt file
+
+    Args:
+        output_path (str): File path of outputstat.txt
+
+    Returns:
+        str: 'COMPLETE', 'SWALE' (undeclared swale HRUs), 'INCOMPLETE',
+            or 'MISSING' if the file doesn't exist
+    """
+    if not os.path.isfile(output_path):
+        return 'MISSING'
+    status = 'INCOMPLETE'
+    with open(output_path, 'r') as input_f:
+        for line in input_f:
+            line = line.strip()
+            if line == 'CRT FOUND UNDECLARED SWALE HRUS':
+                return 'SWALE'
+            elif line == 'CRT EXECUTION COMPLETE':
+                status = 'COMPLETE'
+    return status
+
+
+def decode_grid_values(token_list, rows, cols):
+    """Convert outputstat.txt values to a masked float array
+
+    CRT writes values that don't fit the Fortran field width as symbols
+    (i.e. '*****'), these values are masked.
+
+    Args:
+        token_list (list): Value strings in row major order
+        rows (int): Number of rows in the model grid
+        cols (int): Number of columns in the model grid
+
+    Returns:
+        np.ma.MaskedArray: float64 array with shape (rows, cols)
+    """
+    token_array = np.array(token_list)
+    try:
+        value_array = token_array.astype(np.float64)
+        value_mask = np.zeros(value_array.shape, dtype=np.bool)
+    except ValueError:
+        value_mask = np.array(
+            [not is_number(token) for token in token_list], dtype=np.bool)
+        token_array[value_mask] = 'nan'
+        value_array = token_array.astype(np.float64)
+    return np.ma.masked_array(
+        value_array.reshape(rows, cols), mask=value_mask.reshape(rows, cols))
+
+
+def read_outputstat_grids(output_path, rows, cols, section_list=None):
+    """Read model grid sections from a CRT outputstat.txt file
+
+    The file is scanned once and only the values of the requested
+    sections are kept.  The values of a section start on the line after
+    the section title and are read until rows * cols values are found.
+
+    Args:
+        output_path (str): File path of outputstat.txt
+        rows (int): Number of rows in the model grid
+        cols (int): Number of columns in the model grid
+        section_list (list): Section titles
+            (the default is the filled DEM and fill depth sections)
+
+    Returns:
+        dict: Section title and np.ma.MaskedArray (see decode_grid_values())
+            Sections that are missing or incomplete are not included.
+    """
+    if section_list is None:
+        section_list = [CRT_DEM_SECTION, CRT_FILL_SECTION]
+    cell_count = rows * cols
+    grid_dict = dict()
+    section = None
+    with open(output_path, 'r') as input_f:
+        for line in input_f:
+            # A new section title also ends an incomplete section
+            title = line.strip()
+            if title in section_list and title not in grid_dict:
+                section = title
+                token_list = []
+                continue
+            elif section is None:
+                continue
+            token_list.extend(title.split())
+            if len(token_list) < cell_count:
+                continue
+            grid_dict[section] = decode_grid_values(
+                token_list[:cell_count], rows, cols)
+            section = None
+            if len(grid_dict) == len(section_list):
+                break
+    return grid_dict
+
+
+def is_number(s):
+    """Check if a string can be converted to a float"""
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+
+def crt_cache_key(crt_ws, crt_exe_name, cache_params):
+    """Hash of the CRT input files, header flags and executable
+
+    Args:
+        crt_ws (str): CRT folder
+        crt_exe_name (str): File name of the CRT executable
+        cache_params (dict): CRT parameters (i.e. HRUFLG, FLOWFLG, DPIT,
+            OUTITMAX) that are included in the key
+
+    Returns:
+        str
+    """
+    key_md5 = hashlib.md5()
+    for input_name in CRT_INPUT_NAMES:
+        key_md5.update(input_name)
+        input_path = os.path.join(crt_ws, input_name)
+        if not os.path.isfile(input_path):
+            key_md5.update('MISSING')
+            continue
+        with open(input_path, 'rb') as input_f:
+            for block in iter(lambda: input_f.read(1 << 20), b''):
+                key_md5.update(block)
+    for param_name, param_value in sorted(cache_params.items()):
+        key_md5.update('{}={!r}'.format(param_name.upper(), param_value))
+    # A different CRT version could give different results
+    exe_path = os.path.join(crt_ws, crt_exe_name)
+    key_md5.update('{} {}'.format(
+        crt_exe_name, os.path.getsize(exe_path)
+        if os.path.isfile(exe_path) else 0))
+    return key_md5.hexdigest()[:16]
+
+
+def crt_cache_ws(crt_ws):
+    """Folder of the CRT output cache"""
+    return os.path.join(crt_ws, 'crt_cache')
+
+
+def restore_crt_cache(crt_ws, cache_key):
+    """Copy cached CRT outputs back to the CRT folder
+
+    Args:
+        crt_ws (str): CRT folder
+        cache_key (str): Cache key (see crt_cache_key())
+
+    Returns:
+        bool: True if the outputs were restored
+    """
+    key_ws = os.path.join(crt_cache_ws(crt_ws), cache_key)
+    if not os.path.isfile(os.path.join(key_ws, CRT_OUTPUT_NAMES[0])):
+        return False
+    for output_name in CRT_OUTPUT_NAMES:
+        output_path = os.path.join(crt_ws, output_name)
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+        if os.path.isfile(os.path.join(key_ws, output_name)):
+            shutil.copy(os.path.join(key_ws, output_name), output_path)
+    # Update the folder time so that recently used outputs are kept
+    os.utime(key_ws, None)
+    return True
+
+
+def save_crt_cache(crt_ws, cache_key, cache_limit=10):
+    """Save the CRT outputs to the cache
+
+    Only the most recently used cache_limit outputs are kept.
+
+    Args:
+        crt_ws (str): CRT folder
+        cache_key (str): Cache key (see crt_cache_key())
+        cache_limit (int): Maximum number of cached outputs
+
+    Returns:
+        None
+    """
+    cache_ws = crt_cache_ws(crt_ws)
+    key_ws = os.path.join(cache_ws, cache_key)
+    # Files are copied to a temporary folder first so that an incomplete
+    #   copy is never used
+    temp_ws = key_ws + '_temp'
+    if os.path.isdir(temp_ws):
+        shutil.rmtree(temp_ws)
+    os.makedirs(temp_ws)
+    for output_name in CRT_OUTPUT_NAMES:
+        output_path = os.path.join(crt_ws, output_name)
+        if os.path.isfile(output_path):
+            shutil.copy(output_path, os.path.join(temp_ws, output_name))
+    if os.path.isdir(key_ws):
+        shutil.rmtree(key_ws)
+    os.rename(temp_ws, key_ws)
+
+    key_ws_list = sorted(
+        [os.path.join(cache_ws, item) for item in os.listdir(cache_ws)],
+        key=os.path.getmtime, reverse=True)
+    for old_ws in key_ws_list[cache_limit:]:
+        logging.debug('  Removing cached CRT outputs: {}'.format(old_ws))
+        shutil.rmtree(old_ws)
+
+
+def run_crt_jobs(crt_exe_name, crt_ws_list, timeout=None, poll_seconds=0.5,
+                 output_name='outputstat.txt', cache_params=None):
+    """Run CRT in several folders at the same time
+
+    The CRT executable must already be in each folder.  The output of
+    each run is captured to crt_stdout.txt and crt_stderr.txt in the
+    folder (files are used instead of pipes so that a run can't block on
+    a full pipe buffer) and outputstat.txt is checked as each run
+    finishes.
+
+    Args:
+        crt_exe_name (str): File name of the CRT executable
+        crt_ws_list (list): CRT folders (one run per folder)
+        timeout (float): Maximum run time in seconds for each run
+            (runs are killed after the timeout), None for no limit
+        poll_seconds (float): Seconds between checks of the runs
+        output_name (str): File name of the CRT output statistics file
+        cache_params (dict): CRT parameters for the cache key, if set the
+            outputs of a previous run with the same inputs are restored
+            instead of running CRT (see crt_cache_key())
+
+    Returns:
+        dict: CRT folder and a dictionary of the run results
+            (returncode, timeout, seconds, stdout, stderr, status, cached)
+    """
+    job_dict = dict()
+    result_dict = dict()
+    key_dict = dict()
+    for crt_ws in crt_ws_list:
+        if cache_params is not None:
+            key_dict[crt_ws] = crt_cache_key(
+                crt_ws, crt_exe_name, cache_params)
+            if restore_crt_cache(crt_ws, key_dict[crt_ws]):
+                result_dict[crt_ws] = {
+                    'returncode': 0, 'timeout': False, 'seconds': 0,
+                    'stdout': '', 'stderr': '', 'cached': True,
+                    'status': outputstat_status(
+                        os.path.join(crt_ws, output_name))}
+                logging.info(
+                    '  CRT inputs are unchanged, using cached outputs '
+                    '({})\n    {}'.format(key_dict[crt_ws], crt_ws))
+                continue
+
+        # Remove old outputs so they can't be mistaken for (or cached as)
+        #   the outputs of this run
+        for old_name in set([output_name] + CRT_OUTPUT_NAMES):
+            old_path = os.path.join(crt_ws, old_name)
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+        stdout_path = os.path.join(crt_ws, 'crt_stdout.txt')
+        stderr_path = os.path.join(crt_ws, 'crt_stderr.txt')
+        stdout_f = open(stdout_path, 'w')
+        stderr_f = open(stderr_path, 'w')
+        logging.debug('  Starting CRT: {}'.format(crt_ws))
+        job_dict[crt_ws] = {
+            'process': subprocess.Popen(
+                [os.path.join(crt_ws, crt_exe_name)], cwd=crt_ws,
+                stdout=stdout_f, stderr=stderr_f),
+            'files': [stdout_f, stderr_f],
+            'paths': [stdout_path, stderr_path],
+            'start': time.time()}
+
+    while job_dict:
+        for crt_ws, job in sorted(job_dict.items()):
+            seconds = time.time() - job['start']
+            returncode = job['process'].poll()
+            timeout_flag = False
+            if returncode is None:
+                if timeout is None or seconds < timeout:
+                    continue
+                logging.warning(
+                    '  CRT did not finish in {} seconds, stopping\n'
+                    '    {}'.format(timeout, crt_ws))
+                job['process'].kill()
+                returncode = job['process'].wait()
+                timeout_flag = True
+
+            for output_f in job['files']:
+                output_f.close()
+            output_list = []
+            for output_path in job['paths']:
+                with open(output_path, 'r') as output_f:
+                    output_list.append(output_f.read())
+            result_dict[crt_ws] = {
+                'returncode': returncode,
+                'timeout': timeout_flag,
+                'seconds': seconds,
+                'stdout': output_list[0],
+                'stderr': output_list[1],
+                'cached': False,
+                'status': outputstat_status(
+                    os.path.join(crt_ws, output_name))}
+            if (crt_ws in key_dict and not timeout_flag and
+                    returncode == 0 and
+                    result_dict[crt_ws]['status'] == 'COMPLETE'):
+                save_crt_cache(crt_ws, key_dict[crt_ws])
+            logging.info(
+                '  CRT finished in {:.1f} seconds ({})\n    {}'.format(
+                    seconds, result_dict[crt_ws]['status'], crt_ws))
+            if output_list[1].strip():
+                logging.debug('  CRT stderr:\n{}'.format(output_list[1]))
+            del job_dict[crt_ws]
+        if job_dict:
+            time.sleep(poll_seconds)
+    return result_dict
@@ -77,13 +77,16 @@ def daymet_parameters(config_path, data_name='PPT'):
         logging.error(
             '\nERROR: DAYMET folder ({}) does not exist'.format(daymet_ws))
         sys.exit()
-    proj_method_list = ['BILINEAR', 'CUBIC', 'NEAREST']
+    proj_method_list = ['BILINEAR', 'CUBIC', 'NEAREST', 'WEIGHTS']
     if daymet_proj_method.upper() not in proj_method_list:
         logging.error('\nERROR: DAYMET projection method must be: {}'.format(
             ', '.join(proj_method_list)))
         sys.exit()
     logging.debug('  Projection method:    {}'.format(
         daymet_proj_method.upper()))
+    # WEIGHTS averages the native rasters with a sparse HRU weight matrix
+    #   instead of projecting each raster (prism_cellsize is not used)
+    weights_flag = daymet_proj_method.upper() == 'WEIGHTS'
 
     # Check other inputs
     if daymet_cs <= 0:
@@ -175,6 +178,13 @@ def daymet_parameters(config_path, data_name='PPT'):
                 data_name.lower(), month)
             output_raster = os.path.join(output_ws, output_name)
 
+            zs_field = '{}_{}'.format(data_name, month)
+            if weights_flag:
+                # Native DAYMET rasters are averaged after the loop
+                zs_daymet_dict[zs_field] = [input_raster, 'MEAN']
+                del input_raster, output_raster, output_name, zs_field
+                continue
+
             # Set preferred transforms
             input_sr = arcpy.sa.Raster(input_raster).spatialReference
             transform_str = support.transform_func(hru.sr, input_sr)
@@ -194,7 +204,6 @@ def daymet_parameters(config_path, data_name='PPT'):
             #    input_sr)
 
             # Save parameters for calculating zonal stats
-            zs_field = '{}_{}'.format(data_name, month)
             zs_daymet_dict[zs_field] = [output_raster, 'MEAN']
 
             # Cleanup
@@ -205,9 +214,13 @@ def daymet_parameters(config_path, data_name='PPT'):
         # arcpy.ClearEnvironment('extent')
 
         # Calculate zonal statistics
-        logging.info('\nCalculating DAYMET zonal statistics')
-        support.zonal_stats_func(
-            zs_daymet_dict, hru.polygon_path, hru.point_path, hru)
+        if weights_flag:
+            logging.info('\nCalculating DAYMET weighted statistics')
+            support.weighted_stats_func(zs_daymet_dict, hru)
+        else:
+            logging.info('\nCalculating DAYMET zonal statistics')
+            support.zonal_stats_func(
+                zs_daymet_dict, hru.polygon_path, hru.point_path, hru)
         del zs_daymet_dict
 
     # # Jensen-Haise Potential ET air temperature coefficient
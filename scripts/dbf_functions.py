@@ -0,0 +1,283 @@
+#--------------------------------
+# Name:         dbf_functions.py
+# Purpose:      Memory-mapped shapefile attribute table (.dbf) functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import logging
+import os
+import struct
+
+import numpy as np
+
+
+class DBFHeader():
+    """dBASE (shapefile attribute table) header
+
+    Args:
+        dbf_path (str): File path of the .dbf (or .shp) file
+
+    Attributes:
+        records (int): Number of records (including deleted records)
+        header_length (int): Byte offset of the first record
+        record_length (int): Bytes per record (including deletion flag)
+        fields (list): Field tuples (name, type, length, decimals, offset)
+
+    """
+
+    def __init__(self, dbf_path):
+        self.dbf_path = dbf_file_path(dbf_path)
+        with open(self.dbf_path, 'rb') as f:
+            header = f.read(32)
+            if len(header) < 32:
+                raise ValueError('Invalid DBF header: {}'.format(
+                    self.dbf_path))
+            self.records, self.header_length, self.record_length = \
+                struct.unpack('<IHH', header[4:12])
+
+            # Field descriptors are 32 bytes and end with 0x0D
+            # The first byte of each record is the deletion flag
+            self.fields = []
+            offset = 1
+            while True:
+                descriptor = f.read(32)
+                if not descriptor or descriptor[:1] in [b'\r', b'']:
+                    break
+                name = descriptor[:11].split(b'\x00')[0].strip()
+                name = str(name.decode('ascii'))
+                field_type = descriptor[11:12].decode('ascii').upper()
+                length = ord(descriptor[16:17])
+                decimals = ord(descriptor[17:18])
+                self.fields.append((name, field_type, length, decimals, offset))
+                offset += length
+        if offset != self.record_length:
+            raise ValueError(
+                'DBF field lengths ({}) do not match the record '
+                'length ({}): {}'.format(
+                    offset, self.record_length, self.dbf_path))
+
+    def field(self, field_name):
+        """Field tuple (name, type, length, decimals, offset)
+
+        Field names are not case sensitive (like ArcGIS)
+        """
+        for field in self.fields:
+            if field[0].upper() == field_name.upper():
+                return field
+        raise KeyError('Field {} does not exist in {}'.format(
+            field_name, self.dbf_path))
+
+    def dtype(self):
+        """Structured dtype of a record (each field is a byte string)"""
+        return np.dtype({
+            'names': ['DELETED'] + [f[0] for f in self.fields],
+            'formats': ['S1'] + ['S{}'.format(f[2]) for f in self.fields],
+            'offsets': [0] + [f[4] for f in self.fields],
+            'itemsize': self.record_length})
+
+
+def dbf_file_path(input_path):
+    """Path of the .dbf file for a shapefile (or .dbf) path"""
+    return os.path.splitext(input_path)[0] + '.dbf'
+
+
+def is_dbf_table(input_path):
+    """Check if a table can be read with the DBF functions
+
+    Only shapefiles and .dbf files are supported
+    """
+    return (
+        os.path.splitext(input_path)[1].lower() in ['.shp', '.dbf'] and
+        os.path.isfile(dbf_file_path(input_path)))
+
+
+def dbf_memmap(input_path, mode='r'):
+    """Memory-mapped view of the DBF records
+
+    Args:
+        input_path (str): File path of the .dbf (or .shp) file
+        mode (str): np.memmap mode ('r' or 'r+')
+
+    Returns:
+        tuple: DBFHeader and np.memmap with a structured dtype
+            (one byte string field per DBF field)
+    """
+    header = DBFHeader(input_path)
+    if header.records == 0:
+        return header, np.zeros(0, dtype=header.dtype())
+    return header, np.memmap(
+        header.dbf_path, dtype=header.dtype(), mode=mode,
+        offset=header.header_length, shape=(header.records,))
+
+
+def decode_dbf_field(text_array, field, null_value=0):
+    """Convert fixed width DBF text values to a NumPy array
+
+    Args:
+        text_array (np.array): Byte string values of a single field
+        field (tuple): Field tuple from DBFHeader.field()
+        null_value: Value for blank/null numeric values
+
+    Returns:
+        np.array
+    """
+    name, field_type, length, decimals = field[:4]
+    if field_type in ['N', 'F']:
+        text_array = np.char.strip(np.asarray(text_array))
+        # Blank and overflow ('*') values are null
+        null_mask = (text_array == b'') | (np.char.count(text_array, b'*') > 0)
+        if np.any(null_mask):
+            text_array = np.where(null_mask, b'0', text_array)
+        if decimals == 0 and field_type == 'N' and length < 16:
+            value_array = text_array.astype(np.float64).astype(np.int64)
+        else:
+            value_array = text_array.astype(np.float64)
+        if np.any(null_mask):
+            value_array[null_mask] = null_value
+        return value_array
+    elif field_type == 'L':
+        return np.in1d(
+            np.char.upper(np.asarray(text_array)), [b'T', b'Y'])
+    else:
+        # Character (C) and date (D) fields are returned as byte strings
+        return np.char.strip(np.asarray(text_array))
+
+
+def read_dbf_fields(input_path, fields, null_value=0):
+    """Read fields from a DBF file in a single pass
+
+    Deleted records are skipped so that the values are in the same order
+        as an arcpy.da.SearchCursor
+
+    Args:
+        input_path (str): File path of the .dbf (or .shp) file
+        fields (list): Field names
+        null_value: Value for blank/null numeric values
+
+    Returns:
+        dict: Field name and NumPy array
+    """
+    header, dbf_array = dbf_memmap(input_path, mode='r')
+    active_mask = dbf_array['DELETED'] != b'*'
+    field_dict = dict()
+    for field_name in fields:
+        field = header.field(field_name)
+        text_array = dbf_array[field[0]]
+        if not np.all(active_mask):
+            text_array = text_array[active_mask]
+        field_dict[field_name] = decode_dbf_field(
+            text_array, field, null_value)
+    del dbf_array
+    return field_dict
+
+
+def read_dbf_field(input_path, field_name, null_value=0):
+    """Read a single field from a DBF file (see read_dbf_fields())"""
+    return read_dbf_fields(input_path, [field_name], null_value)[field_name]
+
+
+def encode_dbf_field(value_array, field):
+    """Convert values to fixed width DBF text values
+
+    Numeric values are right justified and written with the field decimals.
+    Values that don't fit the field width are written with fewer decimals
+        (or in exponential notation) so that as many digits as possible fit.
+
+    Args:
+        value_array (np.array): Field values
+        field (tuple): Field tuple from DBFHeader.field()
+
+    Returns:
+        np.array: byte strings with the field width
+    """
+    name, field_type, length, decimals = field[:4]
+    value_array = np.asarray(value_array)
+    if field_type in ['N', 'F']:
+        value_array = value_array.astype(np.float64)
+        null_mask = ~np.isfinite(value_array)
+        value_array = np.where(null_mask, 0, value_array)
+        if decimals == 0:
+            value_array = np.round(value_array)
+        text_array = np.char.mod(
+            '%{}.{}f'.format(length, decimals), value_array).astype(
+                'S{}'.format(length * 2 + 32))
+
+        # Reduce the decimals of values that don't fit the field width
+        long_mask = np.char.str_len(text_array) > length
+        if decimals > 0 and np.any(long_mask):
+            long_array = value_array[long_mask]
+            int_digits = np.floor(
+                np.log10(np.maximum(np.abs(long_array), 1))) + 1
+            fit_array = (
+                length - 1 - int_digits - (long_array < 0)).astype(np.int64)
+            long_text = np.char.mod(
+                '%{}.{}e'.format(length, max(length - 8, 0)),
+                long_array).astype(text_array.dtype)
+            for fit_decimals in np.unique(fit_array[fit_array > 0]):
+                fit_mask = fit_array == fit_decimals
+                long_text[fit_mask] = np.char.mod(
+                    '%{}.{}f'.format(length, fit_decimals),
+                    long_array[fit_mask])
+            text_array[long_mask] = long_text
+            long_mask = np.char.str_len(text_array) > length
+            if np.any(long_mask):
+                text_array[long_mask] = np.char.mod(
+                    '%{}.{}e'.format(length, max(length - 8, 0)),
+                    value_array[long_mask])
+                long_mask = np.char.str_len(text_array) > length
+        if np.any(long_mask):
+            raise ValueError(
+                'Values are too wide for field {} (width {}): {}'.format(
+                    name, length, text_array[long_mask][:5]))
+        text_array[null_mask] = b' ' * length
+    elif field_type == 'L':
+        text_array = np.where(value_array.astype(np.bool), b'T', b'F')
+    else:
+        if value_array.dtype.kind == 'U':
+            value_array = np.char.encode(value_array, 'ascii')
+        text_array = value_array.astype(np.bytes_)
+        if np.any(np.char.str_len(text_array) > length):
+            raise ValueError(
+                'Values are too wide for field {} (width {})'.format(
+                    name, length))
+        text_array = np.char.ljust(text_array, length)
+    return np.char.rjust(text_array, length).astype('S{}'.format(length))
+
+
+def write_dbf_fields(input_path, field_dict):
+    """Write field values to a DBF file in a single bulk pass
+
+    The fields must already exist (see support.add_field_func()) and the
+        value arrays must be in the same order as read_dbf_fields().
+
+    Args:
+        input_path (str): File path of the .dbf (or .shp) file
+        field_dict (dict): Field name and NumPy array of values
+
+    Returns:
+        int: Number of bytes written
+    """
+    header, dbf_array = dbf_memmap(input_path, mode='r+')
+    active_mask = dbf_array['DELETED'] != b'*'
+    active_count = int(np.sum(active_mask))
+    bytes_written = 0
+    for field_name, value_array in sorted(field_dict.items()):
+        field = header.field(field_name)
+        if len(value_array) != active_count:
+            raise ValueError(
+                'Field {} has {} values but the table has {} records'.format(
+                    field_name, len(value_array), active_count))
+        text_array = encode_dbf_field(value_array, field)
+        if np.all(active_mask):
+            dbf_array[field[0]] = text_array
+        else:
+            record_array = np.array(dbf_array[field[0]])
+            record_array[active_mask] = text_array
+            dbf_array[field[0]] = record_array
+        bytes_written += active_count * field[2]
+        logging.debug('  Writing DBF field: {}'.format(field_name))
+    if isinstance(dbf_array, np.memmap):
+        dbf_array.flush()
+    del dbf_array
+    return bytes_written
@@ -19,16 +19,24 @@ import arcpy
 from arcpy import env
 import numpy as np
 
+import flow_functions as flow
 import support_functions as support
 
 
-def flow_parameters(config_path):
+def flow_parameters(config_path, flow_acc_threshold_list=None,
+                    flow_length_threshold_list=None):
     """Calculate GSFLOW Flow Parameters
 
     Parameters
     ----------
     config_path : str
         Project configuration file (.ini) path.
+    flow_acc_threshold_list : list, optional
+        Flow accumulation thresholds for a threshold sweep.
+    flow_length_threshold_list : list, optional
+        Flow length thresholds for a threshold sweep.
+        If either threshold list is set, the stream network is summarized
+        for each pair of thresholds and no stream parameters are written.
 
     Returns
     -------
@@ -146,6 +154,7 @@ def flow_parameters(config_path):
     lake_id_path = os.path.join(flow_temp_ws, 'lake_id.img')
     dem_sink_path = os.path.join(flow_temp_ws, 'dem_sink.img')
     dem_fill_path = os.path.join(flow_temp_ws, 'dem_fill.img')
+    dem_fill_temp_path = os.path.join(flow_temp_ws, 'dem_fill_temp.img')
     flow_dir_path = os.path.join(flow_temp_ws, 'flow_dir.img')
     flow_dir_points = os.path.join(flow_temp_ws, 'flow_dir_points.shp')
     flow_acc_full_path = os.path.join(flow_temp_ws, 'flow_acc_full.img')
@@ -459,7 +468,7 @@ def flow_parameters(config_path):
         dem_mod_obj = arcpy.sa.Con(arcpy.sa.IsNull(swale_obj), dem_mod_obj)
 
     logging.info('  Filling DEM_ADJ (8-way)')
-    dem_fill_obj = arcpy.sa.Fill(dem_mod_obj)
+    dem_fill_obj = support.fill_raster_func(dem_mod_obj, dem_fill_temp_path)
     del dem_mod_obj
 
     if 'OUTLET' in model_point_types:
@@ -473,26 +482,36 @@ def flow_parameters(config_path):
     dem_sink_obj = arcpy.sa.Con(dem_sink_obj > 0.001, dem_sink_obj)
 
     logging.info('  Calculating flow direction')
-    flow_dir_obj = arcpy.sa.FlowDirection(dem_fill_obj, False)
+    hru_pnt = arcpy.Point(hru.extent.XMin, hru.extent.YMin, 0)
+    dem_fill_array = arcpy.RasterToNumPyArray(
+        dem_fill_obj, hru_pnt, hru.cols, hru.rows, np.nan).astype(np.float64)
+    flow_dir_array = flow.d8_flow_direction(dem_fill_array)
+    del dem_fill_array
 
     logging.debug('  Setting flow direction to NoData for inactive cells')
-    flow_dir_obj = arcpy.sa.SetNull(hru_type_obj == 0, flow_dir_obj)
+    hru_type_array = arcpy.RasterToNumPyArray(
+        hru_type_obj, hru_pnt, hru.cols, hru.rows, 0)
+    flow_dir_array[hru_type_array == 0] = 0
+    del hru_type_array
 
     if 'OUTLET' in model_point_types:
         logging.debug('  Resetting OUTLET cell flow direction')
-        flow_dir_obj = arcpy.sa.Con(
-            ~arcpy.sa.IsNull(outlet_obj), outlet_obj, flow_dir_obj)
-        del outlet_obj
+        outlet_mask = outlet_array > 0
+        flow_dir_array[outlet_mask] = outlet_array[outlet_mask]
+        del outlet_obj, outlet_mask
     if 'SWALE' in model_point_types:
         logging.debug('  Resetting SWALE cell flow direction')
-        flow_dir_obj = arcpy.sa.Con(
-            ~arcpy.sa.IsNull(swale_obj), 1, flow_dir_obj)
-        del swale_obj
+        swale_mask = arcpy.RasterToNumPyArray(
+            arcpy.sa.IsNull(swale_obj), hru_pnt, hru.cols, hru.rows, 1) == 0
+        flow_dir_array[swale_mask] = 1
+        del swale_obj, swale_mask
 
     logging.debug('  Resetting DEM_ADJ values for inactive cell')
     dem_fill_obj = arcpy.sa.Con(hru_type_obj == 0, dem_adj_obj, dem_fill_obj)
 
-    flow_dir_obj.save(flow_dir_path)
+    support.array_to_raster(
+        flow_dir_array, flow_dir_path, hru_pnt, hru.cs, flow_dir_array)
+    flow_dir_obj = arcpy.sa.Raster(flow_dir_path)
     dem_fill_obj.save(dem_fill_path)
     dem_sink_obj.save(dem_sink_path)
     del dem_sink_obj
@@ -528,32 +547,14 @@ def flow_parameters(config_path):
             'Reclass(!{}!)'.format('grid_code'), 'PYTHON', remap_cb)
 
     # Write flow direction to hru_polygon
-    logging.debug('  Extracting flow direction at points')
-    vt_list = [[flow_dir_path, hru.flow_dir_field]]
-    mem_point_path = os.path.join('in_memory', 'hru_point')
-    arcpy.CopyFeatures_management(hru.point_path, mem_point_path)
-    arcpy.sa.ExtractMultiValuesToPoints(mem_point_path, vt_list, 'NONE')
-    logging.debug('  Reading flow direction values at point')
-    data_dict = defaultdict(dict)
-    fields = [hru.flow_dir_field, hru.fid_field]
-    with arcpy.da.SearchCursor(mem_point_path, fields) as s_cursor:
-        for row in s_cursor:
-            # Set nodata cells to 0
-            if row[0] is not None and row[1] is not None:
-                data_dict[int(row[1])][hru.flow_dir_field] = int(row[0])
-            del row
+    # Flow directions are read directly from the array at each HRU row/col
     logging.debug('  Writing flow direction values to polygon')
-    fields = [hru.flow_dir_field, hru.fid_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-        for row in u_cursor:
-            row_dict = data_dict.get(int(row[-1]), None)
-            for i, field in enumerate(fields[:-1]):
-                if row_dict:
-                    row[i] = row_dict[field]
-                else:
-                    row[i] = 0
-            u_cursor.updateRow(row)
-            del row_dict, row
+    hru_table = support.HRUTable(hru, [hru.col_field, hru.row_field])
+    hru_table[hru.flow_dir_field] = flow_dir_array[
+        hru_table[hru.row_field].astype(np.int64) - 1,
+        hru_table[hru.col_field].astype(np.int64) - 1]
+    hru_table.flush()
+    del hru_table
 
 
     # DEADBEEF - This whole section seems to only be needed if the outflows
@@ -641,11 +642,51 @@ def flow_parameters(config_path):
 
     # Flow Accumulation
     logging.info('\nCalculating initial flow accumulation')
-    flow_acc_full_obj = arcpy.sa.FlowAccumulation(flow_dir_obj,'','INTEGER')
+    flow_acc_full_array = flow.flow_accumulation(flow_dir_array)
+
+    # Fill, flow direction and flow accumulation are only computed once
+    #   for all of the threshold pairs
+    if flow_acc_threshold_list or flow_length_threshold_list:
+        if not flow_acc_threshold_list:
+            flow_acc_threshold_list = [flow_acc_threshold]
+        if not flow_length_threshold_list:
+            flow_length_threshold_list = [flow_length_threshold]
+        hru_type_array = arcpy.RasterToNumPyArray(
+            hru_type_obj, hru_pnt, hru.cols, hru.rows, 0)
+        lake_id_array = arcpy.RasterToNumPyArray(
+            lake_id_obj, hru_pnt, hru.cols, hru.rows, 0)
+        sweep_list = threshold_sweep(
+            flow_dir_array, flow_acc_full_array, hru_type_array,
+            lake_id_array, flow_acc_threshold_list,
+            flow_length_threshold_list, hru.cs)
+
+        sweep_path = os.path.join(flow_temp_ws, 'threshold_sweep.csv')
+        logging.info('\nWriting threshold sweep summary\n  {}'.format(
+            sweep_path))
+        sweep_fields = [
+            'FLOW_ACC_THRESHOLD', 'FLOW_LENGTH_THRESHOLD',
+            'NSEGMENT', 'NREACH', 'STREAM_LENGTH']
+        with open(sweep_path, 'w') as output_f:
+            output_f.write(','.join(sweep_fields) + '\n')
+            for sweep_row in sweep_list:
+                output_f.write('{},{},{},{},{:.2f}\n'.format(*sweep_row))
+        logging.info('  {:>10} {:>10} {:>10} {:>10} {:>14}'.format(
+            'FLOW_ACC', 'FLOW_LEN', 'NSEGMENT', 'NREACH', 'STREAM_LENGTH'))
+        for sweep_row in sweep_list:
+            logging.info('  {:>10} {:>10} {:>10} {:>10} {:>14.2f}'.format(
+                *sweep_row))
+        del hru_type_obj, lake_id_obj, dem_fill_obj, flow_dir_obj
+        return
+
     logging.info('  Only keeping flow_acc >= {}'.format(flow_acc_threshold))
-    flow_acc_full_obj = arcpy.sa.Con(
-        flow_acc_full_obj >= flow_acc_threshold, flow_acc_full_obj)
-    flow_acc_full_obj.save(flow_acc_full_path)
+    flow_acc_full_mask = (
+        np.isfinite(flow_acc_full_array) &
+        (np.nan_to_num(flow_acc_full_array) >= flow_acc_threshold))
+    support.array_to_raster(
+        np.nan_to_num(flow_acc_full_array).astype(np.int32),
+        flow_acc_full_path, hru_pnt, hru.cs, flow_acc_full_mask)
+    flow_acc_full_obj = arcpy.sa.Raster(flow_acc_full_path)
+    del flow_acc_full_array, flow_acc_full_mask
 
     # Flow accumulation and stream link with lakes
     logging.info('\nCalculating flow accumulation & stream link (w/ lakes)')
@@ -899,6 +940,167 @@ def flow_parameters(config_path):
     del flow_acc_sub_obj
 
 
+def threshold_sweep(flow_dir_array, flow_acc_array, hru_type_array,
+                    lake_id_array, flow_acc_threshold_list,
+                    flow_length_threshold_list, cs):
+    """Summarize the stream network for pairs of stream thresholds
+
+    The stream link, Shreve order and length filter steps of
+    flow_parameters() are repeated with NumPy arrays for each pair.
+
+    Parameters
+    ----------
+    flow_dir_array : ndarray
+        D8 flow directions (0 for inactive cells).
+    flow_acc_array : ndarray
+        Flow accumulation (NaN for inactive cells).
+    hru_type_array : ndarray
+        HRU_TYPE values.
+    lake_id_array : ndarray
+        LAKE_ID values.
+    flow_acc_threshold_list : list
+        Flow accumulation thresholds.
+    flow_length_threshold_list : list
+        Flow length (cell count) thresholds.
+    cs : float
+        Cell size.
+
+    Returns
+    -------
+    list of tuples: flow_acc_threshold, flow_length_threshold,
+        nsegment, nreach, stream length (in cell size units)
+
+    """
+    lake_mask = (
+        (hru_type_array == 2) | ((hru_type_array == 3) & (lake_id_array >= 1)))
+    reach_mask = np.in1d(hru_type_array, [1, 3]).reshape(
+        hru_type_array.shape) & ~lake_mask
+    cell_length = np.where(
+        np.in1d(flow_dir_array, [2, 8, 32, 128]).reshape(
+            flow_dir_array.shape), cs * math.sqrt(2), cs)
+
+    sweep_list = []
+    for acc_threshold in sorted(flow_acc_threshold_list):
+        logging.info('\nFlow accumulation threshold: {}'.format(
+            acc_threshold))
+        flow_acc_mask, stream_order_array, stream_length_array = \
+            stream_order_length(
+                flow_dir_array, flow_acc_array, hru_type_array,
+                lake_id_array, acc_threshold)
+
+        for length_threshold in sorted(flow_length_threshold_list):
+            # Remove 1st order streams that are shorter than the threshold
+            stream_mask = flow_acc_mask & (
+                (hru_type_array == 2) | (hru_type_array == 3) |
+                (stream_order_array >= 2) |
+                ((stream_order_array == 1) &
+                 (stream_length_array >= length_threshold)))
+            link_array = flow.stream_links(stream_mask, flow_dir_array)[0]
+            stream_mask &= reach_mask
+            nsegment = np.unique(link_array[stream_mask]).size
+            nreach = int(np.sum(stream_mask))
+            stream_length = float(np.sum(cell_length[stream_mask]))
+            logging.debug('  {} {} {} {} {}'.format(
+                acc_threshold, length_threshold, nsegment, nreach,
+                stream_length))
+            sweep_list.append((
+                acc_threshold, length_threshold, nsegment, nreach,
+                stream_length))
+            del link_array, stream_mask
+        del flow_acc_mask, stream_order_array, stream_length_array
+    return sweep_list
+
+
+def stream_order_length(flow_dir_array, flow_acc_array, hru_type_array,
+                        lake_id_array, flow_acc_threshold):
+    """Shreve stream order (w/ lakes) and stream length (w/o lakes)
+
+    NumPy version of the StreamLink/StreamOrder/Lookup steps of
+    flow_parameters().
+
+    Parameters
+    ----------
+    flow_dir_array : ndarray
+        D8 flow directions (0 for inactive cells).
+    flow_acc_array : ndarray
+        Flow accumulation (NaN for inactive cells).
+    hru_type_array : ndarray
+        HRU_TYPE values.
+    lake_id_array : ndarray
+        LAKE_ID values.
+    flow_acc_threshold : int
+        Flow accumulation threshold.
+
+    Returns
+    -------
+    tuple of ndarrays: flow accumulation mask, stream order and
+        stream length (cell count)
+
+    """
+    flow_acc_array = np.nan_to_num(flow_acc_array)
+    flow_acc_mask = (
+        (flow_dir_array > 0) & (flow_acc_array >= flow_acc_threshold) &
+        (flow_acc_array > 0))
+    link_a_array, link_a_down = flow.stream_links(
+        flow_acc_mask & (hru_type_array >= 1) & (hru_type_array <= 3),
+        flow_dir_array)
+    stream_order_array = flow.shreve_order(link_a_down)[link_a_array]
+    link_b_array = flow.stream_links(
+        flow_acc_mask & (
+            (hru_type_array == 1) |
+            ((hru_type_array == 3) & (lake_id_array == 0))),
+        flow_dir_array)[0]
+    stream_length_array = np.bincount(link_b_array.ravel())[link_b_array]
+    stream_length_array[link_b_array == 0] = 0
+    return flow_acc_mask, stream_order_array, stream_length_array
+
+
+def iseg_func(flow_dir_array, flow_acc_array, hru_type_array, lake_id_array,
+              flow_acc_threshold, flow_length_threshold):
+    """Stream segment (ISEG) of each cell
+
+    NumPy version of the final stream link step of flow_parameters().
+    Segments are numbered in raster order (not the ArcGIS StreamLink
+    order) so the values are only comparable between NumPy runs.
+
+    Parameters
+    ----------
+    flow_dir_array : ndarray
+        D8 flow directions (0 for inactive cells).
+    flow_acc_array : ndarray
+        Flow accumulation (NaN for inactive cells).
+    hru_type_array : ndarray
+        HRU_TYPE values.
+    lake_id_array : ndarray
+        LAKE_ID values.
+    flow_acc_threshold : int
+        Flow accumulation threshold.
+    flow_length_threshold : int
+        Flow length (cell count) threshold for 1st order streams.
+
+    Returns
+    -------
+    ndarray: ISEG values (negative LAKE_ID for lake cells, 0 for
+        non-stream and inactive cells)
+
+    """
+    flow_acc_mask, stream_order_array, stream_length_array = \
+        stream_order_length(
+            flow_dir_array, flow_acc_array, hru_type_array, lake_id_array,
+            flow_acc_threshold)
+    stream_mask = flow_acc_mask & (
+        (hru_type_array == 2) | (hru_type_array == 3) |
+        (stream_order_array >= 2) |
+        ((stream_order_array == 1) &
+         (stream_length_array >= flow_length_threshold)))
+    iseg_array = flow.stream_links(stream_mask, flow_dir_array)[0]
+    lake_mask = (
+        (hru_type_array == 2) | ((hru_type_array == 3) & (lake_id_array >= 1)))
+    iseg_array[lake_mask] = -lake_id_array[lake_mask]
+    iseg_array[hru_type_array == 0] = 0
+    return iseg_array
+
+
 def arg_parse():
     """"""
     parser = argparse.ArgumentParser(
@@ -907,6 +1109,12 @@ def arg_parse():
     parser.add_argument(
         '-i', '--ini', required=True,
         help='Project input file', metavar='PATH')
+    parser.add_argument(
+        '--acc', default=None, type=int, nargs='+', metavar='N',
+        help='Flow accumulation thresholds for a threshold sweep')
+    parser.add_argument(
+        '--length', default=None, type=int, nargs='+', metavar='N',
+        help='Flow length thresholds for a threshold sweep')
     parser.add_argument(
         '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action='store_const', dest='loglevel')
@@ -931,4 +1139,6 @@ if __name__ == '__main__':
     logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
 
     # Calculate GSFLOW Flow Parameters
-    flow_parameters(config_path=args.ini)
+    flow_parameters(
+        config_path=args.ini, flow_acc_threshold_list=args.acc,
+        flow_length_threshold_list=args.length)
@@ -0,0 +1,471 @@
+#--------------------------------
+# Name:         dem_2_streams_iterate.py
+# Purpose:      Iterate dem_2_streams and crt_fill_parameters until the
+#                 stream network converges
+# Notes:        ArcGIS 10.2+ Version
+# Python:       2.7
+#--------------------------------
+
+import argparse
+import ConfigParser
+import datetime as dt
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import crt_fill_parameters
+import crt_functions as crt
+import dem_2_streams
+import flow_functions as flow
+import support_functions as support
+
+
+def dem_2_streams_iterate(config_path, max_iterations=10):
+    """Iterate dem_2_streams and crt_fill_parameters until convergence
+
+    dem_2_streams is run once to build the fishnet fields, then the
+    fill / flow direction / stream link and CRT fill steps are repeated
+    in memory (without writing the fishnet) until CRT_FILL is zero or
+    the ISEG values stop changing.  Only the cells whose DEM_ADJ changed
+    (and their neighbors) have their flow direction recalculated.
+    The final DEM_ADJ values are then written to the fishnet and
+    dem_2_streams and crt_fill_parameters are run one last time to
+    build the final stream network.
+
+    Parameters
+    ----------
+    config_path : str
+        Project configuration file (.ini) path.
+    max_iterations : int, optional
+        Maximum number of in memory iterations.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    The in memory ISEG values are only used to check for convergence and
+    are numbered in raster order.  OUTLET and SWALE cells are both reset
+    to DEM_ADJ after filling (dem_2_streams only resets OUTLET cells).
+
+    """
+    # Initialize hru_parameters class
+    hru = support.HRUParameters(config_path)
+
+    # Open input parameter config file
+    inputs_cfg = ConfigParser.ConfigParser()
+    try:
+        inputs_cfg.readfp(open(config_path))
+    except Exception as e:
+        logging.error(
+            '\nERROR: Config file could not be read, '
+            'is not an input file, or does not exist\n'
+            '  config_file = {}\n'
+            '  Exception: {}\n'.format(config_path, e))
+        sys.exit()
+
+    # Log DEBUG to file
+    log_file_name = 'dem_2_streams_iterate_log.txt'
+    log_console = logging.FileHandler(
+        filename=os.path.join(hru.log_ws, log_file_name), mode='w')
+    log_console.setLevel(logging.DEBUG)
+    log_console.setFormatter(logging.Formatter('%(message)s'))
+    logging.getLogger('').addHandler(log_console)
+    logging.info('\nGSFLOW DEM To Streams Iteration')
+
+    # Stream parameters
+    flow_acc_threshold = inputs_cfg.getint('INPUTS', 'flow_acc_threshold')
+    flow_length_threshold = inputs_cfg.getint(
+        'INPUTS', 'flow_length_threshold')
+
+    # CRT Parameters
+    try:
+        use_crt_fill_flag = inputs_cfg.getboolean(
+            'INPUTS', 'use_crt_fill_flag')
+    except ConfigParser.NoOptionError:
+        use_crt_fill_flag = False
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'use_crt_fill_flag', use_crt_fill_flag))
+    try:
+        crt_hruflg = inputs_cfg.getint('INPUTS', 'crt_hruflg')
+    except ConfigParser.NoOptionError:
+        crt_hruflg = 0
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_hruflg', crt_hruflg))
+    try:
+        crt_flowflg = inputs_cfg.getint('INPUTS', 'crt_flowflg')
+    except ConfigParser.NoOptionError:
+        crt_flowflg = 1
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_flowflg', crt_flowflg))
+    try:
+        crt_dpit = inputs_cfg.getfloat('INPUTS', 'crt_dpit')
+    except ConfigParser.NoOptionError:
+        crt_dpit = 0.01
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_dpit', crt_dpit))
+    try:
+        crt_outitmax = inputs_cfg.getint('INPUTS', 'crt_outitmax')
+    except ConfigParser.NoOptionError:
+        crt_outitmax = 100000
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_outitmax', crt_outitmax))
+    try:
+        crt_cache_flag = inputs_cfg.getboolean('INPUTS', 'crt_cache_flag')
+    except ConfigParser.NoOptionError:
+        crt_cache_flag = True
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_cache_flag', crt_cache_flag))
+    try:
+        crt_timeout = inputs_cfg.getfloat('INPUTS', 'crt_timeout')
+    except ConfigParser.NoOptionError:
+        crt_timeout = 0
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_timeout', crt_timeout))
+    try:
+        crt_engine = inputs_cfg.get('INPUTS', 'crt_engine').upper()
+    except ConfigParser.NoOptionError:
+        crt_engine = 'EXE'
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_engine', crt_engine))
+    crt_params = {
+        'HRUFLG': crt_hruflg, 'FLOWFLG': crt_flowflg,
+        'DPIT': crt_dpit, 'OUTITMAX': crt_outitmax}
+
+    # Check inputs
+    if max_iterations < 1:
+        logging.error('\nERROR: The maximum iterations must be >= 1\n')
+        sys.exit()
+    if crt_engine not in ['EXE', 'PYTHON']:
+        logging.error(
+            '\nERROR: crt_engine must be EXE or PYTHON\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_hruflg != 0:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_hruflg = 0\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_flowflg not in [1, 2, 3]:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_flowflg = '
+            '1, 2 or 3\n')
+        sys.exit()
+    if not use_crt_fill_flag:
+        logging.warning(
+            '\n  WARNING: use_crt_fill_flag is False, DEM_ADJ will not be '
+            'updated and only one iteration will be run')
+
+    # Build the fishnet fields, flow directions and OUTFLOW cells
+    logging.info('\n{}\nInitial dem_2_streams run'.format('#' * 80))
+    run_script_func(dem_2_streams.flow_parameters, config_path)
+
+    # Build output folder if necessary
+    fill_ws = os.path.join(hru.param_ws, 'fill_work')
+    if not os.path.isdir(fill_ws):
+        os.makedirs(fill_ws)
+
+    # Copy CRT executable if necessary
+    if crt_engine == 'EXE':
+        crt_exe_path = inputs_cfg.get('INPUTS', 'crt_exe_path')
+        crt_exe_name = os.path.basename(crt_exe_path)
+        if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
+            shutil.copy(crt_exe_path, fill_ws)
+        if not os.path.isfile(os.path.join(fill_ws, crt_exe_name)):
+            logging.error(
+                '\nERROR: CRT executable ({}) does not exist\n'.format(
+                    os.path.join(fill_ws, crt_exe_name)))
+            sys.exit()
+    else:
+        crt_exe_name = None
+
+    # All of the fields are read in a single pass (in fishnet order)
+    logging.info('\n{}\nIterating in memory'.format('#' * 80))
+    crt_field_dict = support.read_table_fields(hru.polygon_path, [
+        hru.id_field, hru.type_field, hru.outflow_field,
+        hru.row_field, hru.col_field, hru.dem_adj_field,
+        hru.x_field, hru.y_field, hru.lake_id_field, hru.flow_dir_field])
+    row_array = crt_field_dict[hru.row_field].astype(np.int64) - 1
+    col_array = crt_field_dict[hru.col_field].astype(np.int64) - 1
+
+    def field_grid(field, dtype, nodata=0):
+        """Fishnet field values as a model grid array"""
+        grid_array = np.full((hru.rows, hru.cols), nodata, dtype=dtype)
+        grid_array[row_array, col_array] = crt_field_dict[field]
+        return grid_array
+
+    hru_type_array = field_grid(hru.type_field, np.int64)
+    lake_id_array = field_grid(hru.lake_id_field, np.int64)
+    outflow_mask = field_grid(hru.outflow_field, np.int64) > 0
+    outflow_dir_array = field_grid(hru.flow_dir_field, np.int64)
+    dem_adj_array = field_grid(hru.dem_adj_field, np.float64, np.nan)
+    dem_adj_orig_array = dem_adj_array.copy()
+
+    clock = time.time()
+    fill_array, flow_dir_array, update_count = flow_dir_func(
+        dem_adj_array, hru_type_array, outflow_mask)
+    iseg_array = stream_links_func(
+        flow_dir_array, hru_type_array, lake_id_array, outflow_mask,
+        outflow_dir_array, flow_acc_threshold, flow_length_threshold)
+    logging.info('  Initial streams: {:.2f} s'.format(time.time() - clock))
+
+    iter_list = []
+    iter_f = '  {:>4s} {:>10s} {:>10s} {:>12s} {:>13s} {:>8s}'
+    stop_msg = 'the maximum number of iterations ({}) was reached'.format(
+        max_iterations)
+    for iter_i in range(1, max_iterations + 1):
+        logging.info('\nIteration {}'.format(iter_i))
+        clock = time.time()
+
+        # CRT fill of the current DEM_ADJ
+        crt_field_dict[hru.dem_adj_field] = dem_adj_array[row_array, col_array]
+        crt_grid_dict = crt_fill_parameters.crt_fill_func(
+            hru, crt_field_dict, fill_ws, crt_engine, crt_params,
+            crt_exe_name, crt_cache_flag, crt_timeout)
+        crt_dem_array = crt_grid_dict[crt.CRT_DEM_SECTION][
+            row_array, col_array]
+        crt_fill_array = crt_grid_dict[crt.CRT_FILL_SECTION][
+            row_array, col_array]
+        del crt_grid_dict
+        fill_mask = ~(
+            np.ma.getmaskarray(crt_dem_array) |
+            np.ma.getmaskarray(crt_fill_array))
+        fill_mask &= crt_fill_array.filled(0) > 0
+        fill_count = int(np.sum(fill_mask))
+        fill_max = float(np.max(crt_fill_array[fill_mask])) if fill_count else 0
+        if fill_count == 0:
+            iter_list.append([iter_i, 0, 0, 0, 0, time.time() - clock])
+            stop_msg = '{} is 0'.format(hru.crt_fill_field)
+            break
+        elif not use_crt_fill_flag:
+            iter_list.append(
+                [iter_i, fill_count, fill_max, 0, 0, time.time() - clock])
+            stop_msg = 'use_crt_fill_flag is False'
+            break
+
+        # Only the filled cells change
+        dem_adj_array[row_array[fill_mask], col_array[fill_mask]] = \
+            crt_dem_array.filled(0)[fill_mask]
+        del crt_dem_array, crt_fill_array
+
+        # Update the streams
+        fill_array, flow_dir_array, update_count = flow_dir_func(
+            dem_adj_array, hru_type_array, outflow_mask,
+            fill_array, flow_dir_array)
+        iseg_new_array = stream_links_func(
+            flow_dir_array, hru_type_array, lake_id_array, outflow_mask,
+            outflow_dir_array, flow_acc_threshold, flow_length_threshold)
+        iseg_count = int(np.sum(iseg_new_array != iseg_array))
+        iseg_array = iseg_new_array
+        del iseg_new_array
+        iter_list.append([
+            iter_i, fill_count, fill_max, iseg_count, update_count,
+            time.time() - clock])
+        logging.info('  Cells filled: {}  ISEG changes: {}'.format(
+            fill_count, iseg_count))
+        if iseg_count == 0:
+            stop_msg = '{} did not change'.format(hru.iseg_field)
+            break
+
+    logging.info('\nIteration summary')
+    logging.info(iter_f.format(
+        'ITER', 'FILL_CELLS', 'MAX_FILL', 'ISEG_CHANGES', 'CELLS_UPDATED',
+        'SECONDS'))
+    for iter_i, fill_count, fill_max, iseg_count, update_count, secs in \
+            iter_list:
+        logging.info(iter_f.format(
+            str(iter_i), str(fill_count), '{:.2f}'.format(fill_max),
+            str(iseg_count), str(update_count), '{:.2f}'.format(secs)))
+    logging.info('  Stopped because {}'.format(stop_msg))
+    if stop_msg.startswith('the maximum'):
+        logging.warning(
+            '\n  WARNING: The stream network did not converge, try '
+            're-running or increasing the maximum iterations')
+
+    # Save the adjusted DEM_ADJ values
+    dem_adj_mask = (dem_adj_array != dem_adj_orig_array) & (
+        ~np.isnan(dem_adj_array))
+    logging.info('\nWriting {} to fishnet ({} cells changed)'.format(
+        hru.dem_adj_field, int(np.sum(dem_adj_mask))))
+    if np.any(dem_adj_mask):
+        hru_table = support.HRUTable(hru, [
+            hru.row_field, hru.col_field, hru.dem_adj_field])
+        hru_table[hru.dem_adj_field] = dem_adj_array[
+            hru_table[hru.row_field].astype(np.int64) - 1,
+            hru_table[hru.col_field].astype(np.int64) - 1]
+        hru_table.flush()
+        del hru_table
+
+    # Final run to build the output fields and rasters
+    logging.info('\n{}\nFinal dem_2_streams run'.format('#' * 80))
+    run_script_func(dem_2_streams.flow_parameters, config_path)
+    logging.info('\n{}\nFinal crt_fill_parameters run'.format('#' * 80))
+    fill_count = run_script_func(
+        crt_fill_parameters.crt_fill_parameters, config_path)
+
+    # The final CRT fill can still change DEM_ADJ
+    logging.info('\nFinal {} cells: {}'.format(
+        hru.crt_fill_field, fill_count))
+    if fill_count:
+        logging.warning(
+            '\n  WARNING: {} cells were filled in the final '
+            'crt_fill_parameters run\n  The stream network may not match '
+            'the final {}, try re-running dem_2_streams_iterate.py'.format(
+                fill_count, hru.dem_adj_field))
+
+
+def run_script_func(script_func, config_path):
+    """Run a script function and remove the log file handlers it adds
+
+    Each script adds a log file handler to the root logger that is never
+    removed, so without this every later message would also be written to
+    (and a second run would truncate) the log files of the earlier runs.
+
+    Parameters
+    ----------
+    script_func : function
+        Script function that takes the project configuration file path.
+    config_path : str
+        Project configuration file (.ini) path.
+
+    Returns
+    -------
+    The return value of the script function
+
+    """
+    root_logger = logging.getLogger('')
+    handler_list = list(root_logger.handlers)
+    try:
+        return script_func(config_path)
+    finally:
+        for handler in root_logger.handlers[:]:
+            if handler not in handler_list:
+                root_logger.removeHandler(handler)
+                handler.close()
+
+
+def flow_dir_func(dem_adj_array, hru_type_array, outflow_mask,
+                  fill_array=None, flow_dir_array=None):
+    """Fill DEM_ADJ and calculate the flow directions (like dem_2_streams)
+
+    If the previous filled DEM and flow directions are set, only the
+    cells whose filled elevation changed (and their neighbors) have
+    their flow direction recalculated.
+
+    Parameters
+    ----------
+    dem_adj_array : ndarray
+        DEM_ADJ values.
+    hru_type_array : ndarray
+        HRU_TYPE values.
+    outflow_mask : ndarray
+        Boolean array of the OUTFLOW (OUTLET/SWALE) cells.
+    fill_array : ndarray, optional
+        Filled DEM from the previous call.
+    flow_dir_array : ndarray, optional
+        Flow directions from the previous call.
+
+    Returns
+    -------
+    tuple: filled DEM, flow directions and the number of flow directions
+        that were recalculated
+
+    """
+    # This will force all active cells to flow to an outlet
+    dem_mod_array = np.where(hru_type_array > 0, dem_adj_array, 20000.0)
+    dem_mod_array[outflow_mask] = np.nan
+    new_fill_array = flow.priority_flood_fill(dem_mod_array)
+    new_fill_array[outflow_mask] = dem_adj_array[outflow_mask]
+    del dem_mod_array
+    if fill_array is None or flow_dir_array is None:
+        return (
+            new_fill_array, flow.d8_flow_direction(new_fill_array),
+            new_fill_array.size)
+    new_flow_dir_array, update_count = flow.d8_flow_direction_update(
+        fill_array, new_fill_array, flow_dir_array)
+    return new_fill_array, new_flow_dir_array, update_count
+
+
+def stream_links_func(flow_dir_array, hru_type_array, lake_id_array,
+                      outflow_mask, outflow_dir_array, flow_acc_threshold,
+                      flow_length_threshold):
+    """Stream links (ISEG) from the flow directions (like dem_2_streams)
+
+    Parameters
+    ----------
+    flow_dir_array : ndarray
+        D8 flow directions of the filled DEM.
+    hru_type_array : ndarray
+        HRU_TYPE values.
+    lake_id_array : ndarray
+        LAKE_ID values.
+    outflow_mask : ndarray
+        Boolean array of the OUTFLOW (OUTLET/SWALE) cells.
+    outflow_dir_array : ndarray
+        Flow directions of the OUTFLOW cells (from dem_2_streams).
+    flow_acc_threshold : int
+        Flow accumulation threshold.
+    flow_length_threshold : int
+        Flow length (cell count) threshold for 1st order streams.
+
+    Returns
+    -------
+    ndarray: ISEG values
+
+    """
+    flow_dir_array = flow_dir_array.copy()
+    flow_dir_array[hru_type_array == 0] = 0
+    flow_dir_array[outflow_mask] = outflow_dir_array[outflow_mask]
+    flow_acc_array = flow.flow_accumulation(flow_dir_array)
+    return dem_2_streams.iseg_func(
+        flow_dir_array, flow_acc_array, hru_type_array, lake_id_array,
+        flow_acc_threshold, flow_length_threshold)
+
+
+def arg_parse():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='DEM To Streams Iteration',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-i', '--ini', required=True,
+        help='Project input file', metavar='PATH')
+    parser.add_argument(
+        '--iter', default=10, type=int, metavar='N',
+        help='Maximum number of iterations')
+    parser.add_argument(
+        '-d', '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action='store_const', dest='loglevel')
+    args = parser.parse_args()
+
+    # Convert input file to an absolute path
+    if os.path.isfile(os.path.abspath(args.ini)):
+        args.ini = os.path.abspath(args.ini)
+
+    return args
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{}'.format('#' * 80))
+    log_f = '{:<20s} {}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Current Directory:', os.getcwd()))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    # Iterate DEM To Streams and CRT Fill
+    dem_2_streams_iterate(config_path=args.ini, max_iterations=args.iter)
@@ -426,8 +426,7 @@ def dem_parameters(config_path):
 
     # Calculate filled DEM, flow_dir, & flow_acc
     logging.info('\nCalculating filled DEM raster')
-    dem_fill_obj = arcpy.sa.Fill(dem_obj)
-    dem_fill_obj.save(dem_fill_path)
+    dem_fill_obj = support.fill_raster_func(dem_obj, dem_fill_path)
     del dem_fill_obj
 
     if calc_flow_dir_flag:
@@ -0,0 +1,485 @@
+#--------------------------------
+# Name:         flow_functions.py
+# Purpose:      GSFLOW NumPy DEM fill and flow functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+from collections import deque
+import heapq
+import logging
+
+import numpy as np
+
+
+# D8 flow direction codes (ArcGIS encoding, see support.next_row_col())
+#   and the row/column offset of the downstream cell
+D8_DIRECTIONS = [
+    (1, 0, 1), (2, 1, 1), (4, 1, 0), (8, 1, -1),
+    (16, 0, -1), (32, -1, -1), (64, -1, 0), (128, -1, 1)]
+
+def neighbor_offsets(cols, four_way_flag=False):
+    """Flat index offsets of the neighbors of a cell in a padded array
+
+    Args:
+        cols (int): Number of columns in the padded array
+        four_way_flag (bool): If True, only return the 4 non-diagonal
+            neighbors, otherwise return all 8 neighbors
+
+    Returns:
+        list
+    """
+    if four_way_flag:
+        return [-cols, -1, 1, cols]
+    else:
+        return [-cols - 1, -cols, -cols + 1, -1, 1, cols - 1, cols, cols + 1]
+
+
+def pad_array(input_array, pad_value=np.nan):
+    """Add a one cell border around an array"""
+    rows, cols = input_array.shape
+    output_array = np.full((rows + 2, cols + 2), pad_value, dtype=np.float64)
+    output_array[1:-1, 1:-1] = input_array
+    return output_array
+
+
+def edge_mask_func(data_mask, four_way_flag=False):
+    """Identify data cells that are next to a nodata cell
+
+    Args:
+        data_mask (np.array): Boolean array of the data cells
+            The array must have a one cell nodata (False) border
+        four_way_flag (bool): If True, only check the 4 non-diagonal neighbors
+
+    Returns:
+        np.array: Boolean array of the edge cells
+    """
+    # Since ArcGIS doesn't ship with SciPy (only numpy), don't use ndimage module
+    nodata_mask = ~data_mask
+    edge_mask = np.zeros(data_mask.shape, dtype=np.bool)
+    for i, j in [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                 (0, 1), (1, -1), (1, 0), (1, 1)]:
+        if four_way_flag and i != 0 and j != 0:
+            continue
+        edge_mask[1:-1, 1:-1] |= nodata_mask[1 + i:-1 + i or None,
+                                             1 + j:-1 + j or None]
+    return edge_mask & data_mask
+
+
+def priority_flood_fill(input_array, epsilon=0, four_way_flag=False,
+                        outlet_mask=None):
+    """Fill depressions using the Priority-Flood algorithm
+
+    Cells at the edge of the array and cells next to nodata (NaN) cells are
+    the initial outlets, so SWALE/OUTLET cells that are set to nodata before
+    filling will act as sinks (like arcpy.sa.Fill).
+    If outlet_mask is set, only those cells are outlets and cells that
+    can't reach an outlet are not filled.
+
+    Cells are processed from lowest to highest using a priority queue.
+    Cells that are filled (raised to their spill elevation) are processed
+    from a plain FIFO queue when epsilon is 0.
+
+    References:
+        Barnes, R., Lehman, C., Mulla, D. (2014). Priority-flood: An optimal
+            depression-filling and watershed-labeling algorithm for digital
+            elevation models. Computers & Geosciences, 62, 117-127.
+
+    Args:
+        input_array (np.array): Elevations, NaN values are nodata
+        epsilon (float): Elevation increment added to each filled cell so
+            that filled areas drain (a value of 0 leaves the filled areas flat)
+        four_way_flag (bool): If True, cells are only connected to the
+            4 non-diagonal neighbors, otherwise 8 neighbors (default)
+        outlet_mask (np.array): Boolean array of the outlet cells
+            (by default the edge cells are the outlets)
+
+    Returns:
+        np.array: Filled elevations with the same shape as input_array
+            (float64, NaN for nodata cells)
+    """
+    rows, cols = input_array.shape
+    pad_cols = cols + 2
+
+    # Pad the array with nodata so that edge cells don't need to be checked
+    z_array = pad_array(input_array)
+    data_mask = np.isfinite(z_array)
+    if outlet_mask is None:
+        edge_mask = edge_mask_func(data_mask, four_way_flag)
+    else:
+        edge_mask = pad_array(outlet_mask, 0).astype(np.bool) & data_mask
+    offsets = neighbor_offsets(pad_cols, four_way_flag)
+
+    # Python lists are much faster than NumPy arrays for single element
+    #   access in the main loop
+    z_list = z_array.ravel().tolist()
+    closed_list = (~data_mask | edge_mask).ravel().tolist()
+
+    # Build priority queue and place edge cells into queue
+    edge_index = np.flatnonzero(edge_mask).tolist()
+    open_heap = [(z_list[i], i) for i in edge_index]
+    heapq.heapify(open_heap)
+    pit_queue = deque()
+    logging.debug('    Edge cells: {}'.format(len(open_heap)))
+    del data_mask, edge_mask, edge_index
+
+    # Local names for faster lookups in the loop
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    pit_append = pit_queue.append
+    pit_popleft = pit_queue.popleft
+
+    while open_heap or pit_queue:
+        if pit_queue:
+            c_i = pit_popleft()
+            c_z = z_list[c_i]
+        else:
+            c_z, c_i = heappop(open_heap)
+        spill_z = c_z + epsilon
+        for offset in offsets:
+            n_i = c_i + offset
+            if closed_list[n_i]:
+                continue
+            closed_list[n_i] = True
+            if z_list[n_i] <= spill_z:
+                # Raise the cell to the spill elevation
+                # With epsilon, filled cells must be ordered with the
+                #   unfilled cells, otherwise the FIFO queue is sufficient
+                if z_list[n_i] < spill_z:
+                    z_list[n_i] = spill_z
+                if epsilon:
+                    heappush(open_heap, (z_list[n_i], n_i))
+                else:
+                    pit_append(n_i)
+            else:
+                heappush(open_heap, (z_list[n_i], n_i))
+
+    output_array = np.array(z_list, dtype=np.float64).reshape(
+        rows + 2, pad_cols)[1:-1, 1:-1]
+    return output_array
+
+
+def d8_flow_direction(input_array, force_flag=False):
+    """Calculate D8 flow directions (like arcpy.sa.FlowDirection)
+
+    Flow directions use the ArcGIS encoding (1=E, 2=SE, 4=S, 8=SW, 16=W,
+    32=NW, 64=N, 128=NE) that support.next_row_col() expects.
+
+    Each cell flows to the neighbor with the steepest drop (diagonal drops
+    are divided by the square root of 2).  Ties go to the first direction
+    in the encoding order.  Cells at the edge of the array or next to
+    nodata cells that have no downslope neighbor flow out of the grid.
+    Cells in flat areas (i.e. filled depressions) flow toward the nearest
+    cell in the flat area that already drains.
+
+    Args:
+        input_array (np.array): Elevations (filled), NaN values are nodata
+        force_flag (bool): If True, edge cells always flow out of the grid
+            (like the FORCE option of arcpy.sa.FlowDirection)
+
+    Returns:
+        np.array: uint8 flow directions with the same shape as input_array
+            (0 for nodata cells and for sinks that could not be resolved)
+    """
+    rows, cols = input_array.shape
+    pad_cols = cols + 2
+
+    # Non-diagonal directions are preferred when leaving the grid or flats
+    cardinal_first = sorted(D8_DIRECTIONS, key=lambda x: abs(x[1] * x[2]))
+
+    z_array = pad_array(input_array)
+    data_mask = np.isfinite(z_array)
+    edge_mask = edge_mask_func(data_mask)[1:-1, 1:-1]
+    z_center = z_array[1:-1, 1:-1]
+
+    # Steepest downslope neighbor
+    flow_dir = np.zeros((rows, cols), dtype=np.uint8)
+    max_drop = np.zeros((rows, cols), dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        for code, i, j in D8_DIRECTIONS:
+            n_z = z_array[1 + i:rows + 1 + i, 1 + j:cols + 1 + j]
+            drop = z_center - n_z
+            if i != 0 and j != 0:
+                drop /= np.sqrt(2)
+            drop_mask = drop > max_drop
+            flow_dir[drop_mask] = code
+            max_drop[drop_mask] = drop[drop_mask]
+    del max_drop
+
+    # Edge cells flow out of the grid
+    if force_flag:
+        out_mask = edge_mask.copy()
+    else:
+        out_mask = edge_mask & (flow_dir == 0)
+    out_dir = np.zeros((rows, cols), dtype=np.uint8)
+    for code, i, j in cardinal_first:
+        n_nodata = ~data_mask[1 + i:rows + 1 + i, 1 + j:cols + 1 + j]
+        out_dir[(out_dir == 0) & n_nodata] = code
+    flow_dir[out_mask] = out_dir[out_mask]
+    flow_dir[~data_mask[1:-1, 1:-1]] = 0
+    del out_mask, out_dir, edge_mask
+
+    # Resolve flat areas with a breadth first search that starts from the
+    #   cells that already drain
+    flat_mask = data_mask[1:-1, 1:-1] & (flow_dir == 0)
+    if np.any(flat_mask):
+        flat_pad = np.zeros(z_array.shape, dtype=np.bool)
+        flat_pad[1:-1, 1:-1] = flat_mask
+        seed_mask = np.zeros((rows, cols), dtype=np.bool)
+        for code, i, j in D8_DIRECTIONS:
+            seed_mask |= flat_pad[1 + i:rows + 1 + i, 1 + j:cols + 1 + j]
+        seed_mask &= (flow_dir > 0)
+
+        flow_dir_pad = np.zeros(z_array.shape, dtype=np.uint8)
+        flow_dir_pad[1:-1, 1:-1] = flow_dir
+        flow_dir_list = flow_dir_pad.ravel().tolist()
+        flat_list = flat_pad.ravel().tolist()
+        z_list = z_array.ravel().tolist()
+        del flow_dir_pad, flat_pad
+
+        # Neighbor offset and the direction from the neighbor to the cell
+        offsets = [
+            (-(i * pad_cols + j), code) for code, i, j in cardinal_first]
+        seed_rows, seed_cols = np.nonzero(seed_mask)
+        flat_queue = deque(
+            ((seed_rows + 1) * pad_cols + seed_cols + 1).tolist())
+        del seed_mask, seed_rows, seed_cols
+        while flat_queue:
+            c_i = flat_queue.popleft()
+            c_z = z_list[c_i]
+            for offset, code in offsets:
+                n_i = c_i + offset
+                if flat_list[n_i] and z_list[n_i] == c_z:
+                    flat_list[n_i] = False
+                    flow_dir_list[n_i] = code
+                    flat_queue.append(n_i)
+        flow_dir = np.array(flow_dir_list, dtype=np.uint8).reshape(
+            rows + 2, pad_cols)[1:-1, 1:-1]
+        logging.debug('    Unresolved sink cells: {}'.format(
+            sum(flat_list)))
+    return flow_dir
+
+
+def d8_flow_direction_update(old_array, new_array, flow_dir_array):
+    """Update the D8 flow directions after some elevations have changed
+
+    Only the changed cells and their neighbors are recalculated (in a
+    window around the changed cells).  If any of these cells are in a
+    flat area (before or after the change), the flat resolution could
+    change away from the window so all cells are recalculated.
+    The result is the same as d8_flow_direction(new_array).
+
+    Args:
+        old_array (np.array): Elevations (filled) used to calculate
+            flow_dir_array, NaN values are nodata
+        new_array (np.array): Updated elevations (filled)
+        flow_dir_array (np.array): D8 flow directions of old_array
+
+    Returns:
+        tuple: uint8 flow directions of new_array and the number of cells
+            that were recalculated
+    """
+    rows, cols = new_array.shape
+    with np.errstate(invalid='ignore'):
+        change_mask = (old_array != new_array) & ~(
+            np.isnan(old_array) & np.isnan(new_array))
+    if not np.any(change_mask):
+        return flow_dir_array.copy(), 0
+
+    # Neighbors of the changed cells can have a new steepest neighbor
+    change_pad = pad_array(change_mask, 0).astype(np.bool)
+    update_mask = np.zeros((rows, cols), dtype=np.bool)
+    for code, i, j in D8_DIRECTIONS + [(0, 0, 0)]:
+        update_mask |= change_pad[1 + i:rows + 1 + i, 1 + j:cols + 1 + j]
+
+    # Cells without a downslope neighbor are resolved as flats
+    for input_array in [old_array, new_array]:
+        z_array = pad_array(input_array)
+        z_center = z_array[1:-1, 1:-1]
+        drain_mask = ~np.isfinite(z_center)
+        with np.errstate(invalid='ignore'):
+            for code, i, j in D8_DIRECTIONS:
+                drain_mask |= z_center > z_array[
+                    1 + i:rows + 1 + i, 1 + j:cols + 1 + j]
+        if not np.all(drain_mask[update_mask]):
+            logging.debug('    Flat cells changed, updating all cells')
+            return d8_flow_direction(new_array), rows * cols
+        del z_array, z_center, drain_mask
+
+    # A 2 cell buffer keeps the window edge away from the updated cells
+    update_rows, update_cols = np.nonzero(update_mask)
+    r_min = max(update_rows.min() - 2, 0)
+    r_max = min(update_rows.max() + 3, rows)
+    c_min = max(update_cols.min() - 2, 0)
+    c_max = min(update_cols.max() + 3, cols)
+    window_dir = d8_flow_direction(new_array[r_min:r_max, c_min:c_max])
+    output_array = flow_dir_array.copy()
+    window_mask = update_mask[r_min:r_max, c_min:c_max]
+    output_array[r_min:r_max, c_min:c_max][window_mask] = \
+        window_dir[window_mask]
+    return output_array, int(np.sum(update_mask))
+
+
+def downstream_index(flow_dir_array):
+    """Flat index of the downstream cell of each cell
+
+    Args:
+        flow_dir_array (np.array): D8 flow directions (0 is nodata)
+
+    Returns:
+        np.array: int64 flat indices (-1 if the cell is nodata or flows out
+            of the grid or into a nodata cell)
+    """
+    rows, cols = flow_dir_array.shape
+    flow_dir = flow_dir_array.ravel()
+    row_array, col_array = np.divmod(np.arange(flow_dir.size), cols)
+    down_array = np.empty(flow_dir.size, dtype=np.int64)
+    down_array.fill(-1)
+    for code, i, j in D8_DIRECTIONS:
+        cell_index = np.flatnonzero(flow_dir == code)
+        down_rows = row_array[cell_index] + i
+        down_cols = col_array[cell_index] + j
+        inside_mask = (
+            (down_rows >= 0) & (down_rows < rows) &
+            (down_cols >= 0) & (down_cols < cols))
+        down_array[cell_index[inside_mask]] = (
+            down_rows[inside_mask] * cols + down_cols[inside_mask])
+    down_mask = down_array >= 0
+    down_mask[down_mask] = flow_dir[down_array[down_mask]] > 0
+    down_array[~down_mask] = -1
+    return down_array
+
+
+def accumulate_downstream(down_array, weight_array, data_mask):
+    """Sum weights in the downstream direction in topological order
+
+    Cells are processed in topological order (Kahn's algorithm) so each
+    cell is only visited once and no recursion is needed.  All cells that
+    have no remaining upstream cells are processed together as a queue.
+
+    Args:
+        down_array (np.array): Flat index of the downstream cell
+            (-1 if there is no downstream cell)
+        weight_array (np.array): Weight of each cell
+        data_mask (np.array): Boolean array of the data cells
+
+    Returns:
+        np.array: Sum of the weights of the upstream cells (not including
+            the cell itself), float64
+    """
+    acc_array = np.zeros(data_mask.size, dtype=np.float64)
+    up_count = np.bincount(
+        down_array[down_array >= 0], minlength=data_mask.size)
+    cell_queue = np.flatnonzero(data_mask & (up_count == 0))
+    processed_count = 0
+    while cell_queue.size:
+        processed_count += cell_queue.size
+        cell_queue = cell_queue[down_array[cell_queue] >= 0]
+        # Sum the values flowing into each downstream cell
+        down_index, down_inverse = np.unique(
+            down_array[cell_queue], return_inverse=True)
+        acc_array[down_index] += np.bincount(
+            down_inverse,
+            weights=acc_array[cell_queue] + weight_array[cell_queue])
+        up_count[down_index] -= np.bincount(down_inverse)
+        cell_queue = down_index[up_count[down_index] == 0]
+
+    loop_count = int(np.sum(data_mask)) - processed_count
+    if loop_count:
+        logging.warning(
+            '    {} cells are in flow direction loops'.format(loop_count))
+    return acc_array
+
+
+def flow_accumulation(flow_dir_array, weight_array=None):
+    """Calculate flow accumulation (like arcpy.sa.FlowAccumulation)
+
+    Args:
+        flow_dir_array (np.array): D8 flow directions (0 is nodata)
+        weight_array (np.array): Optional weight of each cell
+            (NaN weights are 0), by default each cell has a weight of 1
+
+    Returns:
+        np.array: Accumulated weight of the upstream cells (not including
+            the cell itself) with the same shape as flow_dir_array
+            (float64, NaN for nodata cells)
+    """
+    data_mask = flow_dir_array.ravel() > 0
+    down_array = downstream_index(flow_dir_array)
+    if weight_array is None:
+        weight = data_mask.astype(np.float64)
+    else:
+        weight = np.nan_to_num(weight_array.ravel().astype(np.float64))
+    acc_array = accumulate_downstream(down_array, weight, data_mask)
+    acc_array[~data_mask] = np.nan
+    return acc_array.reshape(flow_dir_array.shape)
+
+
+def stream_links(stream_mask, flow_dir_array):
+    """Label the stream links (like arcpy.sa.StreamLink)
+
+    A new link starts at each stream source cell and at each cell
+    below a junction (a cell with two or more upstream stream cells).
+
+    Args:
+        stream_mask (np.array): Boolean array of the stream cells
+        flow_dir_array (np.array): D8 flow directions (0 is nodata)
+
+    Returns:
+        tuple: int64 array of the link IDs (0 for non-stream cells) and
+            an int64 array of the downstream link ID of each link
+            (indexed by link ID, 0 if the link exits the stream network)
+    """
+    stream_flat = stream_mask.ravel() & (flow_dir_array.ravel() > 0)
+    down_array = downstream_index(flow_dir_array)
+    down_mask = stream_flat & (down_array >= 0)
+    down_mask[down_mask] = stream_flat[down_array[down_mask]]
+    down_array[~down_mask] = -1
+    up_count = np.bincount(down_array[down_mask], minlength=stream_flat.size)
+
+    # Number the links in raster order of their first cell
+    head_index = np.flatnonzero(stream_flat & (up_count != 1))
+    link_array = np.zeros(stream_flat.size, dtype=np.int64)
+    link_array[head_index] = np.arange(1, head_index.size + 1)
+
+    # Carry each link ID downstream until the next junction
+    cell_queue = head_index
+    while cell_queue.size:
+        next_index = down_array[cell_queue]
+        next_mask = next_index >= 0
+        next_mask[next_mask] = (
+            (up_count[next_index[next_mask]] == 1) &
+            (link_array[next_index[next_mask]] == 0))
+        link_array[next_index[next_mask]] = link_array[cell_queue[next_mask]]
+        cell_queue = next_index[next_mask]
+
+    # The last cell of each link flows into the downstream link
+    link_down = np.zeros(head_index.size + 1, dtype=np.int64)
+    last_mask = stream_flat & (link_array > 0)
+    last_mask[down_mask] &= up_count[down_array[down_mask]] != 1
+    last_index = np.flatnonzero(last_mask)
+    last_down = down_array[last_index]
+    link_down[link_array[last_index]] = np.where(
+        last_down >= 0, link_array[np.maximum(last_down, 0)], 0)
+    return link_array.reshape(flow_dir_array.shape), link_down
+
+
+def shreve_order(link_down):
+    """Shreve stream order of each link (like arcpy.sa.StreamOrder)
+
+    Args:
+        link_down (np.array): Downstream link ID of each link
+            (see stream_links())
+
+    Returns:
+        np.array: int64 stream order indexed by link ID (0 for index 0)
+    """
+    # Links with no upstream links (sources) have an order of 1
+    up_count = np.bincount(link_down[1:], minlength=link_down.size)[1:]
+    source_weight = (up_count == 0).astype(np.float64)
+    # Link IDs are shifted to 0 based indices for the accumulation
+    order_array = accumulate_downstream(
+        link_down[1:] - 1, source_weight,
+        np.ones(source_weight.size, dtype=np.bool))
+    return np.concatenate(
+        [[0], (order_array + source_weight).astype(np.int64)])
@@ -0,0 +1,462 @@
+#--------------------------------
+# Name:         polygon_functions.py
+# Purpose:      GSFLOW NumPy polygon/grid functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import numpy as np
+
+
+def ring_edges(ring_list):
+    """Edge start and end coordinates of a list of polygon rings
+
+    Rings are closed (last point connected to the first) if necessary.
+
+    Args:
+        ring_list (list): Rings as (n x 2) arrays or lists of x, y points
+
+    Returns:
+        tuple: x0, y0, x1, y1 edge coordinate arrays
+    """
+    edge_list = []
+    for ring in ring_list:
+        ring_array = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+        if ring_array.shape[0] < 3:
+            continue
+        edge_list.append(np.hstack(
+            [ring_array, np.roll(ring_array, -1, axis=0)]))
+    if not edge_list:
+        return tuple(np.empty(0, dtype=np.float64) for i in range(4))
+    edge_array = np.vstack(edge_list)
+    return tuple(edge_array[:, i] for i in range(4))
+
+
+def rasterize_polygon(ring_list, xmin, ymax, cs, rows, cols):
+    """Flag grid cells with a center inside a polygon
+
+    Args:
+        ring_list (list): Polygon rings (exterior and interior)
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+
+    Returns:
+        np.array: Boolean array with shape (rows, cols)
+    """
+    output_array = np.zeros((rows, cols), dtype=np.bool)
+    row_min, row_mask = polygon_row_mask(
+        ring_list, xmin, ymax, cs, rows, cols)
+    output_array[row_min:row_min + row_mask.shape[0]] = row_mask
+    return output_array
+
+
+def polygon_row_mask(ring_list, xmin, ymax, cs, rows, cols):
+    """Flag grid cells with a center inside a polygon (scanline fill)
+
+    Each row of cell centers is a scanline.  The x coordinates where the
+    polygon edges cross the scanlines are computed all at once, sorted
+    by row, and each pair of crossings is a span of cells that are inside
+    the polygon (even-odd rule, so interior rings are holes).  Cell
+    centers on a left or bottom edge are inside, centers on a right or
+    top edge are not.
+
+    Args:
+        ring_list (list): Polygon rings (exterior and interior)
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+
+    Returns:
+        tuple: First row and boolean array of the rows that intersect the
+            polygon (with shape (polygon rows, cols))
+    """
+    x0, y0, x1, y1 = ring_edges(ring_list)
+
+    # Skip horizontal edges (they don't cross a scanline)
+    edge_mask = y0 != y1
+    x0, y0 = x0[edge_mask], y0[edge_mask]
+    x1, y1 = x1[edge_mask], y1[edge_mask]
+
+    # Rows of the scanlines that cross each edge (ye_min <= y < ye_max)
+    #   Row center y = ymax - (row + 0.5) * cs
+    ye_min = np.minimum(y0, y1)
+    ye_max = np.maximum(y0, y1)
+    row_start = np.floor((ymax - ye_max) / cs - 0.5).astype(np.int64) + 1
+    row_end = np.floor((ymax - ye_min) / cs - 0.5).astype(np.int64) + 1
+    row_start = np.clip(row_start, 0, rows)
+    row_end = np.clip(row_end, 0, rows)
+    row_counts = row_end - row_start
+    if not np.any(row_counts > 0):
+        return 0, np.zeros((0, cols), dtype=np.bool)
+    row_min = int(np.min(row_start[row_counts > 0]))
+    row_max = int(np.max(row_end[row_counts > 0]))
+
+    # Expand the edges to one crossing per scanline
+    edge_i = np.repeat(np.arange(row_counts.size), row_counts)
+    cross_rows = (
+        np.arange(edge_i.size) -
+        np.repeat(np.cumsum(row_counts) - row_counts, row_counts) +
+        row_start[edge_i])
+    cross_y = ymax - (cross_rows + 0.5) * cs
+    cross_x = x0[edge_i] + (cross_y - y0[edge_i]) * (
+        (x1[edge_i] - x0[edge_i]) / (y1[edge_i] - y0[edge_i]))
+
+    # Consecutive crossings in each row are the span start and end
+    sort_i = np.lexsort((cross_x, cross_rows))
+    cross_rows = cross_rows[sort_i][::2]
+    cross_x = cross_x[sort_i].reshape(-1, 2)
+
+    # First (inclusive) and last (exclusive) column of each span
+    #   Column center x = xmin + (col + 0.5) * cs
+    col_start = np.clip(np.ceil(
+        (cross_x[:, 0] - xmin) / cs - 0.5).astype(np.int64), 0, cols)
+    col_end = np.clip(np.ceil(
+        (cross_x[:, 1] - xmin) / cs - 0.5).astype(np.int64), 0, cols)
+
+    # Spans don't overlap within a row, so a running sum of the span
+    #   starts and ends flags the cells inside the polygon
+    span_array = np.zeros((row_max - row_min, cols + 1), dtype=np.int32)
+    np.add.at(span_array, (cross_rows - row_min, col_start), 1)
+    np.add.at(span_array, (cross_rows - row_min, col_end), -1)
+    return row_min, np.cumsum(span_array, axis=1)[:, :-1] > 0
+
+
+def rasterize_polygons(polygon_list, value_list, xmin, ymax, cs, rows, cols,
+                       nodata_value=0):
+    """Rasterize polygon values to the grid cell centers
+
+    Polygons are rasterized in order, so where polygons overlap the value
+    of the later polygon is used.
+
+    Args:
+        polygon_list (list): Polygons as lists of rings
+            (see rasterize_polygon())
+        value_list (list): Value of each polygon
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+        nodata_value: Value of the cells that are not in a polygon
+
+    Returns:
+        tuple: value array and boolean array of the cells in a polygon,
+            both with shape (rows, cols)
+    """
+    value_array = np.full(
+        (rows, cols), nodata_value, dtype=np.asarray(value_list).dtype)
+    value_mask = np.zeros((rows, cols), dtype=np.bool)
+    for ring_list, value in zip(polygon_list, value_list):
+        row_min, row_mask = polygon_row_mask(
+            ring_list, xmin, ymax, cs, rows, cols)
+        row_slice = slice(row_min, row_min + row_mask.shape[0])
+        value_array[row_slice][row_mask] = value
+        value_mask[row_slice] |= row_mask
+    return value_array, value_mask
+
+
+def edge_pieces(u0, v0, u1, v1):
+    """Split edges (in grid units) at every grid line
+
+    Each piece is in a single cell.  The piece area is the area between
+    the piece and the bottom of its cell, so the area of a polygon in a
+    cell is the sum of the areas of the pieces in the cell plus the sum of
+    the widths of the pieces above it in the same column (Green's theorem).
+
+    Args:
+        u0 (ndarray): Edge start column coordinates
+        v0 (ndarray): Edge start row coordinates
+        u1 (ndarray): Edge end column coordinates
+        v1 (ndarray): Edge end row coordinates
+
+    Returns:
+        tuple: edge index, row, column, signed width and signed area
+            arrays of the pieces
+    """
+    t_list = [np.zeros(u0.size), np.ones(u0.size)]
+    i_list = [np.arange(u0.size), np.arange(u0.size)]
+    for a0, a1 in [(u0, u1), (v0, v1)]:
+        line_min = np.floor(np.minimum(a0, a1)).astype(np.int64) + 1
+        line_max = np.ceil(np.maximum(a0, a1)).astype(np.int64) - 1
+        line_counts = np.maximum(line_max - line_min + 1, 0)
+        edge_i = np.repeat(np.arange(u0.size), line_counts)
+        lines = (
+            np.arange(edge_i.size) -
+            np.repeat(np.cumsum(line_counts) - line_counts, line_counts) +
+            line_min[edge_i])
+        t_list.append((lines - a0[edge_i]) / (a1[edge_i] - a0[edge_i]))
+        i_list.append(edge_i)
+    t_array = np.concatenate(t_list)
+    edge_i = np.concatenate(i_list)
+    sort_i = np.lexsort((t_array, edge_i))
+    t_array, edge_i = t_array[sort_i], edge_i[sort_i]
+
+    # Pieces between consecutive split points of the same edge
+    piece_mask = edge_i[:-1] == edge_i[1:]
+    ta, tb = t_array[:-1][piece_mask], t_array[1:][piece_mask]
+    edge_i = edge_i[:-1][piece_mask]
+    du = u1[edge_i] - u0[edge_i]
+    dv = v1[edge_i] - v0[edge_i]
+    ua, ub = u0[edge_i] + ta * du, u0[edge_i] + tb * du
+    va, vb = v0[edge_i] + ta * dv, v0[edge_i] + tb * dv
+    piece_cols = np.floor(0.5 * (ua + ub)).astype(np.int64)
+    piece_rows = np.floor(0.5 * (va + vb)).astype(np.int64)
+    piece_du = ub - ua
+    piece_area = piece_du * (piece_rows + 1 - 0.5 * (va + vb))
+    return edge_i, piece_rows, piece_cols, piece_du, piece_area
+
+
+def polygon_coverage(ring_list, xmin, ymax, cs, rows, cols):
+    """Fraction of each grid cell that is covered by a polygon
+
+    The area of the polygon in a cell is computed exactly with Green's
+    theorem: the polygon edges are split at every grid line so each
+    piece is in a single cell, each piece adds its area (to the bottom
+    of the cell) to its own cell and its width to every cell below it in
+    the same column (a running sum down the column).  Only the cells in
+    the polygon bounding box are visited, so the cost is proportional to
+    the perimeter (number of pieces) plus the covered cells.
+
+    Ring orientation is not assumed, but the exterior and interior rings
+    must have opposite orientations (as in shapefiles).
+
+    Args:
+        ring_list (list): Polygon rings (exterior and interior)
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+
+    Returns:
+        tuple: flat cell index (row * cols + col) and fraction arrays of
+            the cells that are (at least partially) covered
+    """
+    x0, y0, x1, y1 = ring_edges(ring_list)
+
+    # Grid units (cell (row, col) is [col, col + 1] x [row, row + 1])
+    u0, u1 = (x0 - xmin) / cs, (x1 - xmin) / cs
+    v0, v1 = (ymax - y0) / cs, (ymax - y1) / cs
+    edge_mask = (u0 != u1) | (v0 != v1)
+    u0, u1, v0, v1 = u0[edge_mask], u1[edge_mask], v0[edge_mask], v1[edge_mask]
+    empty_array = np.empty(0, dtype=np.int64)
+    if not u0.size:
+        return empty_array, np.empty(0, dtype=np.float64)
+
+    # Bounding box of the polygon in the grid
+    row_min = max(int(np.floor(min(v0.min(), v1.min()))), 0)
+    row_max = min(int(np.ceil(max(v0.max(), v1.max()))), rows)
+    col_min = max(int(np.floor(min(u0.min(), u1.min()))), 0)
+    col_max = min(int(np.ceil(max(u0.max(), u1.max()))), cols)
+    if row_min >= row_max or col_min >= col_max:
+        return empty_array, np.empty(0, dtype=np.float64)
+
+    # Split the edges at the grid lines
+    edge_i, piece_rows, piece_cols, piece_du, piece_area = edge_pieces(
+        u0, v0, u1, v1)
+
+    # Columns outside the grid don't change the grid cells
+    # Pieces above the grid add their width to the first grid row and
+    #   pieces below the grid don't change the grid cells
+    piece_mask = (piece_cols >= col_min) & (piece_cols < col_max)
+    piece_cols = piece_cols[piece_mask] - col_min
+    piece_rows = piece_rows[piece_mask] - row_min
+    piece_du = piece_du[piece_mask]
+    piece_area = piece_area[piece_mask]
+    box_rows, box_cols = row_max - row_min, col_max - col_min
+    area_array = np.zeros((box_rows + 1, box_cols), dtype=np.float64)
+    width_array = np.zeros((box_rows + 1, box_cols), dtype=np.float64)
+    cell_mask = (piece_rows >= 0) & (piece_rows < box_rows)
+    np.add.at(
+        area_array, (piece_rows[cell_mask], piece_cols[cell_mask]),
+        piece_area[cell_mask])
+    np.add.at(
+        width_array,
+        (np.clip(piece_rows + 1, 0, box_rows), piece_cols), piece_du)
+    area_array = (area_array + np.cumsum(width_array, axis=0))[:-1]
+
+    # Signed area is negative if the exterior ring is clockwise
+    #   (in grid units, which flip the y axis)
+    if np.sum(u0 * v1 - u1 * v0) < 0:
+        area_array *= -1
+    area_array = np.clip(area_array, 0, 1)
+
+    box_rows, box_cols = np.nonzero(area_array > 1E-12)
+    cell_array = (box_rows + row_min) * cols + box_cols + col_min
+    return cell_array, area_array[box_rows, box_cols]
+
+
+def zone_coverage(polygon_list, value_list, xmin, ymax, cs, rows, cols):
+    """Sparse table of the grid cell fractions covered by each zone
+
+    Polygons with the same zone value are combined, so the fraction of a
+    cell is the total fraction covered by that zone (this assumes the
+    polygons of a zone don't overlap).
+
+    Args:
+        polygon_list (list): Polygons as lists of rings
+            (see rasterize_polygon())
+        value_list (list): Zone value of each polygon
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+
+    Returns:
+        tuple: flat cell index (row * cols + col), zone value and fraction
+            arrays, sorted by cell and zone
+    """
+    zone_values, zone_index = np.unique(
+        np.asarray(value_list), return_inverse=True)
+    cell_list, zone_list, fraction_list = [], [], []
+    for ring_list, zone_i in zip(polygon_list, zone_index):
+        cell_array, fraction_array = polygon_coverage(
+            ring_list, xmin, ymax, cs, rows, cols)
+        cell_list.append(cell_array)
+        zone_list.append(np.full(cell_array.size, zone_i, dtype=np.int64))
+        fraction_list.append(fraction_array)
+    if not cell_list:
+        return (np.empty(0, dtype=np.int64), zone_values[:0],
+                np.empty(0, dtype=np.float64))
+
+    # Sum the fractions of each cell and zone
+    key_array = (
+        np.concatenate(cell_list) * max(zone_values.size, 1) +
+        np.concatenate(zone_list))
+    key_array, key_index = np.unique(key_array, return_inverse=True)
+    fraction_array = np.bincount(
+        key_index, weights=np.concatenate(fraction_list))
+    return (key_array // max(zone_values.size, 1),
+            zone_values[key_array % max(zone_values.size, 1)],
+            np.minimum(fraction_array, 1))
+
+
+def polygon_weights(x_array, y_array, xmin, ymax, cs, rows, cols,
+                    chunk_size=10000):
+    """Sparse matrix of the grid cell areas covered by many small polygons
+
+    This is polygon_coverage() for a large number of small single ring
+    polygons (i.e. model cells projected to the grid of a source raster).
+    The polygons are processed in chunks and the areas are summed in the
+    bounding box of each polygon, so the cost is proportional to the number
+    of polygons times the largest bounding box.
+
+    Args:
+        x_array (ndarray): Polygon vertex x coordinates (polygons x vertices)
+        y_array (ndarray): Polygon vertex y coordinates (polygons x vertices)
+        xmin (float): Grid x minimum
+        ymax (float): Grid y maximum
+        cs (float): Grid cellsize
+        rows (int): Number of grid rows
+        cols (int): Number of grid columns
+        chunk_size (int): Number of polygons per chunk
+
+    Returns:
+        tuple: CSR index pointer, flat cell index (row * cols + col) and
+            area (in cells) arrays, the row of the matrix is the polygon
+    """
+    u_array = (np.asarray(x_array, dtype=np.float64) - xmin) / cs
+    v_array = (ymax - np.asarray(y_array, dtype=np.float64)) / cs
+    indptr_list = [np.zeros(1, dtype=np.int64)]
+    index_list, area_list = [], []
+    for chunk_i in range(0, u_array.shape[0], chunk_size):
+        u = u_array[chunk_i:chunk_i + chunk_size]
+        v = v_array[chunk_i:chunk_i + chunk_size]
+        poly_count, vertex_count = u.shape
+
+        # Bounding box of each polygon in the grid
+        # Edges on the last grid line are put in the next row/column
+        #   (by edge_pieces()), so the box includes it
+        row_min = np.floor(v.min(axis=1)).astype(np.int64)
+        col_min = np.floor(u.min(axis=1)).astype(np.int64)
+        box_rows = int(
+            (np.floor(v.max(axis=1)).astype(np.int64) - row_min).max()) + 1
+        box_cols = int(
+            (np.floor(u.max(axis=1)).astype(np.int64) - col_min).max()) + 1
+
+        # Edges of all the polygons in the chunk
+        u0, u1 = u.ravel(), np.roll(u, -1, axis=1).ravel()
+        v0, v1 = v.ravel(), np.roll(v, -1, axis=1).ravel()
+        poly_i = np.repeat(np.arange(poly_count), vertex_count)
+        edge_mask = (u0 != u1) | (v0 != v1)
+        edge_i, piece_rows, piece_cols, piece_du, piece_area = edge_pieces(
+            u0[edge_mask], v0[edge_mask], u1[edge_mask], v1[edge_mask])
+        piece_poly = poly_i[edge_mask][edge_i]
+        piece_rows = piece_rows - row_min[piece_poly]
+        piece_cols = piece_cols - col_min[piece_poly]
+
+        area_array = np.zeros(
+            (poly_count, box_rows + 1, box_cols), dtype=np.float64)
+        width_array = np.zeros(
+            (poly_count, box_rows + 1, box_cols), dtype=np.float64)
+        np.add.at(
+            area_array, (piece_poly, piece_rows, piece_cols), piece_area)
+        np.add.at(
+            width_array, (piece_poly, piece_rows + 1, piece_cols), piece_du)
+        area_array = (area_array + np.cumsum(width_array, axis=1))[:, :-1]
+
+        # Signed area is negative if the polygon is clockwise
+        #   (in grid units, which flip the y axis)
+        sign_array = np.where(np.sum(
+            u * np.roll(v, -1, axis=1) - np.roll(u, -1, axis=1) * v,
+            axis=1) < 0, -1, 1)
+        area_array *= sign_array[:, np.newaxis, np.newaxis]
+        area_array = np.clip(area_array, 0, 1)
+
+        # Cells outside the grid are dropped
+        poly_i, box_r, box_c = np.nonzero(area_array > 1E-12)
+        cell_rows = box_r + row_min[poly_i]
+        cell_cols = box_c + col_min[poly_i]
+        cell_mask = (
+            (cell_rows >= 0) & (cell_rows < rows) &
+            (cell_cols >= 0) & (cell_cols < cols))
+        poly_i = poly_i[cell_mask]
+        index_list.append(cell_rows[cell_mask] * cols + cell_cols[cell_mask])
+        area_list.append(area_array[
+            poly_i, box_r[cell_mask], box_c[cell_mask]])
+        indptr_list.append(indptr_list[-1][-1] + np.cumsum(
+            np.bincount(poly_i, minlength=poly_count)))
+    if not index_list:
+        return (indptr_list[0], np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float64))
+    return (np.concatenate(indptr_list), np.concatenate(index_list),
+            np.concatenate(area_list))
+
+
+def weighted_mean(indptr, index_array, weight_array, value_array):
+    """Weighted mean of the values for each row of a sparse (CSR) matrix
+
+    Values that are NaN (nodata) are skipped, the weights of the other
+    values in the row are used.
+
+    Args:
+        indptr (ndarray): CSR index pointer
+        index_array (ndarray): CSR column (value) indices
+        weight_array (ndarray): CSR weights
+        value_array (ndarray): Values (flat)
+
+    Returns:
+        tuple: weighted mean (NaN if there are no values) and the sum of
+            the weights of the values for each row
+    """
+    row_count = indptr.size - 1
+    row_array = np.repeat(np.arange(row_count), np.diff(indptr))
+    values = np.ravel(value_array)[index_array]
+    value_mask = np.isfinite(values)
+    weight_sum = np.bincount(
+        row_array[value_mask], weights=weight_array[value_mask],
+        minlength=row_count)
+    value_sum = np.bincount(
+        row_array[value_mask],
+        weights=weight_array[value_mask] * values[value_mask],
+        minlength=row_count)
+    mean_array = np.full(row_count, np.nan, dtype=np.float64)
+    weight_mask = weight_sum > 0
+    mean_array[weight_mask] = value_sum[weight_mask] / weight_sum[weight_mask]
+    return mean_array, weight_sum
@@ -6,7 +6,6 @@
 #--------------------------------
 
 import argparse
-from collections import defaultdict
 import ConfigParser
 import datetime as dt
 import logging
@@ -15,6 +14,7 @@ import sys
 
 import arcpy
 from arcpy import env
+import numpy as np
 
 import support_functions as support
 
@@ -367,44 +367,45 @@ def ppt_ratio_parameters(config_path):
 
     # Calculate ratios
     logging.info('\nCalculating mean monthly PPT ratios')
+    hru_table = support.HRUTable(
+        hru, [hru.ppt_zone_id_field] + ppt_field_list + ratio_field_list)
+    ppt_array = np.column_stack(
+        [hru_table[f].astype(np.float64) for f in ppt_field_list])
+
     if set_ppt_zones_flag:
         # Read mean monthly values for each zone
-        ppt_obs_dict = dict()
         ppt_obs_field_list = [
             ppt_obs_field_format.format(m) for m in month_list]
         fields = [ppt_zone_id_field] + ppt_obs_field_list
         logging.debug('  Obs. Fields: {}'.format(', '.join(fields)))
-
+        ppt_obs_dict = dict()
         with arcpy.da.SearchCursor(ppt_zone_path, fields) as s_cursor:
             for row in s_cursor:
                 ppt_obs_dict[int(row[0])] = map(float, row[1:13])
-
-        # Convert values to mm if necessary to match PRISM
-        if units_factor != 1:
-            ppt_obs_dict = {z: p * units_factor for z, p in ppt_obs_dict}
-
         ppt_zone_list = sorted(ppt_obs_dict.keys())
         logging.debug('  PPT Zones: {}'.format(ppt_zone_list))
 
+        # Convert values to mm if necessary to match PRISM
+        # Zone arrays are in ppt_zone_list order
+        ppt_obs_array = units_factor * np.array(
+            [ppt_obs_dict[z] for z in ppt_zone_list], dtype=np.float64)
+        del ppt_obs_dict
+
         # Print the observed PPT values
         logging.debug('  Observed PPT')
-        for zone, ppt_obs in ppt_obs_dict.items():
+        for zone, ppt_obs in zip(ppt_zone_list, ppt_obs_array):
             logging.debug('    {}: {}'.format(
                 zone, ', '.join(['{:.2f}'.format(x) for x in ppt_obs])))
 
-        # Default all zones to a ratio of 1
-        ppt_ratio_dict = {z: [1] * 12 for z in ppt_zone_list}
+        # Index of each HRU's zone in the zone arrays (-1 if not a zone)
+        hru_zone_array = hru_table[hru.ppt_zone_id_field].astype(np.int64)
+        zone_index = support.sorted_index(ppt_zone_list, hru_zone_array)
 
-        # Get list of HRU_IDs for each zone
-        fields = [hru.ppt_zone_id_field, hru.id_field]
-        zone_hru_id_dict = defaultdict(list)
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as s_cursor:
-            for row in s_cursor:
-                zone_hru_id_dict[int(row[0])].append(int(row[1]))
+        # Default all zones to a ratio of 1
+        ppt_adjust_array = np.ones(ppt_obs_array.shape, dtype=np.float64)
 
         # Check that PPT_HRU_IDs are in the correct zone
-        # Default all PPT Zone HRU IDs to 0
-        ppt_hru_id_dict = {z: 0 for z in ppt_zone_list}
+        # Ratio of the observed to the gridded PPT at the PPT_HRU_ID
         if ppt_hru_id_field is not None:
             fields = [ppt_zone_id_field, ppt_hru_id_field]
             logging.debug('  PPT Zone ID field: {}'.format(ppt_zone_id_field))
@@ -413,106 +414,127 @@ def ppt_ratio_parameters(config_path):
                 for row in s_cursor:
                     ppt_zone = int(row[0])
                     hru_id = int(row[1])
-                    if hru_id == 0 or hru_id in zone_hru_id_dict[ppt_zone]:
-                        ppt_hru_id_dict[ppt_zone] = hru_id
-                        logging.debug('    {}: {}'.format(ppt_zone, hru_id))
-                    else:
+                    if hru_id == 0:
+                        continue
+                    hru_i = support.sorted_index(hru_table.id_array, hru_id)
+                    if hru_i < 0 or hru_zone_array[hru_i] != ppt_zone:
                         logging.error(
                             '\nERROR: HRU_ID {} is not in PPT ZONE {}'.format(
-                                hru_id, ppt_hru_id_dict[ppt_zone]))
+                                hru_id, ppt_zone))
                         sys.exit()
-
-        # Get gridded PPT values for each PPT_HRU_ID
-        fields = [hru.ppt_zone_id_field, hru.id_field] + ppt_field_list
-        # ppt_ratio_dict = dict()
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as s_cursor:
-            for row in s_cursor:
-                ppt_zone = int(row[0])
-                hru_id = int(row[1])
-                if hru_id == 0:
-                    pass
-                elif hru_id in ppt_hru_id_dict.values():
-                    ppt_gridded_list = map(float, row[2:14])
-                    ppt_obs_list = ppt_obs_dict[ppt_zone]
-                    ppt_ratio_list = [
-                        float(o) / p if p > 0 else 0
-                        for o, p in zip(ppt_obs_list, ppt_gridded_list)]
-                    ppt_ratio_dict[ppt_zone] = ppt_ratio_list
-        del ppt_hru_id_dict, zone_hru_id_dict, fields
+                    logging.debug('    {}: {}'.format(ppt_zone, hru_id))
+                    zone_i = ppt_zone_list.index(ppt_zone)
+                    ppt_adjust_array[zone_i] = ppt_adjust_func(
+                        ppt_obs_array[zone_i], ppt_array[hru_i])
 
         logging.debug('  PPT Ratio Adjustment Factors:')
-        for k, v in ppt_ratio_dict.items():
+        for zone, ppt_adjust in zip(ppt_zone_list, ppt_adjust_array):
             logging.debug('    {}: {}'.format(
-                k, ', '.join(['{:.3f}'.format(x) for x in v])))
-
-        # DEADBEEF - ZONE_VALUE is calculated in zone_by_centroid_func
-        # There is probably a cleaner way of linking these two
-        fields = [hru.ppt_zone_id_field] + ppt_field_list + ratio_field_list
-        with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-            for row in u_cursor:
-                ppt_zone = int(row[0])
-                for i, month in enumerate(month_list):
-                    ppt_i = fields.index(ppt_field_format.format(month))
-                    ratio_i = fields.index(ratio_field_format.format(month))
-
-                    if ppt_zone in ppt_zone_list:
-                        ppt_obs = ppt_obs_dict[ppt_zone][i]
-                    else:
-                        ppt_obs = 0
-
-                    if ppt_obs > 0:
-                        row[ratio_i] = (
-                            ppt_ratio_dict[ppt_zone][i] * row[ppt_i] / ppt_obs)
-                    else:
-                        row[ratio_i] = 0
-                u_cursor.updateRow(row)
-            del row
+                zone, ', '.join(['{:.3f}'.format(x) for x in ppt_adjust])))
     else:
-        # Get gridded precip at PPT_HRU_ID
-        fields = [hru.id_field] + ppt_field_list
-        logging.debug('  Fields: {}'.format(', '.join(ppt_field_list)))
-
         # Convert values to mm if necessary to match PRISM
+        ppt_obs_array = units_factor * np.array(
+            [ppt_obs_list], dtype=np.float64)
         if units_factor != 1:
-            ppt_obs_list = [p * units_factor for p in ppt_obs_list]
             logging.debug(
                 '\nConverted Mean Monthly PPT ({}):\n  {}'.format(
-                    ppt_obs_units, ', '.join(map(str, ppt_obs_list))))
+                    ppt_obs_units, ', '.join(map(str, ppt_obs_array[0]))))
 
         # Scale all ratios so gridded PPT will match observed PPT at target cell
         if ppt_hru_id != 0:
-            ppt_gridded_list = map(float, arcpy.da.SearchCursor(
-                hru.polygon_path, fields,
-                '"{}" = {}'.format(hru.id_field, ppt_hru_id)).next()[1:])
+            hru_i = support.sorted_index(hru_table.id_array, ppt_hru_id)
+            if hru_i < 0:
+                logging.error(
+                    '\nERROR: PPT_HRU_ID {} is not in the fishnet'.format(
+                        ppt_hru_id))
+                sys.exit()
+            ppt_gridded_array = ppt_array[hru_i]
             logging.info('  Gridded PPT: {}'.format(
-                ', '.join(['{:.2f}'.format(p) for p in ppt_gridded_list])))
+                ', '.join(['{:.2f}'.format(p) for p in ppt_gridded_array])))
 
             # Ratio of MEASURED or OBSERVED PPT to GRIDDED PPT
             # This will be multiplied by GRIDDED/OBSERVED below
-            ppt_ratio_list = [
-                float(o) / p if p > 0 else 0
-                for o, p in zip(ppt_obs_list, ppt_gridded_list)]
+            ppt_adjust_array = ppt_adjust_func(
+                ppt_obs_array, ppt_gridded_array)
             logging.info('  Obs./Gridded: {}'.format(
-                ', '.join(['{:.3f}'.format(p) for p in ppt_ratio_list])))
+                ', '.join(['{:.3f}'.format(p) for p in ppt_adjust_array[0]])))
         else:
-            ppt_ratio_list = [1 for p in ppt_obs_list]
+            ppt_adjust_array = np.ones(ppt_obs_array.shape, dtype=np.float64)
 
         # Use single mean monthly PPT for all cells
         # Assume ppt_obs_list is in month order
-        fields = ppt_field_list + ratio_field_list
-        with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-            for row in u_cursor:
-                for i, month in enumerate(month_list):
-                    ppt_i = fields.index(ppt_field_format.format(month))
-                    ratio_i = fields.index(ratio_field_format.format(month))
-
-                    if ppt_obs_list[i] > 0:
-                        row[ratio_i] = (
-                            ppt_ratio_list[i] * row[ppt_i] / ppt_obs_list[i])
-                    else:
-                        row[ratio_i] = 0
-                u_cursor.updateRow(row)
-            del row
+        zone_index = np.zeros(hru_table.count, dtype=np.int64)
+
+    # Compute all of the ratios at once and write them in a single pass
+    ppt_ratio_array = ppt_ratio_func(
+        ppt_array, ppt_obs_array, ppt_adjust_array, zone_index)
+    for i, ratio_field in enumerate(ratio_field_list):
+        hru_table[ratio_field] = ppt_ratio_array[:, i]
+    hru_table.flush()
+    del hru_table, ppt_array, ppt_ratio_array
+
+
+def ppt_adjust_func(ppt_obs_array, ppt_gridded_array):
+    """Ratio of the observed to the gridded PPT (0 if gridded PPT is 0)
+
+    Parameters
+    ----------
+    ppt_obs_array : np.array
+        Observed mean monthly PPT.
+    ppt_gridded_array : np.array
+        Gridded mean monthly PPT at the station HRU.
+
+    Returns
+    -------
+    np.array
+
+    """
+    ppt_obs_array, ppt_gridded_array = np.broadcast_arrays(
+        np.asarray(ppt_obs_array, dtype=np.float64),
+        np.asarray(ppt_gridded_array, dtype=np.float64))
+    output_array = np.zeros(ppt_obs_array.shape, dtype=np.float64)
+    np.divide(
+        ppt_obs_array, ppt_gridded_array, out=output_array,
+        where=ppt_gridded_array > 0)
+    return output_array
+
+
+def ppt_ratio_func(ppt_array, ppt_obs_array, ppt_adjust_array, zone_index):
+    """Mean monthly PPT ratios of every HRU
+
+    Ratios are the gridded PPT divided by the observed PPT of the HRU's
+    zone, scaled by the zone adjustment factor (observed / gridded PPT at
+    the zone station HRU).  Ratios are 0 where the observed PPT is 0 or
+    the HRU is not in a zone.
+
+    Parameters
+    ----------
+    ppt_array : np.array
+        Gridded mean monthly PPT (HRUs x 12).
+    ppt_obs_array : np.array
+        Observed mean monthly PPT (zones x 12).
+    ppt_adjust_array : np.array
+        Zone adjustment factors (zones x 12).
+    zone_index : np.array
+        Zone array row of each HRU (-1 if the HRU is not in a zone).
+
+    Returns
+    -------
+    np.array: PPT ratios (HRUs x 12)
+
+    """
+    # Zone values are broadcast to the HRUs through the zone index
+    zone_mask = zone_index >= 0
+    hru_obs_array = np.zeros(ppt_array.shape, dtype=np.float64)
+    hru_obs_array[zone_mask] = ppt_obs_array[zone_index[zone_mask]]
+    hru_adjust_array = np.zeros(ppt_array.shape, dtype=np.float64)
+    hru_adjust_array[zone_mask] = ppt_adjust_array[zone_index[zone_mask]]
+
+    ppt_ratio_array = np.zeros(ppt_array.shape, dtype=np.float64)
+    np.divide(
+        hru_adjust_array * ppt_array, hru_obs_array, out=ppt_ratio_array,
+        where=hru_obs_array > 0)
+    return ppt_ratio_array
 
 
 def arg_parse():
@@ -98,19 +98,22 @@ def prism_800m_parameters(config_path, data_name='ALL'):
         logging.error(
             '\nERROR: PRISM folder ({}) does not exist'.format(prism_ws))
         sys.exit()
-    proj_method_list = ['BILINEAR', 'CUBIC', 'NEAREST']
+    proj_method_list = ['BILINEAR', 'CUBIC', 'NEAREST', 'WEIGHTS']
     if prism_proj_method.upper() not in proj_method_list:
         logging.error('\nERROR: PRISM projection method must be: {}'.format(
             ', '.join(proj_method_list)))
         sys.exit()
     logging.debug('  Projection method:    {}'.format(
         prism_proj_method.upper()))
+    # WEIGHTS averages the native rasters with a sparse HRU weight matrix
+    #   instead of projecting each raster (prism_cellsize is not used)
+    weights_flag = prism_proj_method.upper() == 'WEIGHTS'
 
     # Check other inputs
     if prism_cs <= 0:
         logging.error('\nERROR: PRISM cellsize must be greater than 0\n')
         sys.exit()
-    elif prism_cs > hru.cs:
+    elif prism_cs > hru.cs and not weights_flag:
         logging.warning(
             '\nWARNING: The "prism_cellsize" parameter should generally be '
             'set less than or equal \nto the fishnet cellsize.\n  '
@@ -204,6 +207,13 @@ def prism_800m_parameters(config_path, data_name='ALL'):
                 data_name.lower(), month)
             output_raster = os.path.join(output_ws, output_name)
 
+            zs_field = '{}_{}'.format(data_name, month)
+            if weights_flag:
+                # Native PRISM rasters are averaged after the loop
+                zs_prism_dict[zs_field] = [input_raster, 'MEAN']
+                del input_raster, output_raster, output_name, zs_field
+                continue
+
             # Set preferred transforms
             input_sr = arcpy.sa.Raster(input_raster).spatialReference
             transform_str = support.transform_func(hru.sr, input_sr)
@@ -223,7 +233,6 @@ def prism_800m_parameters(config_path, data_name='ALL'):
             #    input_sr)
 
             # Save parameters for calculating zonal stats
-            zs_field = '{}_{}'.format(data_name, month)
             zs_prism_dict[zs_field] = [output_raster, 'MEAN']
 
             # Cleanup
@@ -234,9 +243,13 @@ def prism_800m_parameters(config_path, data_name='ALL'):
         # arcpy.ClearEnvironment('extent')
 
         # Calculate zonal statistics
-        logging.info('\nCalculating PRISM zonal statistics')
-        support.zonal_stats_func(
-            zs_prism_dict, hru.polygon_path, hru.point_path, hru)
+        if weights_flag:
+            logging.info('\nCalculating PRISM weighted statistics')
+            support.weighted_stats_func(zs_prism_dict, hru)
+        else:
+            logging.info('\nCalculating PRISM zonal statistics')
+            support.zonal_stats_func(
+                zs_prism_dict, hru.polygon_path, hru.point_path, hru)
         del zs_prism_dict
 
     # Jensen-Haise Potential ET air temperature coefficient
@@ -0,0 +1,498 @@
+#--------------------------------
+# Name:         prms_param_functions.py
+# Purpose:      PRMS parameter file functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+from collections import OrderedDict
+import json
+import logging
+import mmap
+import os
+import threading
+
+import numpy as np
+
+
+# NumPy dtype and value format of each PRMS parameter type
+#   (1-integer, 2-float, 3-double, 4-string)
+# Floats are stored as doubles so the written values are not changed
+PARAM_DTYPES = {1: np.int32, 2: np.float64, 3: np.float64, 4: object}
+PARAM_FORMATS = {1: '%d', 2: '%f', 3: '%f', 4: '%s'}
+
+# Parameter file section titles and separator
+DIMEN_HEADER = '** Dimensions **'
+PARAM_HEADER = '** Parameters **'
+BREAK_STR = '####'
+
+# Parameter file output formats
+#   NPZ files are compressed NumPy archives with an array for each
+#   parameter and the header, dimensions and parameter attributes stored
+#   as a JSON string in the "__meta__" array
+OUTPUT_FORMATS = ['ASCII', 'NPZ']
+NPZ_META = '__meta__'
+
+
+def write_param_values(output_f, values, param_type, n=1,
+                       chunk_size=2 ** 16):
+    """Write the parameter values with n values per line
+
+    Values are formatted a chunk of lines at a time with a single string
+    format operation, which gives the same text as formatting each value
+    separately (i.e. '{:f}'.format(v)).
+
+    Args:
+        output_f (file): Open output file
+        values (np.array): Parameter values (written in Fortran order)
+        param_type (int): PRMS parameter type (1, 2, 3 or 4)
+        n (int): Number of values per line
+        chunk_size (int): Approximate number of values per chunk
+
+    Returns:
+        None
+    """
+    value_array = np.ravel(values, order='F')
+    value_fmt = PARAM_FORMATS[param_type]
+    line_fmt = ' '.join([value_fmt] * n) + '\n'
+    full_count = (value_array.size // n) * n
+    step = max(chunk_size // n, 1) * n
+    for i in range(0, full_count, step):
+        chunk_array = value_array[i:min(i + step, full_count)]
+        output_f.write(
+            (line_fmt * (chunk_array.size // n)) %
+            tuple(chunk_array.tolist()))
+
+    # Last (partial) line
+    if full_count < value_array.size:
+        chunk_array = value_array[full_count:]
+        output_f.write(
+            (' '.join([value_fmt] * chunk_array.size) + '\n') %
+            tuple(chunk_array.tolist()))
+
+
+def write_param_file(output_path, header_str, dimen_list, param_list,
+                     buffer_size=2 ** 22):
+    """Write dimensions and parameters to a PRMS parameter file
+
+    Dimensions with a size of None and parameters with values of None are
+    skipped, but the section titles are still written if the lists are
+    not empty.
+
+    Args:
+        output_path (str): Output parameter file path
+        header_str (str): File header (written first)
+        dimen_list (list): Dimension name and size tuples
+        param_list (list): Parameter tuples of the name, dimension names,
+            value count, type, values (NumPy array) and values per line
+        buffer_size (int): Output file buffer size in bytes
+
+    Returns:
+        None
+    """
+    with open(output_path, 'w', buffer_size) as output_f:
+        output_f.write(header_str + '\n')
+
+        # Write dimensions
+        if dimen_list:
+            output_f.write(DIMEN_HEADER + '\n')
+        for dimen_name, dimen_size in dimen_list:
+            if dimen_size is None:
+                continue
+            output_f.write('{}\n{}\n{}\n'.format(
+                BREAK_STR, dimen_name, dimen_size))
+
+        # Then write set parameters
+        if param_list:
+            output_f.write(PARAM_HEADER + '\n')
+        for name, dimen_names, value_count, param_type, values, n in \
+                param_list:
+            if values is None:
+                continue
+            output_f.write('\n'.join(
+                [BREAK_STR, name, str(len(dimen_names))] + dimen_names +
+                [str(value_count), str(param_type)]) + '\n')
+            write_param_values(output_f, values, param_type, n)
+
+
+def write_param_npz(output_path, header_str, dimen_list, param_list,
+                    compress_flag=True):
+    """Write dimensions and parameters to a NumPy archive (.npz)
+
+    Each parameter is stored as an array (with the parameter name) so
+    it can be loaded separately with np.load().  The header, dimensions
+    and parameter attributes are stored as a JSON string.
+    Dimensions and parameters are skipped the same as write_param_file().
+
+    Args:
+        output_path (str): Output NPZ file path
+        header_str (str): File header
+        dimen_list (list): Dimension name and size tuples
+        param_list (list): Parameter tuples (see write_param_file())
+        compress_flag (bool): If True, compress the arrays
+
+    Returns:
+        None
+    """
+    meta_dict = {'header': header_str, 'dimensions': [], 'parameters': []}
+    for dimen_name, dimen_size in dimen_list:
+        if dimen_size is None:
+            continue
+        meta_dict['dimensions'].append([dimen_name, int(dimen_size)])
+
+    array_dict = dict()
+    for name, dimen_names, value_count, param_type, values, n in \
+            param_list:
+        if values is None:
+            continue
+        meta_dict['parameters'].append({
+            'name': name, 'dimen_names': list(dimen_names),
+            'count': int(value_count), 'type': int(param_type),
+            'n': int(n)})
+        # String values are stored as fixed width strings (not objects)
+        #   so the archive can be loaded without pickle
+        if param_type == 4:
+            array_dict[name] = np.asarray(values).astype(str)
+        else:
+            array_dict[name] = np.asarray(values)
+    array_dict[NPZ_META] = np.array(json.dumps(meta_dict))
+
+    # Write to an open file so NumPy doesn't change the extension
+    with open(output_path, 'wb') as output_f:
+        if compress_flag:
+            np.savez_compressed(output_f, **array_dict)
+        else:
+            np.savez(output_f, **array_dict)
+
+
+def read_param_npz(npz_path):
+    """Read dimensions and parameters from a NumPy archive (.npz)
+
+    Args:
+        npz_path (str): NPZ file path (see write_param_npz())
+
+    Returns:
+        tuple: File header, dimension list and parameter list
+            (see write_param_file())
+    """
+    npz_f = np.load(npz_path)
+    try:
+        meta_dict = json.loads(str(npz_f[NPZ_META][()]))
+        dimen_list = [
+            (str(dimen_name), dimen_size)
+            for dimen_name, dimen_size in meta_dict['dimensions']]
+        param_list = []
+        for param in meta_dict['parameters']:
+            values = npz_f[param['name']]
+            if param['type'] == 4:
+                values = values.astype(object)
+            else:
+                values = values.astype(PARAM_DTYPES[param['type']])
+            param_list.append((
+                str(param['name']), [str(d) for d in param['dimen_names']],
+                param['count'], param['type'], values, param['n']))
+    finally:
+        npz_f.close()
+    return str(meta_dict['header']), dimen_list, param_list
+
+
+def read_param_file(param_path):
+    """Read dimensions and parameters from a PRMS parameter file
+
+    Parameters are reshaped (Fortran order) if all of the dimension sizes
+    are set in the file.
+
+    Args:
+        param_path (str): Parameter file path
+
+    Returns:
+        tuple: File header, dimension list and parameter list
+            (see write_param_file())
+    """
+    param_file = ParamFile(param_path)
+    param_list = []
+    for name, param in param_file.params.items():
+        values = param_file.read(name)
+        shape = [param_file.dimensions.get(d) for d in param['dimen_names']]
+        if None not in shape and np.prod(shape) == values.size:
+            values = values.reshape(shape, order='F')
+        param_list.append((
+            name, param['dimen_names'], param['count'], param['type'],
+            values, param['n']))
+    return param_file.header, param_file.dimensions.items(), param_list
+
+
+def convert_param_file(input_path, output_path, compress_flag=True):
+    """Convert a PRMS parameter file between the ASCII and NPZ formats
+
+    The format of each file is set by the extension (".npz" or not).
+
+    Args:
+        input_path (str): Input parameter file path
+        output_path (str): Output parameter file path
+        compress_flag (bool): If True, compress the NPZ arrays
+
+    Returns:
+        None
+    """
+    if input_path.lower().endswith('.npz'):
+        header_str, dimen_list, param_list = read_param_npz(input_path)
+    else:
+        header_str, dimen_list, param_list = read_param_file(input_path)
+    if output_path.lower().endswith('.npz'):
+        write_param_npz(
+            output_path, header_str, dimen_list, param_list,
+            compress_flag=compress_flag)
+    else:
+        write_param_file(output_path, header_str, dimen_list, param_list)
+
+
+def write_param_files(param_file_dict, header_str, thread_flag=True,
+                      param_format='ASCII'):
+    """Write several PRMS parameter files, each in its own thread
+
+    Args:
+        param_file_dict (dict): Output parameter file path and a tuple of
+            the dimension and parameter lists (see write_param_file())
+        header_str (str): File header (written first)
+        thread_flag (bool): If False, files are written one at a time
+        param_format (str): Output format (ASCII or NPZ)
+
+    Returns:
+        None
+
+    Raises:
+        The first exception raised while writing a file
+    """
+    if param_format.upper() == 'NPZ':
+        write_func = write_param_npz
+    elif param_format.upper() == 'ASCII':
+        write_func = write_param_file
+    else:
+        raise ValueError('Unsupported parameter file format: {}'.format(
+            param_format))
+
+    if not thread_flag or len(param_file_dict) <= 1:
+        for output_path, (dimen_list, param_list) in sorted(
+                param_file_dict.items()):
+            write_func(output_path, header_str, dimen_list, param_list)
+        return
+
+    error_list = []
+
+    def write_thread(output_path, dimen_list, param_list):
+        try:
+            write_func(output_path, header_str, dimen_list, param_list)
+        except Exception as e:
+            logging.debug('  Error writing {}: {}'.format(output_path, e))
+            error_list.append(e)
+
+    thread_list = [
+        threading.Thread(
+            target=write_thread, args=(output_path, dimen_list, param_list))
+        for output_path, (dimen_list, param_list) in sorted(
+            param_file_dict.items())]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    if error_list:
+        raise error_list[0]
+
+
+class ParamFile():
+    """PRMS parameter file with the blocks indexed by byte offset
+
+    The file is scanned once (memory mapped) to find the "####" blocks
+    and read the block headers.  Parameter values are only read (into
+    NumPy arrays) when they are requested.
+    Files without the section titles (i.e. the CRT cascade.param and
+    parameter_dimensions.txt files) are also supported since a dimension
+    block is just a name and a size.
+
+    Args:
+        param_path (str): Parameter file path
+
+    Attributes:
+        header (str): File header (the text before the first section
+            title or block, see write_param_file())
+        dimensions (OrderedDict): Dimension name and size
+        params (OrderedDict): Parameter name and a dictionary of the
+            dimension names, value count, type, number of values on the
+            first line (n) and the byte offsets of the values (start and
+            end)
+    """
+
+    def __init__(self, param_path):
+        if not os.path.isfile(param_path):
+            raise IOError('Parameter file does not exist: {}'.format(
+                param_path))
+        self.param_path = param_path
+        self.header = ''
+        self.dimensions = OrderedDict()
+        self.params = OrderedDict()
+        self.cache = dict()
+        with open(param_path, 'rb') as input_f:
+            if os.fstat(input_f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(input_f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.index(data)
+            finally:
+                data.close()
+
+    def index(self, data):
+        """Read the block headers and value offsets"""
+        # Blocks start with a "####" line and end at the next block or
+        #   section title
+        start_list = []
+        pos = 0 if data[:4] == BREAK_STR else data.find('\n' + BREAK_STR)
+        while pos >= 0:
+            if data[pos] == '\n':
+                pos += 1
+            start_list.append(pos)
+            pos = data.find('\n' + BREAK_STR, pos + len(BREAK_STR))
+        end_list = start_list[1:] + [data.size()]
+        title_pos = data.find('\n' + PARAM_HEADER)
+
+        # Header is followed by an empty line (see write_param_file())
+        header_end = start_list[0] if start_list else data.size()
+        for title in [DIMEN_HEADER, PARAM_HEADER]:
+            pos = data.find(title, 0, header_end)
+            if pos >= 0:
+                header_end = pos
+        self.header = data[:header_end]
+        if self.header.endswith('\n'):
+            self.header = self.header[:-1]
+
+        def next_line(pos, end):
+            """Stripped line and the start of the following line"""
+            line_end = data.find('\n', pos, end)
+            if line_end < 0:
+                return data[pos:end].strip(), end
+            return data[pos:line_end].strip(), line_end + 1
+
+        for block_start, block_end in zip(start_list, end_list):
+            if block_start < title_pos < block_end:
+                block_end = title_pos + 1
+            pos = next_line(block_start, block_end)[1]
+            name, pos = next_line(pos, block_end)
+            count, pos = next_line(pos, block_end)
+            if not data[pos:block_end].strip():
+                # Dimension (name and size)
+                self.dimensions[name] = int(count)
+                continue
+            dimen_names = []
+            for i in range(int(count)):
+                dimen_name, pos = next_line(pos, block_end)
+                dimen_names.append(dimen_name)
+            value_count, pos = next_line(pos, block_end)
+            param_type, pos = next_line(pos, block_end)
+            self.params[name] = {
+                'dimen_names': dimen_names, 'count': int(value_count),
+                'type': int(param_type),
+                'n': max(len(next_line(pos, block_end)[0].split()), 1),
+                'start': pos, 'end': block_end}
+
+    def __contains__(self, name):
+        return name in self.params
+
+    def __getitem__(self, name):
+        """Parameter values (read from the file the first time)"""
+        if name not in self.cache:
+            self.cache[name] = self.read(name)
+        return self.cache[name]
+
+    def read(self, name):
+        """Read the parameter values from the file
+
+        Args:
+            name (str): Parameter name
+
+        Returns:
+            np.array: Values with the dtype of the parameter type
+
+        Raises:
+            ValueError: If the number of values doesn't match the count
+        """
+        param = self.params[name]
+        with open(self.param_path, 'rb') as input_f:
+            input_f.seek(param['start'])
+            value_str = input_f.read(param['end'] - param['start'])
+        if param['type'] in [1, 2, 3]:
+            value_array = np.fromstring(value_str, dtype=np.float64, sep=' ')
+            value_array = value_array.astype(PARAM_DTYPES[param['type']])
+        else:
+            value_array = np.array(value_str.split(), dtype=object)
+        if value_array.size != param['count']:
+            raise ValueError(
+                'Parameter {} has {} values, expected {}'.format(
+                    name, value_array.size, param['count']))
+        return value_array
+
+
+def param_diff(param_path_a, param_path_b, atol=0.000001, rtol=0):
+    """Compare the dimensions and parameters of two PRMS parameter files
+
+    Values are different if abs(a - b) > atol + rtol * abs(b)
+
+    Args:
+        param_path_a (str): Parameter file path
+        param_path_b (str): Reference parameter file path
+        atol (float): Absolute tolerance
+        rtol (float): Relative tolerance
+
+    Returns:
+        list: Tuples of the name, status (OK, DIFF, SHAPE, TYPE, ONLY_A or
+            ONLY_B), number of different values, maximum difference and
+            mean difference for each dimension and parameter
+    """
+    file_a = ParamFile(param_path_a)
+    file_b = ParamFile(param_path_b)
+
+    output_list = []
+    for name in sorted(set(file_a.dimensions) | set(file_b.dimensions)):
+        if name not in file_b.dimensions:
+            output_list.append((name, 'ONLY_A', 0, 0, 0))
+        elif name not in file_a.dimensions:
+            output_list.append((name, 'ONLY_B', 0, 0, 0))
+        else:
+            diff = abs(file_a.dimensions[name] - file_b.dimensions[name])
+            output_list.append((
+                name, 'DIFF' if diff else 'OK', int(diff > 0), diff, diff))
+
+    for name in sorted(set(file_a.params) | set(file_b.params)):
+        if name not in file_b:
+            output_list.append((name, 'ONLY_A', 0, 0, 0))
+            continue
+        elif name not in file_a:
+            output_list.append((name, 'ONLY_B', 0, 0, 0))
+            continue
+        param_a = file_a.params[name]
+        param_b = file_b.params[name]
+        if (param_a['dimen_names'] != param_b['dimen_names'] or
+                param_a['count'] != param_b['count']):
+            output_list.append((name, 'SHAPE', 0, 0, 0))
+            continue
+        elif (param_a['type'] != param_b['type'] and
+                4 in [param_a['type'], param_b['type']]):
+            output_list.append((name, 'TYPE', 0, 0, 0))
+            continue
+
+        # Values are read once and are not cached
+        values_a = file_a.read(name)
+        values_b = file_b.read(name)
+        if param_a['type'] == 4:
+            diff_count = int(np.sum(values_a != values_b))
+            output_list.append((
+                name, 'DIFF' if diff_count else 'OK', diff_count, 0, 0))
+            continue
+        diff_array = np.abs(
+            values_a.astype(np.float64) - values_b.astype(np.float64))
+        diff_count = int(np.sum(
+            diff_array > atol + rtol * np.abs(values_b)))
+        output_list.append((
+            name, 'DIFF' if diff_count else 'OK', diff_count,
+            float(np.max(diff_array)) if diff_array.size else 0,
+            float(np.mean(diff_array)) if diff_array.size else 0))
+    return output_list
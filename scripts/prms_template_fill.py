@@ -6,7 +6,6 @@
 #--------------------------------
 
 import argparse
-from collections import defaultdict
 import ConfigParser
 import datetime as dt
 import logging
@@ -15,7 +14,9 @@ import os
 import sys
 
 import arcpy
+import numpy as np
 
+import prms_param_functions as prms_param
 import support_functions as support
 
 
@@ -32,8 +33,6 @@ def prms_template_fill(config_path):
     None
 
     """
-    param_formats = {1: '{:d}', 2: '{:f}', 3: '{:f}', 4: '{}'}
-
     # Initialize hru_parameters class
     hru = support.HRUParameters(config_path)
 
@@ -144,6 +143,23 @@ def prms_template_fill(config_path):
             '  Missing INI parameter, setting {} = {}'.format(
                 'param_column_flag', param_column_flag))
 
+    # Parameter file output format (ASCII or NPZ)
+    # NPZ files can be converted to ASCII with misc/param_convert.py
+    try:
+        param_output_format = inputs_cfg.get(
+            'INPUTS', 'param_output_format').upper()
+    except ConfigParser.NoOptionError:
+        param_output_format = 'ASCII'
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'param_output_format', param_output_format))
+    if param_output_format not in prms_param.OUTPUT_FORMATS:
+        logging.error(
+            '\nERROR: Invalid parameter output format ({})\n  '
+            'Valid formats are: {}'.format(
+                param_output_format, ', '.join(prms_param.OUTPUT_FORMATS)))
+        sys.exit()
+
     # Scratch workspace
     try:
         scratch_name = inputs_cfg.get('INPUTS', 'scratch_name')
@@ -165,9 +181,6 @@ def prms_template_fill(config_path):
     # Newline character is required after title
     file_header_str = 'PRMS parameter file generated with gsflow-arcpy-tools version X\n'
     # file_header_str = 'Default file generated by model\nVersion: 1.7'
-    dimen_header_str = '** Dimensions **'
-    param_header_str = '** Parameters **'
-    break_str = '####'
 
     # Check input paths
     if not arcpy.Exists(hru.polygon_path):
@@ -234,12 +247,6 @@ def prms_template_fill(config_path):
        sys.exit()
 
 
-    # Get number of cells in fishnet
-    fishnet_count = int(arcpy.GetCount_management(
-        hru.polygon_path).getOutput(0))
-    logging.info('  Fishnet cells: {}'.format(fishnet_count))
-
-
     # Read in dimensions from CSV
     logging.info('\nReading dimensions CSV')
     dimen_names = dict()
@@ -287,122 +294,6 @@ def prms_template_fill(config_path):
             # dimen_sizes[dimen_name] = int(dimen_size)
         del dimen_size
 
-    # Set CALCULATED dimension values
-    # These parameters equal the fishnet cell count
-    for dimen_name in ['ngw', 'ngwcell', 'nhru', 'nhrucell', 'nssr']:
-        if dimen_sizes[dimen_name].lower() == 'calculated':
-            dimen_sizes[dimen_name] = fishnet_count
-            logging.info('  {} = {}'.format(
-                dimen_name, dimen_sizes[dimen_name]))
-
-    # Getting number of lakes
-    if dimen_sizes['nlake'].lower() == 'calculated':
-        logging.info('\nCalculating number of lakes')
-        #logging.info('  Lake cells are {} >= 0'.format(hru.lake_id_field))
-        value_fields = (hru.id_field, hru.lake_id_field)
-        with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-            dimen_sizes['nlake'] = max(list(
-                [int(row[1]) for row in s_cursor if int(row[1]) >= 0]))
-        logging.info('  nlakes = {}'.format(dimen_sizes['nlake']))
-
-    # Getting number of lake cells
-    if dimen_sizes['nlake_hrus'].lower() == 'calculated':
-        logging.info('\nCalculating number of lake cells')
-        logging.info('  Lake cells are {} >= 0'.format(hru.lake_id_field))
-        value_fields = (hru.id_field, hru.lake_id_field)
-        with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-            dimen_sizes['nlake_hrus'] = len(list(
-                [int(row[1]) for row in s_cursor if int(row[1]) >= 0]))
-        logging.info('  nlake cells = {}'.format(dimen_sizes['nlake_hrus']))
-
-    # Getting number of stream cells
-    if dimen_sizes['nreach'].lower() == 'calculated':
-        logging.info('Calculating number of stream cells')
-        logging.info('  Stream cells are {} >= 0'.format(hru.krch_field))
-        value_fields = (hru.id_field, hru.krch_field)
-        with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-            dimen_sizes['nreach'] = len(list(
-                [int(row[1]) for row in s_cursor if int(row[1]) > 0]))
-        logging.info('  nreach = {}'.format(dimen_sizes['nreach']))
-
-    # Getting number of stream segments
-    if dimen_sizes['nsegment'].lower() == 'calculated':
-        logging.info('Calculating number of unique stream segments')
-        logging.info('  Stream segments are {} >= 0'.format(hru.iseg_field))
-        value_fields = (hru.id_field, hru.iseg_field)
-        with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-            dimen_sizes['nsegment'] = len(list(set(
-                [int(row[1]) for row in s_cursor if int(row[1]) > 0])))
-        logging.info('  nsegment = {}'.format(dimen_sizes['nsegment']))
-
-    # Getting number of subbasins
-    if dimen_sizes['nsub'].lower() == 'calculated':
-        logging.info('Calculating number of unique subbasins')
-        logging.info('  Subbasins are {} >= 0'.format(hru.subbasin_field))
-        value_fields = (hru.id_field, hru.subbasin_field)
-        with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-            dimen_sizes['nsub'] = len(list(set(
-                [int(row[1]) for row in s_cursor if int(row[1]) > 0])))
-        logging.info('  nsub = {}'.format(dimen_sizes['nsub']))
-
-    # Read in CRT cascade dimensions
-    if dimen_sizes['ncascade'].lower() == 'calculated':
-        logging.info('\nReading CRT dimensions')
-        logging.debug('  {}'.format(crt_dimension_path))
-        with open(crt_dimension_path, 'r') as input_f:
-            crt_dimen_lines = [line.strip() for line in input_f.readlines()]
-        input_f.close()
-        if not crt_dimen_lines:
-            logging.error('\nERROR: The CRT dimensions file is empty\n')
-            sys.exit()
-        crt_dimen_break_i_list = [
-            i for i, x in enumerate(crt_dimen_lines) if x == break_str]
-        for i in crt_dimen_break_i_list:
-            if crt_dimen_lines[i + 1] not in ['ncascade']:
-                continue
-            logging.info('  {} = {}'.format(
-                crt_dimen_lines[i + 1], crt_dimen_lines[i + 2]))
-            dimen_sizes[crt_dimen_lines[i + 1]] = int(crt_dimen_lines[i + 2])
-        del crt_dimen_lines, crt_dimen_break_i_list
-
-    # Read in CRT groundwater cascade dimensions
-    if dimen_sizes['ncascdgw'].lower() == 'calculated':
-        logging.info('\nReading CRT groundwater cascade dimensions')
-        logging.debug('  {}'.format(crt_gw_dimension_path))
-        with open(crt_gw_dimension_path, 'r') as input_f:
-            crt_dimen_lines = [line.strip() for line in input_f.readlines()]
-        input_f.close()
-        if not crt_dimen_lines:
-            logging.error(
-                '\nERROR: The CRT groundwater dimensions file is empty\n')
-            sys.exit()
-        crt_dimen_break_i_list = [
-            i for i, x in enumerate(crt_dimen_lines) if x == break_str]
-        for i in crt_dimen_break_i_list:
-            if crt_dimen_lines[i + 1] not in ['ncascdgw']:
-                continue
-            logging.info('  {} = {}'.format(
-                crt_dimen_lines[i + 1], crt_dimen_lines[i + 2]))
-            dimen_sizes[crt_dimen_lines[i + 1]] = int(crt_dimen_lines[i + 2])
-        del crt_dimen_lines, crt_dimen_break_i_list
-
-    # Set CONFIG file dimension values
-    config_file_dimensions = [
-        d_name for d_name, d_size in sorted(dimen_sizes.items())
-        if type(d_size) is str and d_size.lower() == 'config_file']
-    if config_file_dimensions:
-        logging.info('Reading configuration file dimensions')
-        for dimen_name in config_file_dimensions:
-            logging.info('  {}'.format(dimen_name))
-            try:
-                dimen_sizes[dimen_name] = inputs_cfg.getint(
-                    'INPUTS', dimen_name)
-            except ConfigParser.NoOptionError:
-                logging.error(
-                    '  Dimension set to "config_file" in {} but not found in '
-                    'config file, exiting'.format(
-                        os.path.basename(prms_dimen_csv_path)))
-
     # Link HRU fishnet field names to parameter names in '.param'
     param_names = dict()
     param_files = dict()
@@ -411,7 +302,7 @@ def prms_template_fill(config_path):
     param_value_counts = dict()
     param_types = dict()
     param_defaults = dict()
-    param_values = defaultdict(dict)
+    param_values = dict()
 
     # Read in parameters from CSV
     logging.info('\nReading parameters CSV')
@@ -502,42 +393,175 @@ def prms_template_fill(config_path):
         # Calculate number of dimensions
         dimen_count = str(len(dimen_names))
 
-        # Calculate number of values
-        values_count = prod([
-            int(dimen_sizes[dn]) for dn in dimen_names if dimen_sizes[dn]])
-
         # Write parameter to dictionaries
         param_names[param_name] = param_name
         param_files[param_name] = param_file
         param_dimen_counts[param_name] = dimen_count
         param_dimen_names[param_name] = dimen_names
-        param_value_counts[param_name] = values_count
         param_types[param_name] = param_type
         param_defaults[param_name] = param_default
 
+    # Read plan
+    # Every fishnet field needed for the dimensions and parameters is read
+    #   in a single pass and the columns are sorted by HRU_ID
+    logging.info('\nReading fishnet fields')
+    param_fields = {
+        k: v for k, v in param_defaults.items()
+        if (type(v) is str and
+            v.lower() not in ['calculated', 'config_file', 'crt_file'])
+    }
+    tmax_field_list = ['TMAX_{:02d}'.format(m) for m in range(1, 13)]
+    tmax_adj_field_list = ['TMX_ADJ_{:02d}'.format(m) for m in range(1, 13)]
+    tmin_adj_field_list = ['TMN_ADJ_{:02d}'.format(m) for m in range(1, 13)]
+    ratio_field_list = ['PPT_RT_{:02d}'.format(m) for m in range(1, 13)]
+    read_fields = [
+        hru.id_field, hru.type_field, hru.lake_id_field, hru.krch_field,
+        hru.subbasin_field, hru.flow_dir_field, hru.col_field, hru.row_field]
+    if dimen_sizes['nsegment'].lower() == 'calculated':
+        read_fields.append(hru.iseg_field)
+    read_fields.extend(tmax_field_list + ratio_field_list)
+    if temp_calc_method in ['ZONES']:
+        read_fields.extend(
+            tmax_adj_field_list + tmin_adj_field_list + ['HRU_TSTA'])
+    elif temp_calc_method in ['1STA']:
+        read_fields.extend(['TMAX_ADJ', 'TMIN_ADJ'])
+    read_fields.extend(sorted(param_fields.values()))
+    read_fields = sorted(set(read_fields), key=read_fields.index)
+    logging.debug('  {}'.format(', '.join(read_fields)))
+    fishnet_dict = support.read_table_fields(hru.polygon_path, read_fields)
+    hru_id_sort = np.argsort(fishnet_dict[hru.id_field], kind='mergesort')
+    for field in fishnet_dict.keys():
+        fishnet_dict[field] = fishnet_dict[field][hru_id_sort]
+    del hru_id_sort
+
+    # Get number of cells in fishnet
+    fishnet_count = fishnet_dict[hru.id_field].size
+    logging.info('  Fishnet cells: {}'.format(fishnet_count))
+
+    # Set CALCULATED dimension values
+    # These parameters equal the fishnet cell count
+    for dimen_name in ['ngw', 'ngwcell', 'nhru', 'nhrucell', 'nssr']:
+        if dimen_sizes[dimen_name].lower() == 'calculated':
+            dimen_sizes[dimen_name] = fishnet_count
+            logging.info('  {} = {}'.format(
+                dimen_name, dimen_sizes[dimen_name]))
+
+    # Getting number of lakes
+    if dimen_sizes['nlake'].lower() == 'calculated':
+        logging.info('\nCalculating number of lakes')
+        #logging.info('  Lake cells are {} >= 0'.format(hru.lake_id_field))
+        lake_id_array = fishnet_dict[hru.lake_id_field].astype(np.int64)
+        dimen_sizes['nlake'] = int(np.max(lake_id_array[lake_id_array >= 0]))
+        del lake_id_array
+        logging.info('  nlakes = {}'.format(dimen_sizes['nlake']))
+
+    # Getting number of lake cells
+    if dimen_sizes['nlake_hrus'].lower() == 'calculated':
+        logging.info('\nCalculating number of lake cells')
+        logging.info('  Lake cells are {} >= 0'.format(hru.lake_id_field))
+        lake_id_array = fishnet_dict[hru.lake_id_field].astype(np.int64)
+        dimen_sizes['nlake_hrus'] = int(np.sum(lake_id_array >= 0))
+        del lake_id_array
+        logging.info('  nlake cells = {}'.format(dimen_sizes['nlake_hrus']))
+
+    # Getting number of stream cells
+    if dimen_sizes['nreach'].lower() == 'calculated':
+        logging.info('Calculating number of stream cells')
+        logging.info('  Stream cells are {} >= 0'.format(hru.krch_field))
+        krch_array = fishnet_dict[hru.krch_field].astype(np.int64)
+        dimen_sizes['nreach'] = int(np.sum(krch_array > 0))
+        del krch_array
+        logging.info('  nreach = {}'.format(dimen_sizes['nreach']))
+
+    # Getting number of stream segments
+    if dimen_sizes['nsegment'].lower() == 'calculated':
+        logging.info('Calculating number of unique stream segments')
+        logging.info('  Stream segments are {} >= 0'.format(hru.iseg_field))
+        iseg_array = fishnet_dict[hru.iseg_field].astype(np.int64)
+        dimen_sizes['nsegment'] = np.unique(iseg_array[iseg_array > 0]).size
+        del iseg_array
+        logging.info('  nsegment = {}'.format(dimen_sizes['nsegment']))
+
+    # Getting number of subbasins
+    if dimen_sizes['nsub'].lower() == 'calculated':
+        logging.info('Calculating number of unique subbasins')
+        logging.info('  Subbasins are {} >= 0'.format(hru.subbasin_field))
+        subbasin_array = fishnet_dict[hru.subbasin_field].astype(np.int64)
+        dimen_sizes['nsub'] = np.unique(
+            subbasin_array[subbasin_array > 0]).size
+        del subbasin_array
+        logging.info('  nsub = {}'.format(dimen_sizes['nsub']))
+
+    # Read in CRT cascade dimensions
+    if dimen_sizes['ncascade'].lower() == 'calculated':
+        logging.info('\nReading CRT dimensions')
+        logging.debug('  {}'.format(crt_dimension_path))
+        crt_dimensions = prms_param.ParamFile(crt_dimension_path).dimensions
+        if not crt_dimensions:
+            logging.error('\nERROR: The CRT dimensions file is empty\n')
+            sys.exit()
+        if 'ncascade' in crt_dimensions:
+            dimen_sizes['ncascade'] = crt_dimensions['ncascade']
+            logging.info('  ncascade = {}'.format(dimen_sizes['ncascade']))
+        del crt_dimensions
+
+    # Read in CRT groundwater cascade dimensions
+    if dimen_sizes['ncascdgw'].lower() == 'calculated':
+        logging.info('\nReading CRT groundwater cascade dimensions')
+        logging.debug('  {}'.format(crt_gw_dimension_path))
+        crt_dimensions = prms_param.ParamFile(
+            crt_gw_dimension_path).dimensions
+        if not crt_dimensions:
+            logging.error(
+                '\nERROR: The CRT groundwater dimensions file is empty\n')
+            sys.exit()
+        if 'ncascdgw' in crt_dimensions:
+            dimen_sizes['ncascdgw'] = crt_dimensions['ncascdgw']
+            logging.info('  ncascdgw = {}'.format(dimen_sizes['ncascdgw']))
+        del crt_dimensions
+
+    # Set CONFIG file dimension values
+    config_file_dimensions = [
+        d_name for d_name, d_size in sorted(dimen_sizes.items())
+        if type(d_size) is str and d_size.lower() == 'config_file']
+    if config_file_dimensions:
+        logging.info('Reading configuration file dimensions')
+        for dimen_name in config_file_dimensions:
+            logging.info('  {}'.format(dimen_name))
+            try:
+                dimen_sizes[dimen_name] = inputs_cfg.getint(
+                    'INPUTS', dimen_name)
+            except ConfigParser.NoOptionError:
+                logging.error(
+                    '  Dimension set to "config_file" in {} but not found in '
+                    'config file, exiting'.format(
+                        os.path.basename(prms_dimen_csv_path)))
+
+    # Calculate number of values
+    for param_name, param_dimen_list in param_dimen_names.items():
+        param_value_counts[param_name] = prod([
+            int(dimen_sizes[dn]) for dn in param_dimen_list
+            if dimen_sizes[dn]])
+
     # Apply default values to full dimension
+    # Scalars and lists are broadcast to the dimension shape (NumPy rules)
     logging.info('\nSetting static parameters from defaults')
     for param_name, param_default in param_defaults.items():
-        param_value_count = param_value_counts[param_name]
         # Skip if not set
         if param_default is None:
             continue
         # Skip if still a string (field names)
         elif type(param_default) is str:
             continue
-        # For float/int, apply default across dimension size
-        elif type(param_default) is float or type(param_default) is int:
-            for i in range(param_value_count):
-                param_values[param_name][i] = param_default
-        # For lists of floats, match up one-to-one for now
-        elif len(param_default) == param_value_count:
-            for i in range(param_value_count):
-                param_values[param_name][i] = param_default[i]
-        else:
+        try:
+            param_values[param_name] = param_array(
+                param_default, param_types[param_name],
+                param_shape(param_dimen_names[param_name], dimen_sizes))
+        except ValueError:
             logging.error(
                 '\nERROR: The default value(s) ({0}) could not be '
                 'broadcast to the dimension length ({1})'.format(
-                    param_default, param_value_count))
+                    param_default, param_value_counts[param_name]))
             sys.exit()
 
     # Set CONFIG file parameter values
@@ -556,62 +580,43 @@ def prms_template_fill(config_path):
                     'config file, exiting'.format(
                         os.path.basename(prms_dimen_csv_path)))
 
-            # Convert comma separate strings to lists
-            param_values[param_name] = {
-                i: v for i, v in enumerate(values.split(','))}
-
-            # Convert the strings to the appropriate type
-            if param_types[param_name] == 1:
-                param_values[param_name] = {
-                    k: int(v) for k, v in param_values[param_name].items()}
-            elif param_types[param_name] in [2, 3]:
-                param_values[param_name] = {
-                    k: float(v) for k, v in param_values[param_name].items()}
+            # Convert comma separate strings to the appropriate type
+            value_array = np.array(
+                values.split(','),
+                dtype=prms_param.PARAM_DTYPES[param_types[param_name]])
 
             # Try and honor dimension value from CSV
             # Repeat values if actual value count doesn't match expected count
             #   (from dimensions)
             # For now, only apply to INI parameters with a single value
             #   and dimensions greater than 1
+            # Other mismatched values are written as is
             param_value_count = param_value_counts[param_name]
-            if ((len(param_values[param_name]) != param_value_count) and
-                    (len(param_values[param_name]) == 1) and
-                    (param_value_count > 1)):
-                value = param_values[param_name].copy()
-                param_values[param_name] = {}
-                for i in range(param_value_count):
-                    param_values[param_name][i] = value[0]
-
-    # Read in HRU parameter data from fishnet polygon
-    logging.info('\nReading in variable parameters from fishnet')
-    param_fields = {
-        k: v for k, v in param_defaults.items()
-        if (type(v) is str and
-            v.lower() not in ['calculated', 'config_file', 'crt_file'])
-    }
-    value_fields = param_fields.values()
-
-    # Use HRU_ID to uniquely identify each cell
-    if hru.id_field not in value_fields:
-        value_fields.append(hru.id_field)
-    hru_id_i = value_fields.index(hru.id_field)
-
-    # Read in each cell parameter value
-    with arcpy.da.SearchCursor(hru.polygon_path, value_fields) as s_cursor:
-        for row in s_cursor:
-            for field_i, (param, field) in enumerate(param_fields.items()):
-                if param_types[param] == 1:
-                    param_values[param][row[hru_id_i]] = int(row[field_i])
-                elif param_types[param] in [2, 3]:
-                    param_values[param][row[hru_id_i]] = float(row[field_i])
-                elif param_types[param] == 4:
-                    param_values[param][row[hru_id_i]] = row[field_i]
-                # param_values[param][row[hru_id_i]] = row[field_i]
+            if (value_array.size == param_value_count or
+                    (value_array.size == 1 and param_value_count > 1)):
+                value_array = param_array(
+                    value_array, param_types[param_name],
+                    param_shape(param_dimen_names[param_name], dimen_sizes))
+            param_values[param_name] = value_array
+            del value_array
+
+    # Set HRU parameters from the fishnet fields
+    # Fishnet values are written in HRU_ID order
+    logging.info('\nSetting variable parameters from fishnet')
+    for param, field in param_fields.items():
+        try:
+            param_values[param] = param_array(
+                fishnet_dict[field], param_types[param],
+                param_shape(param_dimen_names[param], dimen_sizes))
+        except ValueError:
+            logging.error(
+                '\nERROR: The {} values could not be broadcast to the '
+                'dimension length ({})'.format(
+                    field, param_value_counts[param]))
+            sys.exit()
 
     # Calculate number of columns
-    with arcpy.da.SearchCursor(
-            hru.polygon_path, (hru.id_field, hru.col_field)) as s_cursor:
-        ncol = len(list(set([int(row[1]) for row in s_cursor])))
+    ncol = np.unique(fishnet_dict[hru.col_field].astype(np.int64)).size
 
     # # DEADBEEF - Per Rich this is not needed anymore
     # # The following will override the parameter CSV values
@@ -630,14 +635,12 @@ def prms_template_fill(config_path):
     #     param_values['basin_area'][0]))
 
     # Convert DEM_ADJ units (if necessary)
-    if elev_unit_scalar != 1.0:
+    if elev_unit_scalar != 1.0 and 'hru_elev' in param_values:
         logging.info('\nScaling DEM_ADJ units')
         logging.info('  DEM Units:  {}'.format(dem_units))
         logging.info('  Elev Units: {}'.format(elev_units))
         logging.info('  Multiplier: {}'.format(elev_unit_scalar))
-        param_values['hru_elev'] = {
-            k: v * elev_unit_scalar
-            for k, v in param_values['hru_elev'].items()}
+        param_values['hru_elev'] = param_values['hru_elev'] * elev_unit_scalar
 
     # Calculate mean monthly maximum temperature for all active cells
     logging.info('\nCalculating tmax_index')
@@ -647,17 +650,18 @@ def prms_template_fill(config_path):
     param_dimen_names['tmax_index'] = ['nmonths']
     param_value_counts['tmax_index'] = int(dimen_sizes['nmonths'])
     param_types['tmax_index'] = 2
-    tmax_field_list = ['TMAX_{:02d}'.format(m) for m in range(1, 13)]
+    active_mask = fishnet_dict[hru.type_field] >= 1
+    param_values['tmax_index'] = np.zeros(
+        len(tmax_field_list), dtype=prms_param.PARAM_DTYPES[2])
     for i, tmax_field in enumerate(tmax_field_list):
-        tmax_values = [row[1] for row in arcpy.da.SearchCursor(
-            hru.polygon_path, (hru.type_field, tmax_field),
-            where_clause='"{}" >= 1'.format(hru.type_field))]
+        tmax_values = fishnet_dict[tmax_field][active_mask].tolist()
         tmax_c = sum(tmax_values) / len(tmax_values)
         tmax_f = 1.8 * tmax_c + 32
         param_values['tmax_index'][i] = tmax_f
         logging.info('  {} = {}'.format(
             tmax_field, param_values['tmax_index'][i]))
         del tmax_values
+    del active_mask
 
     logging.info('\nCalculating tmax_adj/tmin_adj')
     param_names['tmax_adj'] = 'tmax_adj'
@@ -672,25 +676,15 @@ def prms_template_fill(config_path):
         param_value_counts['tmax_adj'] = 12 * fishnet_count
         param_value_counts['tmin_adj'] = 12 * fishnet_count
 
-        # Read the Tmax/Tmin adjust values from the shapefile
-        # This could probably be simplified to a single search cursor pass
-        tmax_adj_values = []
-        tmin_adj_values = []
-        tmax_adj_field_list = ['TMX_ADJ_{:02d}'.format(m) for m in range(1, 13)]
-        tmin_adj_field_list = ['TMN_ADJ_{:02d}'.format(m) for m in range(1, 13)]
-        for i, tmax_adj_field in enumerate(tmax_adj_field_list):
-            tmax_adj_values.extend([
-                float(row[1]) for row in sorted(arcpy.da.SearchCursor(
-                    hru.polygon_path, (hru.id_field, tmax_adj_field)))])
-        for i, tmin_adj_field in enumerate(tmin_adj_field_list):
-            tmin_adj_values.extend([
-                float(row[1]) for row in sorted(arcpy.da.SearchCursor(
-                    hru.polygon_path, (hru.id_field, tmin_adj_field)))])
-        for i, value in enumerate(tmax_adj_values):
-            param_values['tmax_adj'][i] = value
-        for i, value in enumerate(tmin_adj_values):
-            param_values['tmin_adj'][i] = value
-        del tmax_adj_values, tmin_adj_values
+        # Set the Tmax/Tmin adjust values from the shapefile
+        # Each month is a column of the (nhru, nmonths) array
+        for param_name, field_list in [('tmax_adj', tmax_adj_field_list),
+                                       ('tmin_adj', tmin_adj_field_list)]:
+            param_values[param_name] = np.zeros(
+                (fishnet_count, len(field_list)),
+                dtype=prms_param.PARAM_DTYPES[2], order='F')
+            for i, adj_field in enumerate(field_list):
+                param_values[param_name][:, i] = fishnet_dict[adj_field]
 
         # # This needs to be tested/compared with values from the above approach
         # # Process the tmax/tmin values in one pass of the search cursor
@@ -708,10 +702,8 @@ def prms_template_fill(config_path):
         param_dimen_names['hru_tsta'] = ['nhru']
         param_value_counts['hru_tsta'] = fishnet_count
         param_types['hru_tsta'] = 1
-        fields = (hru.id_field, 'HRU_TSTA')
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as search_c:
-            for row_i, row in enumerate(sorted(search_c)):
-                param_values['hru_tsta'][row_i] = int(row[1])
+        param_values['hru_tsta'] = fishnet_dict['HRU_TSTA'].astype(
+            prms_param.PARAM_DTYPES[1])
 
         # DEADBEEF - Do these parameters need to be set or overridden
         # ntemp, elev_units, basin_tsta, hru_tlaps, tsta_elev
@@ -725,19 +717,17 @@ def prms_template_fill(config_path):
         param_value_counts['tmax_adj'] = fishnet_count
         param_value_counts['tmin_adj'] = fishnet_count
 
-        # Read the tmax_adj/tmin_adj parameter values from the shapefile
-        fields = (hru.id_field, 'TMAX_ADJ', 'TMIN_ADJ')
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as search_c:
-            for row_i, row in enumerate(sorted(search_c)):
-                param_values['tmax_adj'][row_i] = float(row[1])
-                param_values['tmin_adj'][row_i] = float(row[2])
+        # Set the tmax_adj/tmin_adj parameter values from the shapefile
+        for param_name, field in [('tmax_adj', 'TMAX_ADJ'),
+                                  ('tmin_adj', 'TMIN_ADJ')]:
+            param_values[param_name] = fishnet_dict[field].astype(
+                prms_param.PARAM_DTYPES[2])
 
     elif temp_calc_method in ['LAPSE']:
         pass
 
 
     logging.info('\nCalculating rain_adj/snow_adj')
-    ratio_field_list = ['PPT_RT_{:02d}'.format(m) for m in range(1, 13)]
     param_names['rain_adj'] = 'rain_adj'
     param_dimen_counts['rain_adj'] = 2
     param_dimen_names['rain_adj'] = ['nhru', 'nmonths']
@@ -750,15 +740,12 @@ def prms_template_fill(config_path):
     param_value_counts['snow_adj'] = 12 * fishnet_count
     param_types['snow_adj'] = 2
 
-    ratio_values = []
+    param_values['rain_adj'] = np.zeros(
+        (fishnet_count, len(ratio_field_list)),
+        dtype=prms_param.PARAM_DTYPES[2], order='F')
     for i, ratio_field in enumerate(ratio_field_list):
-        ratio_values.extend([
-            float(row[1]) for row in sorted(arcpy.da.SearchCursor(
-                hru.polygon_path, (hru.id_field, ratio_field)))])
-    for i, value in enumerate(ratio_values):
-        param_values['rain_adj'][i] = value
-        param_values['snow_adj'][i] = value
-    del ratio_values
+        param_values['rain_adj'][:, i] = fishnet_dict[ratio_field]
+    param_values['snow_adj'] = param_values['rain_adj'].copy(order='F')
 
     logging.info('\nCalculating subbasin_down')
     param_names['subbasin_down'] = 'subbasin_down'
@@ -774,19 +761,18 @@ def prms_template_fill(config_path):
         hru.type_field, hru.krch_field, hru.lake_id_field,
         hru.subbasin_field, hru.flow_dir_field,
         hru.col_field, hru.row_field, hru.id_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
+    for row in zip(*[fishnet_dict[f].astype(np.int64).tolist() for f in fields]):
         # Skip inactive cells
-        if int(row[0]) == 0:
+        if row[0] == 0:
             continue
         # Skip non-lake and non-stream cells
-        elif (int(row[1]) == 0 and int(row[2]) == 0):
+        elif (row[1] == 0 and row[2] == 0):
             continue
         # Read in parameters
-        cell = (int(row[5]), int(row[6]))
+        cell = (row[5], row[6])
         # support.next_row_col(FLOW_DIR, CELL)
         # HRU_ID, SUBBASIN, NEXT_CELL
-        cell_dict[cell] = [
-            int(row[7]), int(row[3]), support.next_row_col(int(row[4]), cell)]
+        cell_dict[cell] = [row[7], row[3], support.next_row_col(row[4], cell)]
         del cell
 
     # Get subset of cells if subbasin != next_subbasin
@@ -806,23 +792,21 @@ def prms_template_fill(config_path):
                 subbasin_list.append([subbasin, 0])
         elif subbasin != cell_dict[next_cell][1]:
             subbasin_list.append([subbasin, cell_dict[next_cell][1]])
-    for i, (subbasin, subbasin_down) in enumerate(sorted(subbasin_list)):
-        param_values['subbasin_down'][i] = subbasin_down
-        logging.debug('  {}'.format(
-            param_values['subbasin_down'][i]))
+    param_values['subbasin_down'] = np.array(
+        [subbasin_down for subbasin, subbasin_down in sorted(subbasin_list)],
+        dtype=prms_param.PARAM_DTYPES[1])
+    for subbasin_down in param_values['subbasin_down']:
+        logging.debug('  {}'.format(subbasin_down))
     del subbasin_list
 
     # Switch SWALE points back to hru_type 1 or 2
     logging.info('\nResetting SWALE point HRU_TYPE')
-    fields = [hru.type_field, hru.id_field, hru.lake_id_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        # Skip inactive cells
-        if int(row[0]) != 3:
-            continue
-        elif int(row[2]) > 0:
-            param_values['hru_type'][row[1]] = 2
-        else:
-            param_values['hru_type'][row[1]] = 1
+    swale_mask = fishnet_dict[hru.type_field].astype(np.int64) == 3
+    lake_mask = fishnet_dict[hru.lake_id_field].astype(np.int64) > 0
+    if 'hru_type' in param_values:
+        param_values['hru_type'][swale_mask & lake_mask] = 2
+        param_values['hru_type'][swale_mask & ~lake_mask] = 1
+    del fishnet_dict, swale_mask, lake_mask
 
     # # DEADBEEF - lake_hru is not used in PRMS 3.0.X or gsflow
     # #   It is used in PRMS 4.0 though
@@ -842,87 +826,24 @@ def prms_template_fill(config_path):
     #    param_values['lake_hru'][i] = lake_hru_id
 
     # Read in CRT parameters
-    logging.info('\nReading CRT parameters')
-    with open(crt_parameter_path, 'r') as input_f:
-        crt_param_lines = [line.strip() for line in input_f.readlines()]
-    input_f.close()
-    # Using enumerate iterator to get .next method
-    crt_param_enumerate = enumerate(crt_param_lines)
-    for crt_param_line in crt_param_enumerate:
-        if crt_param_line[1] == break_str:
-            # Skip break string
-            crt_param_line = crt_param_enumerate.next()
-            # Read parameter name and get next line
-            param_name = crt_param_line[1]
+    for crt_param_path, crt_title in [
+            (crt_parameter_path, '\nReading CRT parameters'),
+            (crt_gw_parameter_path, 'Reading CRT groundwater parameters')]:
+        logging.info(crt_title)
+        crt_param_file = prms_param.ParamFile(crt_param_path)
+        for param_name, crt_param in crt_param_file.params.items():
             param_names[param_name] = param_name
-            crt_param_line = crt_param_enumerate.next()
-            # Read dimension count and get next line
-            param_dimen_counts[param_name] = int(crt_param_line[1])
-            crt_param_line = crt_param_enumerate.next()
-            # For each dimen (based on count) read in dimension name
-            param_dimen_names[param_name] = []
-            for dimen_i in range(param_dimen_counts[param_name]):
-                param_dimen_names[param_name].append(crt_param_line[1])
-                crt_param_line = crt_param_enumerate.next()
-            # Read in number of parameter values
-            param_value_counts[param_name] = int(crt_param_line[1])
-            crt_param_line = crt_param_enumerate.next()
-            # Read in parameter type
-            param_types[param_name] = int(crt_param_line[1])
-            # Read in parameter values
-            # Get next in loop is place intentionally
-            # Placing  after getting the value causes it to skip next break
-            for i in range(param_value_counts[param_name]):
-                crt_param_line = crt_param_enumerate.next()
-                if param_types[param_name] == 1:
-                    param_values[param_name][i] = int(crt_param_line[1])
-                if param_types[param_name] in [2, 3]:
-                    param_values[param_name][i] = float(crt_param_line[1])
-                if param_types[param_name] == 4:
-                    param_values[param_name][i] = crt_param_line[1]
-
-    # Read in CRT groundwater parameters
-    logging.info('Reading CRT groundwater parameters')
-    with open(crt_gw_parameter_path, 'r') as input_f:
-        crt_param_lines = [line.strip() for line in input_f.readlines()]
-    input_f.close()
-    # Using enumerate iterator to get .next method
-    crt_param_enumerate = enumerate(crt_param_lines)
-    for crt_param_line in crt_param_enumerate:
-        if crt_param_line[1] == break_str:
-            # Skip break string
-            crt_param_line = crt_param_enumerate.next()
-            # Read parameter name and get next line
-            param_name = crt_param_line[1]
-            param_names[param_name] = param_name
-            crt_param_line = crt_param_enumerate.next()
-            # Read dimension count and get next line
-            param_dimen_counts[param_name] = int(crt_param_line[1])
-            crt_param_line = crt_param_enumerate.next()
-            # For each dimen (based on count) read in dimension name
-            param_dimen_names[param_name] = []
-            for dimen_i in range(param_dimen_counts[param_name]):
-                param_dimen_names[param_name].append(crt_param_line[1])
-                crt_param_line = crt_param_enumerate.next()
-            # Read in number of parameter values
-            param_value_counts[param_name] = int(crt_param_line[1])
-            crt_param_line = crt_param_enumerate.next()
-            # Read in parameter type
-            param_types[param_name] = int(crt_param_line[1])
-            # Read in parameter values
-            # Get next in loop is place intentionally
-            # Placing  after getting the value causes it to skip next break
-            for i in range(param_value_counts[param_name]):
-                crt_param_line = crt_param_enumerate.next()
-                if param_types[param_name] == 1:
-                    param_values[param_name][i] = int(crt_param_line[1])
-                if param_types[param_name] in [2, 3]:
-                    param_values[param_name][i] = float(crt_param_line[1])
-                if param_types[param_name] == 4:
-                    param_values[param_name][i] = crt_param_line[1]
-    del crt_param_enumerate, crt_param_lines
-
-
+            param_dimen_counts[param_name] = len(crt_param['dimen_names'])
+            param_dimen_names[param_name] = crt_param['dimen_names']
+            param_value_counts[param_name] = crt_param['count']
+            param_types[param_name] = crt_param['type']
+            try:
+                param_values[param_name] = crt_param_file.read(param_name)
+            except ValueError as e:
+                logging.error('\nERROR: {}\n  {}\n'.format(
+                    e, crt_param_path))
+                sys.exit()
+        del crt_param_file
 
 
     # # Add lake HRU's to groundwater cascades
@@ -971,19 +892,18 @@ def prms_template_fill(config_path):
     # DEADBEEF
     # Override -999 values
     # logging.info('\nChanging SOIL_MOIST_MAX nodata (-999) to 2')
-    # for i,v in param_values['soil_moist_max'].items():
-    #    if v == -999: param_values['soil_moist_max'][i] = 2
+    # param_values['soil_moist_max'][
+    #     param_values['soil_moist_max'] == -999] = 2
     # logging.info('Changing SOIL_RECHR_MAX nodata (-999) to 1')
-    # for i,v in param_values['soil_rechr_max'].items():
-    #    if v == -999: param_values['soil_rechr_max'][i] = 1
+    # param_values['soil_rechr_max'][
+    #     param_values['soil_rechr_max'] == -999] = 1
     # logging.info('Changing SAT_THRESHOLD nodata (-999) to 4')
-    # for i,v in param_values['sat_threshold'].items():
-    #    if v == -999: param_values['sat_threshold'][i] = 4
+    # param_values['sat_threshold'][
+    #     param_values['sat_threshold'] == -999] = 4
 
     # Override negative values
     # logging.info('Changing negative SSR2GW_RATE (< 0) to 0.1 (PRMS default)')
-    # for i,v in param_values['ssr2gw_rate'].items():
-    #    if v < 0: param_values['ssr2gw_rate'][i] = 0.1
+    # param_values['ssr2gw_rate'][param_values['ssr2gw_rate'] < 0] = 0.1
     # raw_input('ENTER')
 
 
@@ -992,11 +912,16 @@ def prms_template_fill(config_path):
     prms_parameter_paths = sorted(list(set(
         param_files.values() + dimen_files.values())))
 
+    param_file_dict = dict()
     for prms_parameter_path in prms_parameter_paths:
-        logging.info('{}'.format(prms_parameter_path))
-        if os.path.isfile(prms_parameter_path):
+        if param_output_format == 'NPZ':
+            output_path = os.path.splitext(prms_parameter_path)[0] + '.npz'
+        else:
+            output_path = prms_parameter_path
+        logging.info('{}'.format(output_path))
+        if os.path.isfile(output_path):
             logging.debug('  Removing existing file')
-            os.remove(prms_parameter_path)
+            os.remove(output_path)
         # Get parameters and dimensions for each file
         param_name_list = sorted([
             p_name for p_name, p_file in param_files.items()
@@ -1005,74 +930,79 @@ def prms_template_fill(config_path):
             d_name for d_name, d_file in dimen_files.items()
             if d_file == prms_parameter_path])
 
-        with open(prms_parameter_path, 'w') as output_f:
-            output_f.write(file_header_str + '\n')
-
-            # Write dimensions
-            if dimen_name_list:
-                output_f.write(dimen_header_str + '\n')
-                logging.debug('  Set dimensions')
-            for dimen_name in dimen_name_list:
-                try:
-                    dimen_size = dimen_sizes[dimen_name]
-                except KeyError:
-                    continue
-                if (type(dimen_size) is str and
-                        dimen_size.lower() in ['calculated']):
-                    logging.debug(
-                        '    Dimension {} not calculated'.format(dimen_size))
-                    continue
-                logging.debug('    {}'.format(dimen_name))
-                output_f.write(break_str + '\n')
-                output_f.write(dimen_name + '\n')
-                output_f.write(str(dimen_size) + '\n')
-
-            # Then write set parameters
-            if param_name_list:
-                output_f.write(param_header_str + '\n')
-                logging.debug('  Set parameters')
-            for param_name in param_name_list:
-                if param_name not in param_values.keys():
-                    # logging.debug(param_name)
-                    continue
-                logging.debug('    {}'.format(param_name))
-
-                output_f.write(break_str + '\n')
-                output_f.write('{}\n'.format(param_name))
-                output_f.write('{}\n'.format(
-                    param_dimen_counts[param_name]))
-                for dimen_name in param_dimen_names[param_name]:
-                    output_f.write(dimen_name + '\n')
-                output_f.write(str(param_value_counts[param_name]) + '\n')
-                param_type = param_types[param_name]
-                output_f.write(str(param_type) + '\n')
-
-                # Get list of values sorted by parameter name
-                sorted_param_values = [
-                    v for i, v in sorted(param_values[param_name].items())]
-
-                # If dimension is "nhru", write values as an array.
-                # Write blocks of values for each row
-                if ('nhru' in param_dimen_names[param_name] and
-                        not param_column_flag):
-                    n = ncol
-                else:
-                    n = 1
-
-                for i in range(0, len(sorted_param_values), n):
-                    values_str = ' '.join([
-                        param_formats[param_type].format(v)
-                        for v in sorted_param_values[i:i + n]])
-                    output_f.write(values_str + '\n')
-
-        # Close file
-        output_f.close()
+        # Dimensions that are not set or calculated are skipped
+        dimen_list = []
+        for dimen_name in dimen_name_list:
+            dimen_size = dimen_sizes.get(dimen_name, None)
+            if (type(dimen_size) is str and
+                    dimen_size.lower() in ['calculated']):
+                logging.debug(
+                    '  Dimension {} not calculated'.format(dimen_size))
+                dimen_size = None
+            dimen_list.append((dimen_name, dimen_size))
+
+        # Parameters without values are skipped
+        # If dimension is "nhru", write values as an array.
+        # Write blocks of values for each row
+        param_list = []
+        for param_name in param_name_list:
+            if ('nhru' in param_dimen_names[param_name] and
+                    not param_column_flag):
+                n = ncol
+            else:
+                n = 1
+            param_list.append((
+                param_name, param_dimen_names[param_name],
+                param_value_counts.get(param_name, None),
+                param_types[param_name],
+                param_values.get(param_name, None), n))
+        param_file_dict[output_path] = (dimen_list, param_list)
+
+    # Each parameter file is written in a separate thread
+    prms_param.write_param_files(
+        param_file_dict, file_header_str, param_format=param_output_format)
+    del param_file_dict
 
 
 def prod(iterable):
     return reduce(operator.mul, iterable, 1)
 
 
+def param_shape(dimen_names, dimen_sizes):
+    """Parameter array shape from the (set) dimension sizes"""
+    return tuple(
+        int(dimen_sizes[dn]) for dn in dimen_names if dimen_sizes[dn])
+
+
+def param_array(values, param_type, shape):
+    """Typed parameter array with the dimension shape
+
+    Arrays are in Fortran order (the first dimension varies fastest) to
+    match the PRMS parameter file value order.  Values that don't match
+    the number of dimension values are broadcast using the NumPy rules,
+    so a scalar is repeated and a list is repeated along the last
+    dimension (i.e. one value per month for [nhru, nmonths]).
+
+    Args:
+        values: Parameter value(s) (scalar, list or NumPy array)
+        param_type (int): PRMS parameter type (1, 2, 3 or 4)
+        shape (tuple): Parameter dimension sizes
+
+    Returns:
+        np.array
+
+    Raises:
+        ValueError: If the values can't be broadcast to the shape
+    """
+    param_dtype = prms_param.PARAM_DTYPES[param_type]
+    value_array = np.asarray(values, dtype=param_dtype)
+    if value_array.size == prod(shape):
+        return value_array.reshape(shape, order='F')
+    output_array = np.empty(shape, dtype=param_dtype, order='F')
+    output_array[...] = value_array
+    return output_array
+
+
 def isfloat(s):
     """"""
     try:
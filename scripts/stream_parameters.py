@@ -14,13 +14,14 @@ import math
 import os
 import pprint
 import shutil
-import subprocess
 import sys
-from time import sleep
 
 import arcpy
 from arcpy import env
+import numpy as np
 
+import cascade_functions as cascade
+import crt_functions as crt
 import support_functions as support
 
 
@@ -90,6 +91,35 @@ def stream_parameters(config_path):
         logging.info(
             '  Missing INI parameter, setting {} = {}'.format(
                 'crt_outitmax', crt_outitmax))
+    try:
+        crt_cache_flag = inputs_cfg.getboolean('INPUTS', 'crt_cache_flag')
+    except ConfigParser.NoOptionError:
+        crt_cache_flag = True
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_cache_flag', crt_cache_flag))
+    try:
+        crt_timeout = inputs_cfg.getfloat('INPUTS', 'crt_timeout')
+    except ConfigParser.NoOptionError:
+        crt_timeout = 0
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_timeout', crt_timeout))
+    try:
+        crt_engine = inputs_cfg.get('INPUTS', 'crt_engine').upper()
+    except ConfigParser.NoOptionError:
+        crt_engine = 'EXE'
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'crt_engine', crt_engine))
+    try:
+        stream_rasters_flag = inputs_cfg.getboolean(
+            'INPUTS', 'stream_rasters_flag')
+    except ConfigParser.NoOptionError:
+        stream_rasters_flag = False
+        logging.info(
+            '  Missing INI parameter, setting {} = {}'.format(
+                'stream_rasters_flag', stream_rasters_flag))
     # Intentionally not allowing user to change this value
     crt_iprn = 1
 
@@ -106,17 +136,27 @@ def stream_parameters(config_path):
     gw_ifill = 1
 
     # CRT Executable
-    crt_exe_path = inputs_cfg.get('INPUTS', 'crt_exe_path')
+    if crt_engine == 'EXE':
+        crt_exe_path = inputs_cfg.get('INPUTS', 'crt_exe_path')
     output_name = 'outputstat.txt'
 
-    # Override ascii and rasters flags to generate CRT inputs
-    output_ascii_flag = True
-    output_rasters_flag = True
-
     # Parameters
     exit_seg = 0
 
     # Check input paths
+    if crt_engine not in ['EXE', 'PYTHON']:
+        logging.error(
+            '\nERROR: crt_engine must be EXE or PYTHON\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_hruflg != 0:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_hruflg = 0\n')
+        sys.exit()
+    elif crt_engine == 'PYTHON' and crt_flowflg not in [1, 2, 3]:
+        logging.error(
+            '\nERROR: The PYTHON crt_engine only supports crt_flowflg = '
+            '1, 2 or 3\n')
+        sys.exit()
     if not arcpy.Exists(hru.polygon_path):
         logging.error(
             '\nERROR: Fishnet ({}) does not exist\n'.format(
@@ -167,8 +207,9 @@ def stream_parameters(config_path):
             sys.exit()
 
     # Build output folder if necessary
+    # The model grid rasters are only needed for checking the streams
     stream_temp_ws = os.path.join(hru.param_ws, 'stream_rasters')
-    if not os.path.isdir(stream_temp_ws):
+    if stream_rasters_flag and not os.path.isdir(stream_temp_ws):
         os.mkdir(stream_temp_ws)
     if not os.path.isdir(crt_ws):
         os.mkdir(crt_ws)
@@ -176,16 +217,17 @@ def stream_parameters(config_path):
         os.mkdir(gw_ws)
 
     # Copy CRT executable if necessary
-    crt_exe_name = os.path.basename(crt_exe_path)
-    if not os.path.isfile(os.path.join(crt_ws, crt_exe_name)):
-        shutil.copy(crt_exe_path, crt_ws)
-    if not os.path.isfile(os.path.join(gw_ws, crt_exe_name)):
-        shutil.copy(crt_exe_path, gw_ws)
-    if not os.path.isfile(os.path.join(crt_ws, crt_exe_name)):
-        logging.error(
-            '\nERROR: CRT executable ({}) does not exist\n'.format(
-                os.path.join(crt_ws, crt_exe_name)))
-        sys.exit()
+    if crt_engine == 'EXE':
+        crt_exe_name = os.path.basename(crt_exe_path)
+        if not os.path.isfile(os.path.join(crt_ws, crt_exe_name)):
+            shutil.copy(crt_exe_path, crt_ws)
+        if not os.path.isfile(os.path.join(gw_ws, crt_exe_name)):
+            shutil.copy(crt_exe_path, gw_ws)
+        if not os.path.isfile(os.path.join(crt_ws, crt_exe_name)):
+            logging.error(
+                '\nERROR: CRT executable ({}) does not exist\n'.format(
+                    os.path.join(crt_ws, crt_exe_name)))
+            sys.exit()
 
     # Cascades files
     crt_hru_casc_path = os.path.join(crt_ws, 'HRU_CASC.DAT')
@@ -201,31 +243,6 @@ def stream_parameters(config_path):
     gw_stream_cells_path = os.path.join(gw_ws, 'STREAM_CELLS.DAT')
     gw_xy_path = os.path.join(gw_ws, 'XY.DAT')
 
-    # Output names
-    dem_adj_raster_name = 'dem_adj'
-    hru_type_raster_name = 'hru_type'
-    iseg_raster_name = 'iseg'
-    irunbound_raster_name = 'irunbound'
-    subbasin_raster_name = 'sub_basins'
-    segbasin_raster_name = 'seg_basins'
-
-    # Output raster paths
-    dem_adj_raster = os.path.join(stream_temp_ws, dem_adj_raster_name + '.img')
-    hru_type_raster = os.path.join(stream_temp_ws, hru_type_raster_name + '.img')
-    iseg_raster = os.path.join(stream_temp_ws, iseg_raster_name + '.img')
-    irunbound_raster = os.path.join(stream_temp_ws, irunbound_raster_name + '.img')
-    subbasin_raster = os.path.join(stream_temp_ws, subbasin_raster_name + '.img')
-    segbasin_raster = os.path.join(stream_temp_ws, segbasin_raster_name + '.img')
-
-    # Output ascii paths
-    a_fmt = '{}_ascii.txt'
-    dem_adj_ascii = os.path.join(stream_temp_ws, a_fmt.format(dem_adj_raster_name))
-    hru_type_ascii = os.path.join(stream_temp_ws, a_fmt.format(hru_type_raster_name))
-    iseg_ascii = os.path.join(stream_temp_ws, a_fmt.format(iseg_raster_name))
-    irunbound_ascii = os.path.join(stream_temp_ws, a_fmt.format(irunbound_raster_name))
-    subbasin_ascii = os.path.join(stream_temp_ws, a_fmt.format(subbasin_raster_name))
-    segbasin_ascii = os.path.join(stream_temp_ws, a_fmt.format(segbasin_raster_name))
-
     # Layers
     hru_polygon_lyr = 'hru_polygon_lyr'
 
@@ -234,7 +251,10 @@ def stream_parameters(config_path):
     env.overwriteOutput = True
     # env.pyramid = 'PYRAMIDS -1'
     env.pyramid = 'PYRAMIDS 0'
-    env.workspace = stream_temp_ws
+    if stream_rasters_flag:
+        env.workspace = stream_temp_ws
+    else:
+        env.workspace = hru.param_ws
     env.scratchWorkspace = hru.scratch_ws
 
     # Add fields if necessary
@@ -256,18 +276,29 @@ def stream_parameters(config_path):
     support.add_field_func(hru.polygon_path, hru.strm_top_field, 'FLOAT')
     support.add_field_func(hru.polygon_path, hru.strm_slope_field, 'FLOAT')
 
+    # Read all of the fishnet fields into memory once
+    # The changed fields are written back to the fishnet in a single pass
+    logging.info('\nReading HRU fields')
+    hru_table = support.HRUTable(hru, [
+        hru.type_field, hru.iseg_field, hru.irunbound_field,
+        hru.flow_dir_field, hru.dem_adj_field, hru.lake_id_field,
+        hru.row_field, hru.col_field, hru.outflow_field,
+        hru.x_field, hru.y_field,
+        hru.krch_field, hru.irch_field, hru.jrch_field, hru.rchlen_field,
+        hru.outseg_field, hru.reach_field, hru.maxreach_field,
+        hru.iupseg_field, hru.segbasin_field, hru.strm_top_field])
+    hru_type_array = hru_table[hru.type_field].astype(np.int64)
+    iseg_array = hru_table[hru.iseg_field].astype(np.int64)
+    irunbound_array = hru_table[hru.irunbound_field].astype(np.int64)
+    row_array = hru_table[hru.row_field].astype(np.int64)
+    col_array = hru_table[hru.col_field].astype(np.int64)
+
     # Calculate KRCH, IRCH, JRCH for stream segments
     logging.info('\nKRCH, IRCH, & JRCH for streams')
-    fields = [
-        hru.type_field, hru.iseg_field, hru.row_field, hru.col_field,
-        hru.krch_field, hru.irch_field, hru.jrch_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if (int(row[0]) in [1, 3] and int(row[1]) > 0):
-                row[4], row[5], row[6] = 1, int(row[2]), int(row[3])
-            else:
-                row[4], row[5], row[6] = 0, 0, 0
-            update_c.updateRow(row)
+    stream_mask = np.in1d(hru_type_array, [1, 3]) & (iseg_array > 0)
+    hru_table[hru.krch_field] = stream_mask.astype(np.int64)
+    hru_table[hru.irch_field] = np.where(stream_mask, row_array, 0)
+    hru_table[hru.jrch_field] = np.where(stream_mask, col_array, 0)
 
     # Get stream length for each cell
     logging.info('Stream length')
@@ -289,15 +320,13 @@ def stream_parameters(config_path):
     for row in arcpy.da.SearchCursor(
             length_path, [hru.id_field, length_field]):
         length_dict[int(row[0])] += int(row[1])
-    fields = [hru.type_field, hru.iseg_field, hru.rchlen_field, hru.id_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if (int(row[0]) == 1 and int(row[1]) != 0):
-                row[2] = length_dict[int(row[3])]
-            else:
-                row[2] = 0
-            update_c.updateRow(row)
-    del length_dict, length_field, fields, hru_polygon_lyr
+    rchlen_array = np.zeros(hru_table.count, dtype=np.int64)
+    if length_dict:
+        rchlen_array[hru_table.index(length_dict.keys())] = \
+            length_dict.values()
+    hru_table[hru.rchlen_field] = np.where(
+        (hru_type_array == 1) & (iseg_array != 0), rchlen_array, 0)
+    del length_dict, length_field, rchlen_array, hru_polygon_lyr
 
     # Get list of segments and downstream cell for each stream/lake cell
     # Downstream is calculated from flow direction
@@ -305,165 +334,59 @@ def stream_parameters(config_path):
     # DEADBEEF - I don't think ISEG will be zero for lakes anymore
     logging.info('Cell out-flow dictionary')
     cell_dict = dict()
-    fields = [
-        hru.type_field, hru.krch_field, hru.lake_id_field, hru.iseg_field,
-        hru.irunbound_field, hru.dem_adj_field, hru.flow_dir_field,
-        hru.col_field, hru.row_field, hru.id_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        # Skip inactive cells
-        if int(row[0]) == 0:
-            continue
-        # Skip if not lake and not stream
-        elif (int(row[1]) == 0 and int(row[2]) == 0):
-            continue
-
+    # Skip inactive cells and cells that are not lake and not stream
+    cell_mask = (
+        (hru_type_array != 0) &
+        ((hru_table[hru.krch_field] != 0) |
+         (hru_table[hru.lake_id_field] != 0)))
+    flow_dir_array = hru_table[hru.flow_dir_field]
+    dem_adj_array = hru_table[hru.dem_adj_field]
+    for i in np.where(cell_mask)[0]:
         # ROW / COL
-        cell = (int(row[7]), int(row[8]))
+        cell = (int(col_array[i]), int(row_array[i]))
 
         # Read in parameters
         # HRU_ID, ISEG, support.next_row_col(FLOW_DIR, CELL), DEM_ADJ, X, X, X
         cell_dict[cell] = [
-            int(row[9]), int(row[4]), support.next_row_col(int(row[6]), cell),
-            float(row[5]), 0, 0, 0]
-
-    # Build list of unique segments
-    iseg_list = sorted(list(set([v[1] for v in cell_dict.values()])))
+            int(hru_table.id_array[i]), int(irunbound_array[i]),
+            support.next_row_col(int(flow_dir_array[i]), cell),
+            float(dem_adj_array[i]), 0, 0, 0]
+    del cell_mask, flow_dir_array
 
     # Calculate IREACH and OUTSEG
+    # Cells are grouped by segment once (instead of once per segment)
     logging.info('Calculate {} and {}'.format(
         hru.reach_field, hru.outseg_field))
-    outseg_dict = dict()
-    for iseg in sorted(iseg_list):
-        logging.debug('    Segment: {}'.format(iseg))
-
-        # Subset of cell_dict for current iseg
-        iseg_dict = dict([(k, v) for k, v in cell_dict.items() if v[1] == iseg])
-
-        # List of all cells in current iseg
-        iseg_cells = iseg_dict.keys()
-
-        # List of out_cells for all cells in current iseg
-        out_cells = [value[2] for value in iseg_dict.values()]
-
-        # Every iseg will (should?) have one out_cell
-        out_cell = list(set(out_cells) - set(iseg_cells))
-
-        # Process streams and lakes separately
-        # Streams
-        if iseg > 0:
-            # If there is more than one out_cell
-            #   there is a problem with the stream network
-            if len(out_cell) != 1:
-                logging.error(
-                    '\nERROR: ISEG {} has more than one out put cell'
-                    '\n  Out cells: {}'
-                    '\n  Check for streams exiting then re-entering a lake'
-                    '\n  Lake cell elevations may not be constant\n'.format(
-                        iseg, out_cell))
-                sys.exit()
-
-            # If not output cell, assume edge of domain
-            try:
-                outseg = cell_dict[out_cell[0]][1]
-            except KeyError:
-                outseg = exit_seg
-
-            # Track sub-basin outseg
-            outseg_dict[iseg] = outseg
-
-            # Calculate reach number for each cell
-            reach_dict = dict()
-            start_cell = list(set(iseg_cells) - set(out_cells))[0]
-            for i in range(len(out_cells)):
-                # logging.debug('    Reach: {}  Cell: {}'.format(i+1, start_cell))
-                reach_dict[start_cell] = i + 1
-                start_cell = iseg_dict[start_cell][2]
-
-            # For each cell in iseg, save outseg, reach, & maxreach
-            for iseg_cell in iseg_cells:
-                cell_dict[iseg_cell][4:] = [
-                    outseg, reach_dict[iseg_cell], len(iseg_cells)]
-            del reach_dict, start_cell, outseg
-        # Lakes
-        else:
-            # For lake cells, there can be multiple outlets if all of them
-            #   are to inactive cells or out of the model
-            # Otherwise, like streams, there should only be one outcell per iseg
-            logging.debug('  Length: {}'.format(len(out_cells)))
-            if len(out_cell) == 1:
-                try:
-                    outseg = cell_dict[out_cell[0]][1]
-                except KeyError:
-                    outseg = exit_seg
-            elif (len(out_cell) != 1 and
-                  all(x[0] not in cell_dict.keys() for x in out_cell)):
-                outseg = exit_seg
-                logging.debug(
-                    '  All out cells are inactive, setting outseg '
-                    'to exit_seg {}'.format(exit_seg))
-            else:
-                logging.error(
-                    '\nERROR: ISEG {} has more than one out put cell'
-                    '\n  Out cells: {}'
-                    '\n  Check for streams exiting then re-entering a lake'
-                    '\n  Lake cell elevations may not be constant\n'.format(
-                         iseg, out_cell))
-                raw_input('ENTER')
-
-            # Track sub-basin outseg
-            outseg_dict[iseg] = outseg
-
-            # For each lake segment cell, only save outseg
-            # All lake cells are routed directly to the outseg
-            for iseg_cell in iseg_cells:
-                cell_dict[iseg_cell][4:] = [outseg, 0, 0]
-            del outseg
-
-        del iseg_dict, iseg_cells, iseg
-        del out_cells, out_cell
+    seg_topo = support.SegmentTopology(cell_dict)
+    outseg_dict = seg_topo.calc_outseg_reach(cell_dict, exit_seg)
+    del seg_topo
 
     # Calculate stream elevation
     logging.info('Stream elevation (DEM_ADJ - 1 for now)')
-    fields = [
-        hru.type_field, hru.iseg_field, hru.dem_adj_field,
-        hru.strm_top_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if int(row[0]) == 1 and int(row[1]) != 0:
-                row[3] = float(row[2]) - 1
-            else:
-                row[3] = 0
-            update_c.updateRow(row)
+    hru_table[hru.strm_top_field] = np.where(
+        (hru_type_array == 1) & (iseg_array != 0), dem_adj_array - 1, 0)
+    del dem_adj_array
 
     # Saving ireach and outseg
     logging.info('Save IREACH and OUTSEG')
-    fields = [
-        hru.type_field, hru.iseg_field, hru.col_field, hru.row_field,
-        hru.outseg_field, hru.reach_field, hru.maxreach_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            # if (int(row[0]) > 0 and int(row[1]) > 0):
-            # DEADBEEF - I'm not sure why only iseg > 0 in above line
-            # DEADBEEF - This should set outseg for streams and lakes
-            if (int(row[0]) > 0 and int(row[1]) != 0):
-                row[4:] = cell_dict[(int(row[2]), int(row[3]))][4:]
-            else:
-                row[4:] = [0, 0, 0]
-            update_c.updateRow(row)
+    # DEADBEEF - This should set outseg for streams and lakes
+    reach_array = np.zeros((hru_table.count, 3), dtype=np.int64)
+    for i in np.where((hru_type_array > 0) & (iseg_array != 0))[0]:
+        reach_array[i] = cell_dict[(int(col_array[i]), int(row_array[i]))][4:]
+    hru_table[hru.outseg_field] = reach_array[:, 0]
+    hru_table[hru.reach_field] = reach_array[:, 1]
+    hru_table[hru.maxreach_field] = reach_array[:, 2]
+    del reach_array
 
     # Calculate IUPSEG for all segments flowing out of lakes
     logging.info('IUPSEG for streams flowing out of lakes')
     upseg_dict = dict(
         [(v, k) for k, v in outseg_dict.iteritems() if k < 0])
-    fields = [hru.type_field, hru.iseg_field, hru.iupseg_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if (int(row[0]) == 1 and int(row[1]) != 0 and
-                    int(row[1]) in upseg_dict.keys()):
-                row[2] = upseg_dict[int(row[1])]
-            else:
-                row[2] = 0
-            update_c.updateRow(row)
+    iupseg_array = np.zeros(hru_table.count, dtype=np.int64)
+    for i in np.where((hru_type_array == 1) & (iseg_array != 0))[0]:
+        iupseg_array[i] = upseg_dict.get(int(iseg_array[i]), 0)
+    hru_table[hru.iupseg_field] = iupseg_array
+    del iupseg_array
 
     # Build dictionary of which segments flow into each segment
     # Used to calculate seg-basins (sub watersheds) for major streams
@@ -497,14 +420,11 @@ def stream_parameters(config_path):
     # Calculate SEG_BASIN for all active cells
     # SEG_BASIN corresponds to the ISEG of the lowest segment
     logging.info('SEG_BASIN')
-    fields = [hru.type_field, hru.irunbound_field, hru.segbasin_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if int(row[0]) > 0 and int(row[1]) != 0:
-                row[2] = pourseg_dict[int(row[1])]
-            else:
-                row[2] = 0
-            update_c.updateRow(row)
+    segbasin_array = np.zeros(hru_table.count, dtype=np.int64)
+    for i in np.where((hru_type_array > 0) & (irunbound_array != 0))[0]:
+        segbasin_array[i] = pourseg_dict[int(irunbound_array[i])]
+    hru_table[hru.segbasin_field] = segbasin_array
+    del segbasin_array
 
     # # Set all swale cells back to hru_type 2 (lake)
     # logging.info('Swale HRU_TYPE')
@@ -516,53 +436,49 @@ def stream_parameters(config_path):
 
     # Set all lake iseg to 0
     logging.info('Lake ISEG')
-    fields = [hru.type_field, hru.iseg_field]
-    with arcpy.da.UpdateCursor(hru.polygon_path, fields) as update_c:
-        for row in update_c:
-            if int(row[0]) != 2:
-                continue
-            iseg = int(row[1])
-            if iseg < 0:
-                row[1] = 0
-                update_c.updateRow(row)
+    hru_table[hru.iseg_field] = np.where(
+        (hru_type_array == 2) & (iseg_array < 0), 0, iseg_array)
 
-    # Set environment parameters
-    env.extent = hru.extent
-    env.cellsize = hru.cs
-    env.outputCoordinateSystem = hru.sr
+    # Write the changed fields back to the fishnet
+    logging.info('\nWriting HRU fields')
+    hru_table.flush()
+    logging.info('  Rows read:     {}'.format(hru_table.rows_read))
+    logging.info('  Rows written:  {}'.format(hru_table.rows_written))
+    logging.info('  Bytes written: {}'.format(hru_table.bytes_written))
 
     # Build rasters
-    if output_rasters_flag:
-        logging.info('\nOutput model grid rasters')
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.type_field, hru_type_raster,
-            'CELL_CENTER', '', hru.cs)
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.dem_adj_field, dem_adj_raster,
-            'CELL_CENTER', '', hru.cs)
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.iseg_field, iseg_raster,
-            'CELL_CENTER', '', hru.cs)
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.irunbound_field, irunbound_raster,
-            'CELL_CENTER', '', hru.cs)
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.segbasin_field, segbasin_raster,
-            'CELL_CENTER', '', hru.cs)
-        arcpy.PolygonToRaster_conversion(
-            hru.polygon_path, hru.subbasin_field, subbasin_raster,
-            'CELL_CENTER', '', hru.cs)
-
-    # Build rasters
-    if output_ascii_flag:
-        logging.info('Output model grid ascii')
-        arcpy.RasterToASCII_conversion(hru_type_raster, hru_type_ascii)
-        arcpy.RasterToASCII_conversion(dem_adj_raster, dem_adj_ascii)
-        arcpy.RasterToASCII_conversion(iseg_raster, iseg_ascii)
-        arcpy.RasterToASCII_conversion(irunbound_raster, irunbound_ascii)
-        arcpy.RasterToASCII_conversion(segbasin_raster, segbasin_ascii)
-        arcpy.RasterToASCII_conversion(subbasin_raster, subbasin_ascii)
-        sleep(5)
+    if stream_rasters_flag:
+        logging.info('\nOutput model grid rasters and ascii')
+        env.extent = hru.extent
+        env.cellsize = hru.cs
+        env.outputCoordinateSystem = hru.sr
+        raster_fields = [
+            ['hru_type', hru.type_field], ['dem_adj', hru.dem_adj_field],
+            ['iseg', hru.iseg_field], ['irunbound', hru.irunbound_field],
+            ['seg_basins', hru.segbasin_field],
+            ['sub_basins', hru.subbasin_field]]
+        for raster_name, raster_field in raster_fields:
+            logging.info('  {}'.format(raster_name))
+            output_raster = os.path.join(
+                stream_temp_ws, raster_name + '.img')
+            arcpy.PolygonToRaster_conversion(
+                hru.polygon_path, raster_field, output_raster,
+                'CELL_CENTER', '', hru.cs)
+            arcpy.RasterToASCII_conversion(
+                output_raster, os.path.join(
+                    stream_temp_ws, '{}_ascii.txt'.format(raster_name)))
+        arcpy.ClearEnvironment('extent')
+        arcpy.ClearEnvironment('cellsize')
+        arcpy.ClearEnvironment('outputCoordinateSystem')
+        del raster_fields
+
+    # Build the model grid arrays for the CRT input files
+    logging.info('\nBuilding model grid arrays')
+    hru_type_grid = crt.grid_array(
+        row_array, col_array, hru_type_array, hru.rows, hru.cols)
+    dem_adj_grid = crt.grid_array(
+        row_array, col_array, hru_table[hru.dem_adj_field],
+        hru.rows, hru.cols, dtype=np.float64)
 
     logging.debug('\nRemoving existing CRT fill files')
     if os.path.isfile(crt_hru_casc_path):
@@ -583,46 +499,32 @@ def stream_parameters(config_path):
     # Include non-lake SWALES in streams file
     logging.info('  {}'.format(
         os.path.basename(crt_stream_cells_path)))
-    stream_cells_list = []
-    fields = [
-        hru.type_field, hru.iseg_field, hru.reach_field,
-        hru.col_field, hru.row_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        if int(row[0]) in [1, 3] and int(row[1]) > 0:
-            stream_cells_list.append(
-                [int(row[4]), int(row[3]), int(row[1]), int(row[2]), 1])
-    if stream_cells_list:
-        with open(crt_stream_cells_path, 'w+') as f:
-            f.write('{}    NREACH\n'.format(len(stream_cells_list)))
-            for stream_cells_l in sorted(stream_cells_list):
-                f.write(' '.join(map(str, stream_cells_l)) + '\n')
-        f.close
-    del stream_cells_list
+    iseg_array = hru_table[hru.iseg_field]
+    reach_array = hru_table[hru.reach_field]
+    stream_mask = np.in1d(hru_type_array, [1, 3]) & (iseg_array > 0)
+    if np.any(stream_mask):
+        crt.write_stream_cells(
+            crt_stream_cells_path, row_array[stream_mask],
+            col_array[stream_mask], iseg_array[stream_mask],
+            reach_array[stream_mask])
+    del stream_mask
 
     # Generate OUTFLOW_HRU.DAT for CRT
     # Outflow cells exit the model to inactive cells or out of the domain
     #   Outflow field is set in dem_2_streams
     logging.info('  {}'.format(
         os.path.basename(crt_outflow_hru_path)))
-    outflow_hru_list = []
-    fields = [
-        hru.type_field, hru.outflow_field, hru.subbasin_field,
-        hru.row_field, hru.col_field]
-    for row in arcpy.da.SearchCursor(hru.polygon_path, fields):
-        if int(row[0]) != 0 and int(row[1]) == 1:
-            outflow_hru_list.append([int(row[3]), int(row[4])])
-    if outflow_hru_list:
-        with open(crt_outflow_hru_path, 'w+') as f:
-            f.write('{}    NUMOUTFLOWHRU\n'.format(
-                len(outflow_hru_list)))
-            for i, outflow_hru in enumerate(outflow_hru_list):
-                f.write('{} {} {}   OUTFLOW_ID ROW COL\n'.format(
-                    i + 1, outflow_hru[0], outflow_hru[1]))
-        f.close()
+    outflow_mask = (
+        (hru_type_array != 0) & (hru_table[hru.outflow_field] == 1))
+    outflow_index = hru_table.cursor_index(outflow_mask)
+    if outflow_index.size:
+        crt.write_outflow_hru(
+            crt_outflow_hru_path, row_array[outflow_index],
+            col_array[outflow_index])
     else:
         logging.error('\nERROR: No OUTFLOWHRU points, exiting')
         sys.exit()
-    del outflow_hru_list
+    del outflow_mask, outflow_index
 
     #  Generate OUTFLOW_HRU.DAT for CRT
     # logging.info('  {}'.format(
@@ -647,69 +549,21 @@ def stream_parameters(config_path):
 
     # Generate HRU_CASC.DAT for CRT
     logging.info('  {}'.format(os.path.basename(crt_hru_casc_path)))
-    with open(hru_type_ascii, 'r') as f:
-        ascii_data = f.readlines()
-    f.close()
-    hru_casc_header = (
-        '{} {} {} {} {} {} {} {}     '
-        'HRUFLG STRMFLG FLOWFLG VISFLG IPRN IFILL DPIT OUTITMAX\n').format(
-            crt_hruflg, crt_strmflg, crt_flowflg, crt_visflg,
-            crt_iprn, crt_ifill, crt_dpit, crt_outitmax)
-    with open(crt_hru_casc_path, 'w+') as f:
-        f.write(hru_casc_header)
-        for ascii_line in ascii_data[6:]:
-            f.write(ascii_line)
-    f.close()
-    del hru_casc_header, ascii_data
+    hru_casc_header = crt.hru_casc_header(
+        crt_hruflg, crt_strmflg, crt_flowflg, crt_visflg,
+        crt_iprn, crt_ifill, crt_dpit, crt_outitmax)
+    crt.write_hru_casc(crt_hru_casc_path, hru_type_grid, hru_casc_header)
+    del hru_casc_header
 
     # Generate LAND_ELEV.DAT for CRT
     logging.info('  {}'.format(os.path.basename(crt_land_elev_path)))
-    with open(dem_adj_ascii, 'r') as f:
-        ascii_data = f.readlines()
-    f.close()
-    with open(crt_land_elev_path, 'w+') as f:
-        f.write('{} {}       NROW NCOL\n'.format(
-            ascii_data[1].split()[1], ascii_data[0].split()[1]))
-        for ascii_line in ascii_data[6:]:
-            f.write(ascii_line)
-    f.close()
-    del ascii_data
+    crt.write_land_elev(crt_land_elev_path, dem_adj_grid)
 
     # Generate XY.DAT for CRT
     logging.info('  {}'.format(os.path.basename(crt_xy_path)))
-    xy_list = [
-        map(int, row)
-        for row in sorted(arcpy.da.SearchCursor(
-            hru.polygon_path, [hru.id_field, hru.x_field, hru.y_field]))]
-    with open(crt_xy_path, 'w+') as f:
-        for line in sorted(xy_list):
-            f.write(' '.join(map(str, line)) + '\n')
-    f.close()
-
-    # Run CRT
-    logging.info('\nRunning CRT')
-    subprocess.check_output(crt_exe_name, cwd=crt_ws, shell=True)
-
-    # Read in outputstat.txt to check for errors
-    logging.info('\nReading CRT {}'.format(output_name))
-    output_path = os.path.join(crt_ws, output_name)
-    with open(output_path, 'r') as f:
-        output_data = [l.strip() for l in f.readlines()]
-    f.close()
-
-    # Check if there are errors
-    if 'CRT FOUND UNDECLARED SWALE HRUS' in output_data:
-        logging.error(
-            '\nERROR: CRT found undeclared swale HRUs (sinks)\n'
-            '  All sinks must be filled before generating cascades\n'
-            '  Check the CRT outputstat.txt file\n')
-        sys.exit()
-    elif 'CRT EXECUTION COMPLETE' not in output_data:
-        logging.error('\nERROR: CRT did not successfully complete\n')
-        sys.exit()
-
-
-
+    crt.write_xy(
+        crt_xy_path, hru_table.id_array, hru_table[hru.x_field],
+        hru_table[hru.y_field])
 
     # Rerun CRT without lakes to build groundwater cascades
     # This is only needed if there are lakes in the model
@@ -738,44 +592,89 @@ def stream_parameters(config_path):
 
     # Generate HRU_CASC.DAT for CRT
     logging.info('  {}'.format(os.path.basename(gw_hru_casc_path)))
-    with open(hru_type_ascii, 'r') as f:
-        ascii_data = f.readlines()
-    f.close()
-    hru_casc_header = (
-        '{} {} {} {} {} {} {} {}     '
-        'HRUFLG STRMFLG FLOWFLG VISFLG IPRN IFILL DPIT OUTITMAX\n').format(
-            crt_hruflg, crt_strmflg, crt_flowflg, crt_visflg,
-            crt_iprn, crt_ifill, crt_dpit, crt_outitmax)
-    with open(gw_hru_casc_path, 'w+') as f:
-        f.write(hru_casc_header)
-        for ascii_line in ascii_data[6:]:
-            # Convert all lakes to active
-            # Should swales (type 3) be converted also?
-            f.write(ascii_line.replace('2', '1'))
-    f.close()
-    del hru_casc_header, ascii_data
-
-    # Run CRT
-    logging.info('\nRunning CRT for groundwater cascades')
-    subprocess.check_output(crt_exe_name, cwd=gw_ws, shell=True)
-
-    # Read in outputstat.txt to check for errors
-    logging.info('\nReading CRT {}'.format(output_name))
-    output_path = os.path.join(gw_ws, output_name)
-    with open(output_path, 'r') as f:
-        output_data = [l.strip() for l in f.readlines()]
-    f.close()
-
-    # Check if there are errors
-    if 'CRT FOUND UNDECLARED SWALE HRUS' in output_data:
-        logging.error(
-            '\nERROR: CRT found undeclared swale HRUs (sinks)\n'
-            '  All sinks must be filled before generating cascades\n'
-            '  Check the CRT outputstat.txt file\n')
-        sys.exit()
-    elif 'CRT EXECUTION COMPLETE' not in output_data:
-        logging.error('\nERROR: CRT did not successfully complete\n')
-        sys.exit()
+    hru_casc_header = crt.hru_casc_header(
+        crt_hruflg, crt_strmflg, crt_flowflg, crt_visflg,
+        crt_iprn, crt_ifill, crt_dpit, crt_outitmax)
+    # Convert all lakes to active
+    # Should swales (type 3) be converted also?
+    crt.write_hru_casc(
+        gw_hru_casc_path, np.where(hru_type_grid == 2, 1, hru_type_grid),
+        hru_casc_header)
+    del hru_casc_header
+
+    # Build the cascades in process instead of running the CRT executable
+    if crt_engine == 'PYTHON':
+        logging.info('\nBuilding surface and groundwater cascades')
+        stream_mask = np.in1d(hru_type_array, [1, 3]) & (iseg_array > 0)
+        outflow_grid = crt.grid_array(
+            row_array, col_array, hru_table[hru.outflow_field],
+            hru.rows, hru.cols) == 1
+        for run_ws, run_type_grid, prefix, dimen_name, param_name in [
+                [crt_ws, hru_type_grid, 'hru', 'ncascade', 'cascade.param'],
+                [gw_ws, np.where(hru_type_grid == 2, 1, hru_type_grid),
+                 'gw', 'ncascdgw', 'groundwater_cascade.param']]:
+            logging.info('  {}'.format(run_ws))
+            cascade_dict = cascade.cascade_routing(
+                run_type_grid, dem_adj_grid, row_array[stream_mask],
+                col_array[stream_mask], iseg_array[stream_mask],
+                outflow_grid, hruflg=crt_hruflg, flowflg=crt_flowflg,
+                dpit=crt_dpit, outitmax=crt_outitmax)
+            if cascade_dict['swale_count']:
+                logging.error(
+                    '\nERROR: {} HRUs could not be filled to an outlet\n'
+                    '  All sinks must be filled before generating '
+                    'cascades\n'.format(cascade_dict['swale_count']))
+                sys.exit()
+            logging.info('  {} = {}'.format(
+                dimen_name, cascade_dict['up_id'].size))
+            cascade.write_cascade_param(
+                os.path.join(run_ws, param_name), cascade_dict,
+                prefix=prefix, dimen_name=dimen_name)
+            cascade.write_cascade_dimensions(
+                os.path.join(run_ws, 'parameter_dimensions.txt'),
+                dimen_name, cascade_dict['up_id'].size)
+            del cascade_dict
+        del stream_mask, outflow_grid
+        return
+
+    # Run the surface and groundwater CRT runs at the same time
+    # The runs are independent once the input files are built
+    logging.info('\nRunning CRT (surface and groundwater cascades)')
+    if crt_cache_flag:
+        crt_cache_params = {
+            'HRUFLG': crt_hruflg, 'FLOWFLG': crt_flowflg,
+            'DPIT': crt_dpit, 'OUTITMAX': crt_outitmax}
+    else:
+        crt_cache_params = None
+    crt_result_dict = crt.run_crt_jobs(
+        crt_exe_name, [crt_ws, gw_ws], timeout=crt_timeout or None,
+        output_name=output_name, cache_params=crt_cache_params)
+
+    # Check the outputstat.txt file of each run for errors
+    for run_ws in [crt_ws, gw_ws]:
+        crt_result = crt_result_dict[run_ws]
+        logging.info('\nChecking CRT {}\n  {}'.format(output_name, run_ws))
+        if crt_result['timeout']:
+            logging.error(
+                '\nERROR: CRT did not finish in {} seconds\n'.format(
+                    crt_timeout))
+            sys.exit()
+        elif crt_result['returncode'] != 0:
+            logging.error(
+                '\nERROR: CRT exited with return code {}\n'
+                '  Check the CRT crt_stderr.txt file\n  {}\n'.format(
+                    crt_result['returncode'],
+                    os.path.join(run_ws, 'crt_stderr.txt')))
+            sys.exit()
+        elif crt_result['status'] == 'SWALE':
+            logging.error(
+                '\nERROR: CRT found undeclared swale HRUs (sinks)\n'
+                '  All sinks must be filled before generating cascades\n'
+                '  Check the CRT outputstat.txt file\n')
+            sys.exit()
+        elif crt_result['status'] != 'COMPLETE':
+            logging.error('\nERROR: CRT did not successfully complete\n')
+            sys.exit()
 
 
 def cell_distance(cell_a, cell_b, cs):
@@ -7,6 +7,7 @@
 
 from collections import defaultdict
 import ConfigParser
+import hashlib
 import itertools
 import logging
 import math
@@ -21,6 +22,11 @@ import numpy as np
 import arcpy
 from arcpy import env
 
+from crt_functions import is_number
+import dbf_functions as dbf
+import flow_functions as flow
+import polygon_functions as polygon
+
 
 class HRUParameters():
     """"""
@@ -287,6 +293,182 @@ class HRUParameters():
         self.hru_tsta_field = fields_cfg.get('FIELDS', 'hru_tsta_field')
 
 
+class HRUTable():
+    """In-memory (columnar) copy of the HRU fishnet attribute table
+
+    Fields are read once into NumPy arrays that are sorted by HRU_ID.
+    Scripts can then do all of their calculations in memory and write
+    only the changed columns (and rows) back to the fishnet with flush().
+
+    Args:
+        hru_param: class:`HRUParameters`
+        fields (list): Fishnet field names to read
+
+    """
+
+    def __init__(self, hru_param, fields=None):
+        self.polygon_path = hru_param.polygon_path
+        self.id_field = hru_param.id_field
+        self.columns = dict()
+        self.saved = dict()
+
+        # Counters for logging the table I/O
+        self.rows_read = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+
+        # Fishnet row order (OID) is saved so that outputs can be
+        #   written in the same order as a SearchCursor
+        id_array = arcpy.da.FeatureClassToNumPyArray(
+            self.polygon_path, ['OID@', self.id_field])
+        self.rows_read += id_array.size
+        id_array.sort(order=[self.id_field])
+        self.id_array = id_array[self.id_field].astype(np.int64)
+        self.oid_array = id_array['OID@'].astype(np.int64)
+        self.count = self.id_array.size
+        if np.any(np.diff(self.id_array) == 0):
+            logging.error(
+                '\nERROR: There are duplicate {} values\n'.format(
+                    self.id_field))
+            sys.exit()
+        self.read(fields or [])
+
+    def __contains__(self, field):
+        return field in self.columns
+
+    def __getitem__(self, field):
+        """Column array (read from the fishnet if necessary)"""
+        if field not in self.columns:
+            self.read([field])
+        return self.columns[field]
+
+    def __setitem__(self, field, values):
+        """Set column values, the column dtype is not changed"""
+        if field not in self.columns:
+            self.read([field])
+        self.columns[field][:] = values
+
+    def read(self, fields):
+        """Read fields from the fishnet in a single pass
+
+        Args:
+            fields (list): Fishnet field names
+
+        Returns:
+            None
+        """
+        fields = [f for f in fields if f not in self.columns]
+        fields = sorted(set(fields), key=fields.index)
+        if not fields:
+            return
+        logging.debug('  Reading HRU fields: {}'.format(', '.join(fields)))
+        input_array = arcpy.da.FeatureClassToNumPyArray(
+            self.polygon_path, [self.id_field] + fields)
+        self.rows_read += input_array.size
+        input_array = input_array[
+            np.argsort(input_array[self.id_field], kind='mergesort')]
+        for field in fields:
+            self.columns[field] = np.array(input_array[field])
+            self.saved[field] = np.array(input_array[field])
+
+    def index(self, hru_ids):
+        """Column array indices of HRU IDs"""
+        return np.searchsorted(self.id_array, hru_ids)
+
+    def cursor_index(self, mask=None):
+        """Column array indices in fishnet (cursor) order
+
+        Args:
+            mask (np.array): Optional boolean mask of the rows to return
+
+        Returns:
+            np.array
+        """
+        index_array = np.argsort(self.oid_array, kind='mergesort')
+        if mask is not None:
+            index_array = index_array[mask[index_array]]
+        return index_array
+
+    def changed(self, field):
+        """Boolean array of the rows where a column has changed
+
+        NaN values are equal to NaN values, so that NaN values in float
+        columns are not rewritten on every flush.
+
+        Args:
+            field (str): Fishnet field name
+
+        Returns:
+            np.array
+        """
+        values, saved = self.columns[field], self.saved[field]
+        changed_mask = values != saved
+        if values.dtype.kind == 'f':
+            changed_mask &= ~(np.isnan(values) & np.isnan(saved))
+        return changed_mask
+
+    def flush(self):
+        """Write the changed columns back to the fishnet in a single pass
+
+        Only rows with at least one changed value are updated.
+
+        Returns:
+            None
+        """
+        fields = [
+            f for f in sorted(self.columns.keys()) if np.any(self.changed(f))]
+        if not fields:
+            logging.debug('  HRU table is unchanged')
+            return
+        row_mask = np.zeros(self.count, dtype=np.bool)
+        for field in fields:
+            row_mask |= self.changed(field)
+        logging.debug('  Writing HRU fields: {}'.format(', '.join(fields)))
+
+        index_dict = dict(zip(self.id_array.tolist(), range(self.count)))
+        value_list = [self.columns[f].tolist() for f in fields]
+        row_bytes = sum(self.columns[f].dtype.itemsize for f in fields)
+        with arcpy.da.UpdateCursor(
+                self.polygon_path, [self.id_field] + fields) as update_c:
+            for row in update_c:
+                i = index_dict[int(row[0])]
+                if not row_mask[i]:
+                    continue
+                row[1:] = [values[i] for values in value_list]
+                update_c.updateRow(row)
+                self.rows_written += 1
+                self.bytes_written += row_bytes
+        for field in fields:
+            self.saved[field] = np.array(self.columns[field])
+        logging.debug('  HRU table rows read: {}  rows written: {}  '
+                      'bytes written: {}'.format(
+                          self.rows_read, self.rows_written,
+                          self.bytes_written))
+
+
+def sorted_index(values, keys):
+    """Index of each key in an array of sorted (unique) values
+
+    Args:
+        values (np.array): Sorted values (i.e. HRUTable.id_array)
+        keys: Key or array of keys
+
+    Returns:
+        int or np.array: index of each key in values, -1 if the key
+            is not in values
+    """
+    values = np.asarray(values)
+    keys = np.asarray(keys)
+    key_index = np.atleast_1d(np.searchsorted(values, keys))
+    key_mask = key_index < values.size
+    key_mask[key_mask] = (
+        values[key_index[key_mask]] == np.atleast_1d(keys)[key_mask])
+    key_index[~key_mask] = -1
+    if keys.ndim == 0:
+        return int(key_index[0])
+    return key_index.reshape(keys.shape)
+
+
 def next_row_col(flow_dir, cell):
     """"""
     i_next, j_next = cell
@@ -302,12 +484,174 @@ def next_row_col(flow_dir, cell):
     return i_next, j_next
 
 
+class SegmentTopology():
+    """Stream and lake segment topology
+
+    The cells are grouped by segment (ISEG) once using a stable sort and
+    segment offsets (CSR style).  Segment i is the slice
+    sort_array[offsets[i]:offsets[i+1]] of the cell arrays.
+
+    Args:
+        cell_dict (dict): CELL (col, row) and [HRU_ID, ISEG, NEXT_CELL, ...]
+            for all stream and lake cells
+
+    """
+
+    def __init__(self, cell_dict):
+        self.cell_list = sorted(cell_dict.keys())
+        cell_count = len(self.cell_list)
+        cell_index = dict(zip(self.cell_list, range(cell_count)))
+
+        # Segment and next (downstream) cell index of each cell
+        # Next cell index is -1 if the next cell is not a stream/lake cell
+        self.iseg_array = np.array(
+            [cell_dict[cell][1] for cell in self.cell_list], dtype=np.int64)
+        self.next_array = np.array(
+            [cell_index.get(cell_dict[cell][2], -1)
+             for cell in self.cell_list], dtype=np.int64)
+
+        # Group cells by segment
+        self.sort_array = np.argsort(self.iseg_array, kind='mergesort')
+        iseg_sort = self.iseg_array[self.sort_array]
+        split_array = np.flatnonzero(np.diff(iseg_sort)) + 1
+        self.offsets = np.concatenate(
+            ([0], split_array, [cell_count])).astype(np.int64)
+        if cell_count:
+            self.iseg_list = iseg_sort[self.offsets[:-1]].tolist()
+        else:
+            self.iseg_list = []
+            self.offsets = np.zeros(1, dtype=np.int64)
+
+        # Cells flowing to a cell in the same segment
+        self.inside_mask = np.zeros(cell_count, dtype=np.bool)
+        next_mask = self.next_array >= 0
+        self.inside_mask[next_mask] = (
+            self.iseg_array[self.next_array[next_mask]] ==
+            self.iseg_array[next_mask])
+
+        # Number of upstream cells in the same segment
+        self.inflow_count = np.bincount(
+            self.next_array[self.inside_mask], minlength=cell_count)
+
+    def segment_index(self, seg_i):
+        """Cell indices of the i-th segment (in iseg_list)"""
+        return self.sort_array[self.offsets[seg_i]:self.offsets[seg_i + 1]]
+
+    def calc_outseg_reach(self, cell_dict, exit_seg=0):
+        """Calculate OUTSEG, IREACH and MAXREACH for all segments
+
+        The values are saved to cell_dict[CELL][4:] for each cell
+
+        Args:
+            cell_dict (dict): CELL and [HRU_ID, ISEG, NEXT_CELL, DEM_ADJ, X, X, X]
+            exit_seg (int): OUTSEG for segments flowing out of the model
+
+        Returns:
+            dict: ISEG and OUTSEG
+        """
+        outseg_dict = dict()
+        reach_array = np.zeros(len(self.cell_list), dtype=np.int64)
+        for seg_i, iseg in enumerate(self.iseg_list):
+            logging.debug('    Segment: {}'.format(iseg))
+            seg_index = self.segment_index(seg_i)
+
+            # Out cells (next cells that are not in the segment)
+            # Every iseg will (should?) have one out_cell
+            out_cell = sorted(set(
+                cell_dict[self.cell_list[i]][2]
+                for i in seg_index[~self.inside_mask[seg_index]]))
+
+            # Process streams and lakes separately
+            # Streams
+            if iseg > 0:
+                # If there is more than one out_cell
+                #   there is a problem with the stream network
+                if len(out_cell) != 1:
+                    logging.error(
+                        '\nERROR: ISEG {} has more than one out put cell'
+                        '\n  Out cells: {}'
+                        '\n  Check for streams exiting then re-entering a lake'
+                        '\n  Lake cell elevations may not be constant\n'.format(
+                            iseg, out_cell))
+                    sys.exit()
+
+                # If not output cell, assume edge of domain
+                try:
+                    outseg = cell_dict[out_cell[0]][1]
+                except KeyError:
+                    outseg = exit_seg
+
+                # Calculate reach number for each cell
+                # Start at the cell with no upstream cells and follow
+                #   the flow direction to the out cell
+                start_index = seg_index[self.inflow_count[seg_index] == 0]
+                reach = 0
+                if start_index.size:
+                    cell_i = start_index[0]
+                    while reach < seg_index.size:
+                        reach += 1
+                        reach_array[cell_i] = reach
+                        if not self.inside_mask[cell_i]:
+                            break
+                        cell_i = self.next_array[cell_i]
+                if reach != seg_index.size:
+                    logging.error(
+                        '\nERROR: ISEG {} cells are not a single flow path'
+                        '\n  Check the flow direction of the stream '
+                        'cells\n'.format(iseg))
+                    sys.exit()
+
+                # For each cell in iseg, save outseg, reach, & maxreach
+                for cell_i in seg_index:
+                    cell_dict[self.cell_list[cell_i]][4:] = [
+                        outseg, int(reach_array[cell_i]), seg_index.size]
+            # Lakes
+            else:
+                # For lake cells, there can be multiple outlets if all of them
+                #   are to inactive cells or out of the model
+                # Otherwise, like streams, there should only be one outcell
+                #   per iseg
+                logging.debug('  Length: {}'.format(seg_index.size))
+                if len(out_cell) == 1:
+                    try:
+                        outseg = cell_dict[out_cell[0]][1]
+                    except KeyError:
+                        outseg = exit_seg
+                elif all(x[0] not in cell_dict for x in out_cell):
+                    outseg = exit_seg
+                    logging.debug(
+                        '  All out cells are inactive, setting outseg '
+                        'to exit_seg {}'.format(exit_seg))
+                else:
+                    logging.error(
+                        '\nERROR: ISEG {} has more than one out put cell'
+                        '\n  Out cells: {}'
+                        '\n  Check for streams exiting then re-entering a lake'
+                        '\n  Lake cell elevations may not be constant\n'.format(
+                             iseg, out_cell))
+                    sys.exit()
+
+                # For each lake segment cell, only save outseg
+                # All lake cells are routed directly to the outseg
+                for cell_i in seg_index:
+                    cell_dict[self.cell_list[cell_i]][4:] = [outseg, 0, 0]
+
+            # Track sub-basin outseg
+            outseg_dict[iseg] = outseg
+            del outseg
+        return outseg_dict
+
+
 def field_stat_func(input_path, value_field, stat='MAXIMUM'):
     """"""
-    value_list = []
-    with arcpy.da.SearchCursor(input_path, value_field) as s_cursor:
-        for row in s_cursor:
-            value_list.append(row[0])
+    if dbf.is_dbf_table(input_path):
+        # Read the values directly from the .dbf file
+        value_list = dbf.read_dbf_field(input_path, value_field).tolist()
+    else:
+        value_list = []
+        with arcpy.da.SearchCursor(input_path, value_field) as s_cursor:
+            for row in s_cursor:
+                value_list.append(row[0])
     if stat.upper() in ['MAXIMUM', 'MAX']:
         return max(value_list)
     elif stat.upper() in ['MINIMUM', 'MIN']:
@@ -316,6 +660,29 @@ def field_stat_func(input_path, value_field, stat='MAXIMUM'):
         return float(sum(value_list)) / len(value_list)
 
 
+def read_table_fields(table_path, fields):
+    """Read table fields into NumPy arrays (in SearchCursor order)
+
+    Shapefile attribute tables are read directly from the .dbf file
+
+    Args:
+        table_path (str): File path of the table/shapefile
+        fields (list): Field names
+
+    Returns:
+        dict: Field name and NumPy array
+    """
+    if dbf.is_dbf_table(table_path):
+        return dbf.read_dbf_fields(table_path, fields)
+    table_array = arcpy.da.TableToNumPyArray(table_path, fields)
+    return {f: table_array[f] for f in fields}
+
+
+def read_table_field(table_path, field_name):
+    """Read a single table field (see read_table_fields())"""
+    return read_table_fields(table_path, [field_name])[field_name]
+
+
 def add_field_func(hru_param_path, field_name, field_type='DOUBLE'):
     """"""
     if len(field_name) >= 11:
@@ -450,114 +817,715 @@ def zonal_stats_func(zs_dict, polygon_path, point_path, hru_param,
     #        ('\nERROR: There are duplicate {} values\n').format(hru_param.fid_field))
     #    sys.exit()
 
-    # Set environment parameters for polygon to raster conversion
-    env.extent = hru_param.extent
-    env.outputCoordinateSystem = polygon_path
-    # env.cellSize = hru_param.cs
-
-    # Only ~65536 objects can be processed by zonal stats
-    block_size = 65000
-    for i, x in enumerate(range(0, hru_param_count, block_size)):
-        logging.info('  FIDS: {}-{}'.format(x, x + block_size))
-
-        # Create memory objects
-        point_subset_path = '{}/{}'.format('in_memory', 'point_subset')
-        hru_raster_path = '{}/{}'.format('in_memory', 'hru_raster')
-        # point_subset_path = os.path.join('in_memory', 'point_subset')
-        # hru_raster_path = os.path.join('in_memory', 'hru_raster')
-        # point_subset_path = os.path.join(env.scratchWorkspace, 'point_subset.shp')
-        # hru_raster_path = os.path.join(env.scratchWorkspace, 'hru_raster.img')
-
-        # Select a subset of the cell centroids
-        logging.debug('    Selecting FID subset')
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
-        arcpy.Select_analysis(point_path, point_subset_path, subset_str)
-        # Convert points subset to raster
-        logging.debug('    Converting shapefile to raster')
-        arcpy.FeatureToRaster_conversion(
-            point_subset_path, hru_param.fid_field,
-            hru_raster_path, hru_param.cs)
-
-        # Zonal stats
-        logging.debug('    Calculating zonal stats')
-        data_dict = defaultdict(dict)
-        for zs_field, (raster_path, zs_stat) in sorted(zs_dict.items()):
-            zs_name = '{}_{}'.format(zs_field.upper(), i)
-            logging.info('    {}: {}'.format(zs_stat.upper(), zs_name))
-            # For some reason with 10.2, ZS doesn't work with cs at HRU cs
-            env.cellSize = arcpy.sa.Raster(raster_path).meanCellWidth
-            # Calculate zonal statistics
-            zs_table = os.path.join('in_memory', zs_name)
-            # zs_table = os.path.join(env.scratchWorkspace, zs_name+'.dbf')
-            zs_obj = arcpy.sa.ZonalStatisticsAsTable(
-                hru_raster_path, 'Value', raster_path,
-                zs_table, 'DATA', zs_stat.upper())
-
-            # Read values from points
-            logging.debug('    Reading values from zs table')
-            # Fields 1 & 4 are the 'Value' (ORIG_FID) and the stat (SUM, MEAN, etc)
-            fields = [
-                f.name for f_i, f in enumerate(arcpy.ListFields(zs_table))
-                if f_i in [1, 4]]
-            logging.debug('    Fields: {}'.format(', '.join(fields)))
-            for row in arcpy.da.SearchCursor(zs_table, fields):
-                # Set NoData value for cells that are entirely NoData
-                if row[1] is None:
-                    data_dict[int(row[0])][zs_field] = nodata_value
+    # Read the dense HRU zone index array from the zone cache
+    # (or build it once from the HRU centroids)
+    # Zone indices (not FIDs) are used so that the statistics can be
+    #   accumulated for every HRU in a single pass
+    zone_array, fid_array = cached_hru_zone_array(point_path, hru_param)
+    zone_count = fid_array.size
+
+    # Group the fields by raster grid (snapped extent & cellsize)
+    # All rasters on a grid are stacked and reduced together so that
+    #   the zone labels for that grid are only sorted once per block
+    grid_dict = defaultdict(list)
+    for zs_field, (raster_path, zs_stat) in sorted(zs_dict.items()):
+        grid_dict[raster_grid(raster_path, hru_param)].append(
+            [zs_field, raster_path, zs_stat.upper()])
+
+    # Calculate the zonal statistics for every zone at once
+    # Values are NaN for zones with no data cells for that raster
+    stat_dict = dict()
+    data_mask = np.zeros(zone_count, dtype=np.bool)
+    for grid, grid_list in sorted(grid_dict.items()):
+        logging.info('    Grid: {} {} {} ({} x {})'.format(*grid))
+        for zs_field, raster_path, zs_stat in grid_list:
+            logging.info('      {}: {}'.format(zs_stat, zs_field))
+        grid_zone_array = cached_grid_zone_array(
+            grid, zone_array, point_path, hru_param)
+        grid_stat_dict, grid_count_dict = zonal_stats_grid(
+            grid, grid_list, grid_zone_array, zone_count, hru_param)
+        del grid_zone_array
+        for zs_field, stat_array in grid_stat_dict.items():
+            stat_dict[zs_field] = stat_array
+            data_mask |= (grid_count_dict[zs_field] > 0)
+        del grid_stat_dict, grid_count_dict
+
+    # Zones with data for some, but not all parameters, get the nodata value
+    # Zones with no data for any parameter are reset to the default value
+    for zs_field, stat_array in stat_dict.items():
+        stat_array[data_mask & np.isnan(stat_array)] = nodata_value
+        stat_array[~data_mask] = default_value
+
+    # Write all values to polygon in one pass
+    logging.info('    Writing values to polygons')
+    zone_dict = dict(zip(fid_array.tolist(), range(zone_count)))
+    zs_fields = sorted(zs_dict.keys())
+    fields = zs_fields + [hru_param.fid_field]
+    with arcpy.da.UpdateCursor(polygon_path, fields) as u_cursor:
+        for row in u_cursor:
+            # Missing FIDs did not have zonal stats calculated
+            zone_i = zone_dict.get(int(row[-1]), None)
+            for i, zs_field in enumerate(zs_fields):
+                if zone_i is None:
+                    row[i] = default_value
                 else:
-                    data_dict[int(row[0])][zs_field] = float(row[1])
+                    row[i] = float(stat_dict[zs_field][zone_i])
+            u_cursor.updateRow(row)
+    del zone_array, fid_array, stat_dict, zone_dict
 
-            # logging.debug('    Cleanup')
-            try:
-                arcpy.Delete_management(zs_obj)
-            except Exception as e:
-                logging.debug('    Exception: {}'.format(str(e)))
+
+def hru_zone_array(point_path, hru_param):
+    """Build a dense zone index array of the HRU fishnet from the centroids
+
+    Args:
+        point_path (str): File path of the HRU centroid shapefile
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        tuple: zone index array with shape (hru_param.rows, hru_param.cols)
+            (-1 where there is no HRU centroid) and array of the FID
+            values for each zone index
+    """
+    point_array = arcpy.da.FeatureClassToNumPyArray(
+        point_path, [hru_param.fid_field, 'SHAPE@X', 'SHAPE@Y'])
+    fid_array, zone_index = np.unique(
+        point_array[hru_param.fid_field].astype(np.int64),
+        return_inverse=True)
+
+    # Row/Col are 0's based indices from the upper left corner
+    col_array = np.floor(
+        (point_array['SHAPE@X'] - hru_param.extent.XMin) /
+        hru_param.cs).astype(np.int64)
+    row_array = np.floor(
+        (hru_param.extent.YMax - point_array['SHAPE@Y']) /
+        hru_param.cs).astype(np.int64)
+    mask = (
+        (row_array >= 0) & (row_array < hru_param.rows) &
+        (col_array >= 0) & (col_array < hru_param.cols))
+    zone_array = np.full((hru_param.rows, hru_param.cols), -1, dtype=np.int32)
+    zone_array[row_array[mask], col_array[mask]] = zone_index[mask]
+    return zone_array, fid_array
+
+
+def zone_cache_key(point_path, hru_param):
+    """Key of the zone cache for the current fishnet and HRU centroids
+
+    The key changes if the fishnet extent, cellsize, or spatial reference
+    change, or if the HRU centroids are rebuilt (modified time).
+
+    Args:
+        point_path (str): File path of the HRU centroid shapefile
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        str
+    """
+    point_mtime = max(
+        os.path.getmtime(p) for p in [
+            point_path, os.path.splitext(point_path)[0] + '.dbf']
+        if os.path.isfile(p))
+    return hashlib.md5(repr([
+        extent_string(hru_param.extent), float(hru_param.cs),
+        hru_param.sr.exportToString(), os.path.abspath(point_path),
+        point_mtime]).encode('utf-8')).hexdigest()[:16]
+
+
+def zone_cache_ws(point_path, hru_param):
+    """Get the zone cache folder and remove stale zone arrays
+
+    Args:
+        point_path (str): File path of the HRU centroid shapefile
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        tuple: zone cache folder path and zone cache key
+    """
+    cache_ws = os.path.join(hru_param.param_ws, 'zone_cache')
+    if not os.path.isdir(cache_ws):
+        os.mkdir(cache_ws)
+    cache_key = zone_cache_key(point_path, hru_param)
+    for item in os.listdir(cache_ws):
+        if (item.endswith(('.npy', '.npz')) and
+                not item.startswith(cache_key)):
+            logging.debug('    Removing stale zone array: {}'.format(item))
             try:
-                arcpy.Delete_management(zs_table)
-            except Exception as e:
-                logging.debug('    Exception: {}'.format(str(e)))
-            del zs_table, zs_obj, fields
-
-        # Write values to polygon
-        logging.info('    Writing values to polygons')
-        zs_fields = sorted(zs_dict.keys())
-        fields = zs_fields + [hru_param.fid_field]
-        with arcpy.da.UpdateCursor(polygon_path, fields, subset_str) as u_cursor:
-            for row in u_cursor:
-                # Create an empty dictionary if FID does not exist
-                # Missing FIDs did not have zonal stats calculated
-                row_dict = data_dict.get(int(row[-1]), None)
-                for i, zs_field in enumerate(zs_fields):
-                    # If stats were calculated for only some parameters,
-                    #   then set missing parameter value to nodata value (-999)
-                    if row_dict:
-                        try:
-                            row[i] = row_dict[zs_field]
-                        except KeyError:
-                            row[i] = nodata_value
-                    # Otherwise, if no stats were calculated,
-                    #   reset value to 0 (shapefile default)
-                    else:
-                        row[i] = default_value
-                u_cursor.updateRow(row)
-
-        # Cleanup
-        logging.debug('    Cleanup')
-        # try:
-        #     arcpy.Delete_management(point_subset_path)
-        # except Exception as e:
-        #     logging.debug('    Exception: {}'.format(str(e)))
-        # try:
-        #     arcpy.Delete_management(hru_raster_path)
-        # except Exception as e:
-        #     logging.debug('    Exception: {}'.format(str(e)))
-        arcpy.Delete_management('in_memory')
-        del point_subset_path, hru_raster_path, data_dict
+                os.remove(os.path.join(cache_ws, item))
+            except OSError as e:
+                logging.debug('    Exception: {}'.format(e))
+    return cache_ws, cache_key
 
-    arcpy.ClearEnvironment('extent')
-    arcpy.ClearEnvironment('outputCoordinateSystem')
-    arcpy.ClearEnvironment('cellSize')
+
+def save_zone_cache(output_array, output_path):
+    """Save a zone cache array, writing to a temporary file first"""
+    temp_path = output_path.replace('.npy', '_temp.npy')
+    np.save(temp_path, output_array)
+    if os.path.isfile(output_path):
+        os.remove(output_path)
+    os.rename(temp_path, output_path)
+
+
+def cached_hru_zone_array(point_path, hru_param):
+    """Load (or build and save) the HRU zone index array
+
+    The zone arrays are saved in the "zone_cache" folder of the parameter
+    folder and are memory-mapped when they are reused.
+
+    Args:
+        point_path (str): File path of the HRU centroid shapefile
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        tuple: zone index array and FID array (see hru_zone_array())
+    """
+    cache_ws, cache_key = zone_cache_ws(point_path, hru_param)
+    zone_path = os.path.join(cache_ws, '{}_hru.npy'.format(cache_key))
+    fid_path = os.path.join(cache_ws, '{}_fid.npy'.format(cache_key))
+    if os.path.isfile(zone_path) and os.path.isfile(fid_path):
+        logging.debug('    Reading cached HRU zone index array')
+        return np.load(zone_path, mmap_mode='r'), np.load(fid_path)
+
+    logging.debug('    Building HRU zone index array')
+    zone_array, fid_array = hru_zone_array(point_path, hru_param)
+    save_zone_cache(fid_array, fid_path)
+    save_zone_cache(zone_array, zone_path)
+    return zone_array, fid_array
+
+
+def cached_grid_zone_array(grid, zone_array, point_path, hru_param):
+    """Load (or build and save) the HRU zone index array for a raster grid
+
+    Args:
+        grid (tuple): Raster grid from raster_grid()
+        zone_array (np.array): HRU zone index array from hru_zone_array()
+        point_path (str): File path of the HRU centroid shapefile
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        np.array: zone index array with the raster grid shape
+    """
+    cache_ws, cache_key = zone_cache_ws(point_path, hru_param)
+    grid_key = hashlib.md5(repr(grid).encode('utf-8')).hexdigest()[:16]
+    zone_path = os.path.join(
+        cache_ws, '{}_{}.npy'.format(cache_key, grid_key))
+    if os.path.isfile(zone_path):
+        logging.debug('    Reading cached grid zone index array')
+        return np.load(zone_path, mmap_mode='r')
+
+    logging.debug('    Building grid zone index array')
+    grid_zone_array = grid_zone_index_array(grid, zone_array, hru_param)
+    save_zone_cache(grid_zone_array, zone_path)
+    return grid_zone_array
+
+
+def grid_zone_index_array(grid, zone_array, hru_param):
+    """Sample the HRU zone index at each raster grid cell center
+
+    This is equivalent to resampling the HRU zone raster (NEAREST) to the
+    raster cellsize, which is what ZonalStatisticsAsTable does internally.
+
+    Args:
+        grid (tuple): Raster grid from raster_grid()
+        zone_array (np.array): HRU zone index array from hru_zone_array()
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        np.array: zone index array with the raster grid shape
+            (-1 for cells outside the fishnet)
+    """
+    grid_xmin, grid_ymax, grid_cs, grid_rows, grid_cols = grid
+    hru_cols, hru_rows = grid_hru_indices(grid, hru_param)
+    col_mask = (hru_cols >= 0) & (hru_cols < hru_param.cols)
+    row_mask = (hru_rows >= 0) & (hru_rows < hru_param.rows)
+    grid_zone_array = np.full((grid_rows, grid_cols), -1, dtype=np.int32)
+    grid_zone_array[np.ix_(row_mask, col_mask)] = zone_array[
+        np.ix_(hru_rows[row_mask], hru_cols[col_mask])]
+    return grid_zone_array
+
+
+def grid_hru_indices(grid, hru_param):
+    """HRU col and row (0's based) of each raster grid col and row center"""
+    grid_xmin, grid_ymax, grid_cs, grid_rows, grid_cols = grid
+    hru_cols = np.floor(
+        (grid_xmin - hru_param.extent.XMin +
+         (np.arange(grid_cols) + 0.5) * grid_cs) /
+        hru_param.cs).astype(np.int64)
+    hru_rows = np.floor(
+        (hru_param.extent.YMax - grid_ymax +
+         (np.arange(grid_rows) + 0.5) * grid_cs) /
+        hru_param.cs).astype(np.int64)
+    return hru_cols, hru_rows
+
+
+def raster_grid(raster_path, hru_param):
+    """Get the raster grid that covers the fishnet extent
+
+    Args:
+        raster_path (str): File path of the value raster
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        tuple: XMin, YMax, cellsize, rows, and cols of the fishnet extent
+            expanded to the raster snap point
+    """
+    raster_obj = arcpy.sa.Raster(raster_path)
+    raster_cs = raster_obj.meanCellWidth
+    raster_extent = adjust_extent_to_snap(
+        hru_param.extent, raster_obj.extent.lowerLeft, raster_cs,
+        method='EXPAND', digits=6)
+    raster_rows = int(round(
+        (raster_extent.YMax - raster_extent.YMin) / raster_cs))
+    raster_cols = int(round(
+        (raster_extent.XMax - raster_extent.XMin) / raster_cs))
+    return (raster_extent.XMin, raster_extent.YMax, raster_cs,
+            raster_rows, raster_cols)
+
+
+def zonal_stats_grid(grid, grid_list, grid_zone_array, zone_count,
+                     hru_param, block_cells=2 ** 24):
+    """Calculate zonal statistics for all rasters that share a grid
+
+    The grid is processed in blocks of whole HRU rows so that memory use
+    is bounded but zones are never split across blocks.
+
+    Args:
+        grid (tuple): Raster grid from raster_grid()
+        grid_list (list): [zs_field, raster_path, zs_stat] items
+        grid_zone_array (np.array): Zone index array for the raster grid
+            from cached_grid_zone_array()
+        zone_count (int): Number of zones
+        hru_param: class:`HRUParameters`
+        block_cells (int): Approximate number of values to read per block
+
+    Returns:
+        tuple: dictionaries of the statistic and cell count arrays
+            for each zs_field
+    """
+    grid_xmin, grid_ymax, grid_cs, grid_rows, grid_cols = grid
+
+    # Stack each raster once, even if it is used for multiple statistics
+    raster_path_list = sorted(set(item[1] for item in grid_list))
+    raster_obj_list = [arcpy.sa.Raster(p) for p in raster_path_list]
+    stack_list = [
+        [raster_path_list.index(raster_path), zs_stat]
+        for zs_field, raster_path, zs_stat in grid_list]
+
+    # Raster cell centers to HRU row (for aligning the blocks)
+    hru_rows = grid_hru_indices(grid, hru_param)[1]
+
+    stat_dict = dict(
+        (item[0], np.full(zone_count, np.nan, dtype=np.float64))
+        for item in grid_list)
+    count_dict = dict(
+        (item[0], np.zeros(zone_count, dtype=np.int64))
+        for item in grid_list)
+
+    block_rows = max(
+        1, int(block_cells // (grid_cols * len(raster_path_list))))
+    row_i = 0
+    while row_i < grid_rows:
+        # Extend the block to the end of the HRU row
+        row_j = min(row_i + block_rows, grid_rows)
+        while (row_j < grid_rows and
+               hru_rows[row_j] == hru_rows[row_j - 1]):
+            row_j += 1
+        logging.debug('      Rows: {}-{}'.format(row_i, row_j))
+
+        block_zone_array = np.array(grid_zone_array[row_i:row_j])
+        if not np.any(block_zone_array >= 0):
+            row_i = row_j
+            continue
+
+        # Raster NoData cells are set to NaN in the stack
+        value_stack = np.empty(
+            (len(raster_obj_list), row_j - row_i, grid_cols),
+            dtype=np.float64)
+        block_pnt = arcpy.Point(grid_xmin, grid_ymax - row_j * grid_cs)
+        for i, raster_obj in enumerate(raster_obj_list):
+            raster_nodata = raster_obj.noDataValue
+            block_array = arcpy.RasterToNumPyArray(
+                raster_obj, block_pnt, grid_cols, row_j - row_i,
+                raster_nodata)
+            value_stack[i] = block_array
+            if raster_nodata is not None:
+                value_stack[i][block_array == raster_nodata] = np.nan
+            del block_array
+
+        zone_list, stat_array, count_array = zonal_stats_stack(
+            block_zone_array, value_stack, stack_list)
+        for i, item in enumerate(grid_list):
+            stat_dict[item[0]][zone_list] = stat_array[i]
+            count_dict[item[0]][zone_list] = count_array[i]
+        del block_zone_array, value_stack
+        del zone_list, stat_array, count_array
+        row_i = row_j
+
+    del raster_obj_list
+    return stat_dict, count_dict
+
+
+def zonal_stats_stack(zone_array, value_stack, stack_list):
+    """Calculate statistics for a stack of rasters in one pass over the zones
+
+    The zone labels are sorted once and every raster in the stack is
+    reduced over the same sorted order (np.add/minimum/maximum.reduceat).
+    NaN values in the stack are treated as NoData.
+
+    Args:
+        zone_array (np.array): Zone indices, negative values are skipped
+        value_stack (np.array): Values with shape (n,) + zone_array.shape
+        stack_list (list): [stack index, zs_stat] for each output statistic
+
+    Returns:
+        tuple: array of the zones present, and statistic and cell count
+            arrays with shape (len(stack_list), number of zones present)
+    """
+    zones = zone_array.ravel()
+    cell_i = np.flatnonzero(zones >= 0)
+    cell_i = cell_i[np.argsort(zones[cell_i], kind='mergesort')]
+    zones = zones[cell_i]
+    start_mask = np.concatenate(([True], zones[1:] != zones[:-1]))
+    start_i = np.flatnonzero(start_mask)
+    zone_list = zones[start_i]
+    local_zones = np.cumsum(start_mask) - 1
+
+    values = value_stack.reshape(value_stack.shape[0], -1)[:, cell_i]
+    data_mask = np.isfinite(values)
+    count_stack = np.add.reduceat(
+        data_mask.astype(np.int64), start_i, axis=1)
+
+    stat_array = np.full((len(stack_list), zone_list.size), np.nan)
+    count_array = np.zeros((len(stack_list), zone_list.size), dtype=np.int64)
+    for i, (stack_i, zs_stat) in enumerate(stack_list):
+        count_array[i] = count_stack[stack_i]
+        zone_mask = count_array[i] > 0
+        if zs_stat in ['MEAN', 'SUM']:
+            sum_array = np.add.reduceat(
+                np.where(data_mask[stack_i], values[stack_i], 0),
+                start_i)
+            if zs_stat == 'MEAN':
+                stat_array[i][zone_mask] = (
+                    sum_array[zone_mask] / count_array[i][zone_mask])
+            else:
+                stat_array[i][zone_mask] = sum_array[zone_mask]
+        elif zs_stat == 'MINIMUM':
+            stat_array[i][zone_mask] = np.minimum.reduceat(
+                np.where(data_mask[stack_i], values[stack_i], np.inf),
+                start_i)[zone_mask]
+        elif zs_stat == 'MAXIMUM':
+            stat_array[i][zone_mask] = np.maximum.reduceat(
+                np.where(data_mask[stack_i], values[stack_i], -np.inf),
+                start_i)[zone_mask]
+        elif zs_stat == 'MAJORITY':
+            stat_array[i] = zonal_stats_array(
+                np.where(data_mask[stack_i], local_zones, -1),
+                values[stack_i], zone_list.size, zs_stat)[0]
+        else:
+            raise ValueError('Unsupported zonal statistic: {}'.format(zs_stat))
+    return zone_list, stat_array, count_array
+
+
+def zonal_stats_array(zone_array, value_array, zone_count, zs_stat='MEAN'):
+    """Calculate a statistic of the value array for every zone
+
+    All zones are processed in one pass using np.bincount (MEAN, SUM),
+    np.minimum.at/np.maximum.at (MINIMUM, MAXIMUM), or a sort of the zone
+    and value pairs (MAJORITY).  Ties in the MAJORITY are assigned the
+    lowest value.
+
+    Args:
+        zone_array (np.array): Zone indices (0 to zone_count - 1)
+            Cells with a negative zone index are skipped
+        value_array (np.array): Values with the same shape as zone_array
+        zone_count (int): Number of zones
+        zs_stat (str): MEAN, MINIMUM, MAXIMUM, SUM, or MAJORITY
+
+    Returns:
+        tuple: statistic and cell count arrays with length zone_count
+            The statistic is NaN for zones with no cells
+    """
+    mask = zone_array >= 0
+    zones = zone_array[mask].astype(np.int64)
+    values = value_array[mask].astype(np.float64)
+    count_array = np.bincount(zones, minlength=zone_count)
+    data_mask = count_array > 0
+
+    stat_array = np.full(zone_count, np.nan, dtype=np.float64)
+    if zs_stat in ['MEAN', 'SUM']:
+        sum_array = np.bincount(zones, weights=values, minlength=zone_count)
+        if zs_stat == 'MEAN':
+            stat_array[data_mask] = (
+                sum_array[data_mask] / count_array[data_mask])
+        else:
+            stat_array[data_mask] = sum_array[data_mask]
+    elif zs_stat == 'MINIMUM':
+        temp_array = np.full(zone_count, np.inf, dtype=np.float64)
+        np.minimum.at(temp_array, zones, values)
+        stat_array[data_mask] = temp_array[data_mask]
+    elif zs_stat == 'MAXIMUM':
+        temp_array = np.full(zone_count, -np.inf, dtype=np.float64)
+        np.maximum.at(temp_array, zones, values)
+        stat_array[data_mask] = temp_array[data_mask]
+    elif zs_stat == 'MAJORITY':
+        if zones.size:
+            # Count the runs of each unique zone/value pair
+            sort_i = np.lexsort((values, zones))
+            zones, values = zones[sort_i], values[sort_i]
+            run_start = np.concatenate((
+                [True], (zones[1:] != zones[:-1]) | (values[1:] != values[:-1])))
+            run_i = np.flatnonzero(run_start)
+            run_count = np.diff(np.append(run_i, zones.size))
+            run_zones, run_values = zones[run_i], values[run_i]
+            # Keep the most common (then the lowest) value in each zone
+            sort_i = np.lexsort((run_values, -run_count, run_zones))
+            first_mask = np.concatenate((
+                [True], run_zones[sort_i][1:] != run_zones[sort_i][:-1]))
+            stat_array[run_zones[sort_i][first_mask]] = (
+                run_values[sort_i][first_mask])
+    else:
+        raise ValueError('Unsupported zonal statistic: {}'.format(zs_stat))
+    return stat_array, count_array
+
+
+def weighted_stats_func(zs_dict, hru_param, nodata_value=-999,
+                        default_value=0):
+    """Area weighted mean of native (unprojected) rasters for each HRU
+
+    The HRU cells are projected to the grid of the source raster and the
+    fraction of each source cell in each HRU is saved as a sparse (CSR)
+    weight matrix in the zone cache.  The matrix is only built once for
+    each source grid, so every raster on that grid is a single read of
+    the raster and a single sparse matrix-vector product (no ProjectRaster
+    or Clip).  The nodata and default values are set like
+    zonal_stats_func().
+
+    Args:
+        zs_dict (dict): [raster_path, zs_stat] for each HRU field
+            (only MEAN is supported)
+        hru_param: class:`HRUParameters`
+        nodata_value (float): Value for HRUs missing some of the rasters
+        default_value (float): Value for HRUs missing all of the rasters
+
+    Returns:
+        None
+    """
+    for zs_field, (raster_path, zs_stat) in sorted(zs_dict.items()):
+        logging.info('  {}: {}'.format(zs_field, zs_stat))
+        logging.info('    {}'.format(raster_path))
+        if zs_stat.upper() != 'MEAN':
+            logging.error(
+                '\nERROR: Only MEAN weighted statistics are supported')
+            sys.exit()
+        elif len(arcpy.ListFields(hru_param.polygon_path, zs_field)) == 0:
+            logging.error('\nERROR: Zonal stats field {} doesn\'t exist'.format(
+                zs_field))
+            sys.exit()
+
+    # Group the fields by source raster grid & spatial reference
+    grid_dict = defaultdict(list)
+    for zs_field, (raster_path, zs_stat) in sorted(zs_dict.items()):
+        raster_obj = arcpy.sa.Raster(raster_path)
+        grid = (
+            raster_obj.extent.XMin, raster_obj.extent.YMax,
+            raster_obj.meanCellWidth, raster_obj.height, raster_obj.width,
+            raster_obj.spatialReference.exportToString())
+        grid_dict[grid].append([zs_field, raster_path])
+        del raster_obj
+
+    # Fishnet cell (0's based flat index) of each HRU
+    hru_table = HRUTable(
+        hru_param, [hru_param.row_field, hru_param.col_field])
+    cell_array = (
+        (hru_table[hru_param.row_field].astype(np.int64) - 1) *
+        hru_param.cols +
+        hru_table[hru_param.col_field].astype(np.int64) - 1)
+
+    # Values are NaN for HRUs with no data cells for that raster
+    stat_dict = dict()
+    data_mask = np.zeros(hru_table.count, dtype=np.bool)
+    for grid, grid_list in sorted(grid_dict.items()):
+        logging.info('    Grid: {} {} {} ({} x {})'.format(*grid[:5]))
+        indptr, index_array, weight_array, window = cached_source_weights(
+            grid, hru_param)
+        for zs_field, raster_path in grid_list:
+            logging.info('      MEAN: {}'.format(zs_field))
+            value_array = source_window_array(raster_path, grid, window)
+            mean_array, weight_sum = polygon.weighted_mean(
+                indptr, index_array, weight_array, value_array)
+            stat_dict[zs_field] = mean_array[cell_array]
+            data_mask |= (weight_sum[cell_array] > 0)
+            del value_array, mean_array, weight_sum
+        del indptr, index_array, weight_array
+
+    # HRUs with data for some, but not all parameters, get the nodata value
+    # HRUs with no data for any parameter are reset to the default value
+    for zs_field, stat_array in stat_dict.items():
+        stat_array[data_mask & np.isnan(stat_array)] = nodata_value
+        stat_array[~data_mask] = default_value
+        hru_table[zs_field] = stat_array
+
+    # Write all values to polygon in one pass
+    logging.info('    Writing values to polygons')
+    hru_table.flush()
+    del hru_table, stat_dict
+
+
+def cached_source_weights(grid, hru_param):
+    """Load (or build and save) the HRU weights for a source raster grid
+
+    Args:
+        grid (tuple): XMin, YMax, cellsize, rows, cols and spatial reference
+            string of the source raster
+        hru_param: class:`HRUParameters`
+
+    Returns:
+        tuple: CSR index pointer, index and weight arrays
+            and the source window (see source_weights())
+    """
+    input_sr = arcpy.SpatialReference()
+    input_sr.loadFromString(grid[5])
+    transform_str = transform_func(hru_param.sr, input_sr)
+    if transform_str:
+        logging.debug('    Transform: {}'.format(transform_str))
+
+    cache_ws, cache_key = zone_cache_ws(hru_param.point_path, hru_param)
+    grid_key = hashlib.md5(repr([grid, transform_str]).encode(
+        'utf-8')).hexdigest()[:16]
+    weight_path = os.path.join(
+        cache_ws, '{}_{}_weights.npz'.format(cache_key, grid_key))
+    if os.path.isfile(weight_path):
+        logging.debug('    Reading cached HRU weights')
+        weight_npz = np.load(weight_path)
+        try:
+            return (weight_npz['indptr'], weight_npz['index'],
+                    weight_npz['weight'], tuple(weight_npz['window']))
+        finally:
+            weight_npz.close()
+
+    logging.debug('    Building HRU weights')
+    indptr, index_array, weight_array, window = source_weights(
+        grid, input_sr, transform_str, hru_param)
+    logging.debug('    HRU weights: {}'.format(weight_array.size))
+    temp_path = weight_path.replace('.npz', '_temp.npz')
+    np.savez(
+        temp_path, indptr=indptr, index=index_array, weight=weight_array,
+        window=np.array(window, dtype=np.int64))
+    if os.path.isfile(weight_path):
+        os.remove(weight_path)
+    os.rename(temp_path, weight_path)
+    return indptr, index_array, weight_array, window
+
+
+def source_weights(grid, input_sr, transform_str, hru_param,
+                   block_cells=2 ** 20):
+    """Sparse weight matrix of the source raster cells in each HRU cell
+
+    The corners of the fishnet cells are projected to the source raster
+    spatial reference (so the cell edges are straight lines between the
+    projected corners) and the area of each source cell in each fishnet
+    cell is computed exactly with polygon.polygon_weights().  The weights
+    are in units of source cells.
+
+    Args:
+        grid (tuple): Source raster grid (see cached_source_weights())
+        input_sr: Source raster spatial reference
+        transform_str (str): Geographic transformation
+        hru_param: class:`HRUParameters`
+        block_cells (int): Approximate number of fishnet cells per block
+
+    Returns:
+        tuple: CSR index pointer (fishnet cells in row major order),
+            index (flat index in the source window) and weight arrays,
+            and the source window (row, col, rows, cols)
+    """
+    grid_xmin, grid_ymax, grid_cs, grid_rows, grid_cols = grid[:5]
+    x_array = (
+        hru_param.extent.XMin +
+        np.arange(hru_param.cols + 1) * hru_param.cs)
+
+    indptr_list = [np.zeros(1, dtype=np.int64)]
+    index_list, weight_list = [], []
+    block_rows = max(1, int(block_cells // hru_param.cols))
+    for row_i in range(0, hru_param.rows, block_rows):
+        row_j = min(row_i + block_rows, hru_param.rows)
+        logging.debug('      Rows: {}-{}'.format(row_i, row_j))
+
+        # Project each row of cell corners as a multipoint
+        corner_x = np.empty((row_j - row_i + 1, hru_param.cols + 1))
+        corner_y = np.empty((row_j - row_i + 1, hru_param.cols + 1))
+        for i, row in enumerate(range(row_i, row_j + 1)):
+            y = hru_param.extent.YMax - row * hru_param.cs
+            row_geom = arcpy.Multipoint(
+                arcpy.Array([arcpy.Point(x, y) for x in x_array]),
+                hru_param.sr)
+            if transform_str:
+                row_geom = row_geom.projectAs(input_sr, transform_str)
+            else:
+                row_geom = row_geom.projectAs(input_sr)
+            corner_list = [
+                row_geom.getPart(j) for j in range(row_geom.pointCount)]
+            corner_x[i] = [pnt.X for pnt in corner_list]
+            corner_y[i] = [pnt.Y for pnt in corner_list]
+            del row_geom, corner_list
+
+        # Fishnet cell polygons (upper left, upper right,
+        #   lower right, lower left corners)
+        cell_x = np.dstack([
+            corner_x[:-1, :-1], corner_x[:-1, 1:],
+            corner_x[1:, 1:], corner_x[1:, :-1]]).reshape(-1, 4)
+        cell_y = np.dstack([
+            corner_y[:-1, :-1], corner_y[:-1, 1:],
+            corner_y[1:, 1:], corner_y[1:, :-1]]).reshape(-1, 4)
+        block_indptr, block_index, block_weight = polygon.polygon_weights(
+            cell_x, cell_y, grid_xmin, grid_ymax, grid_cs,
+            grid_rows, grid_cols)
+        indptr_list.append(indptr_list[-1][-1] + block_indptr[1:])
+        index_list.append(block_index)
+        weight_list.append(block_weight)
+        del corner_x, corner_y, cell_x, cell_y
+    indptr = np.concatenate(indptr_list)
+    index_array = np.concatenate(index_list)
+    weight_array = np.concatenate(weight_list)
+    if not index_array.size:
+        logging.error(
+            '\nERROR: The fishnet does not overlap the source raster\n')
+        sys.exit()
+
+    # Only the window of the source raster that is used is read
+    index_rows, index_cols = index_array // grid_cols, index_array % grid_cols
+    window = (
+        int(index_rows.min()), int(index_cols.min()),
+        int(index_rows.max() - index_rows.min() + 1),
+        int(index_cols.max() - index_cols.min() + 1))
+    index_array = (
+        (index_rows - window[0]) * window[3] + index_cols - window[1])
+    return indptr, index_array, weight_array, window
+
+
+def source_window_array(raster_path, grid, window):
+    """Read a window of a source raster (NoData cells are set to NaN)
+
+    Args:
+        raster_path (str): File path of the source raster
+        grid (tuple): Source raster grid (see cached_source_weights())
+        window (tuple): Row, col, rows and cols of the window
+
+    Returns:
+        np.array
+    """
+    grid_xmin, grid_ymax, grid_cs = grid[:3]
+    window_row, window_col, window_rows, window_cols = window
+    raster_obj = arcpy.sa.Raster(raster_path)
+    raster_nodata = raster_obj.noDataValue
+    window_pnt = arcpy.Point(
+        grid_xmin + window_col * grid_cs,
+        grid_ymax - (window_row + window_rows) * grid_cs)
+    input_array = arcpy.RasterToNumPyArray(
+        raster_obj, window_pnt, window_cols, window_rows, raster_nodata)
+    value_array = input_array.astype(np.float64)
+    if raster_nodata is not None:
+        value_array[input_array == raster_nodata] = np.nan
+    del raster_obj, input_array
+    return value_array
 
 
 def field_duplicate_check(table_path, field_name, n=None):
@@ -573,6 +1541,16 @@ def field_duplicate_check(table_path, field_name, n=None):
     Returns:
         bool: True if there are duplicate values in the field, False otherwise
     """
+    if dbf.is_dbf_table(table_path):
+        # Read all values directly from the .dbf file
+        logging.debug('\n  Testing for duplicate values')
+        logging.debug('    field:    {}'.format(field_name))
+        value_array = dbf.read_dbf_field(table_path, field_name)
+        if np.unique(value_array).size != value_array.size:
+            return True
+        else:
+            logging.debug('    No duplicates')
+            return False
 
     # Eventually check that field is in table
     field_obj = arcpy.ListFields(table_path, field_name)[0]
@@ -1034,93 +2012,70 @@ def zone_by_area_func(zone_path, zone_field, zone_value, hru_param_path,
 
     Set values that are in zone, but don't reset values that are out of zone
 
+    The fraction of each fishnet cell that is covered by each zone is
+    computed from the zone polygons and the fishnet lattice (see
+    polygon_functions.zone_coverage()) instead of intersecting the
+    fishnet with the zones.  If a cell is covered by more than one zone,
+    the zone with the largest fraction is used.
+
     Args:
         zone_path (str):
         zone_field (str):
-        zone_value (int):
+        zone_value (int): Value (int) or field name.  If the field is the
+            OID field, the OID + 1 is used so that only non-zone cells
+            are 0
         hru_param_path (str):
         hru_param: class:`HRUParameters`
         hru_area_field (str):
-        zone_area_field (str):
-        area_pct ():
+        zone_area_field (str): Field for the zone area of the cell
+            (in the units of the hru_area_field)
+        area_pct (): Minimum percent of the cell that must be in the zone
 
     Returns:
         None
     """
-    zone_value_field = 'ZONE_VALUE'
-    int_area_field = 'INT_AREA'
-    int_pct_field = 'INT_PCT'
-
-    # Need to set zone value into a field before intersect
-    # If zone_value is FID, add 1 so that only non-lake cells are 0
-    arcpy.AddField_management(zone_path, zone_value_field, 'LONG')
-    arcpy.AddField_management(zone_path, int_area_field, 'DOUBLE')
-    arcpy.AddField_management(zone_path, int_pct_field, 'DOUBLE')
-    if zone_value == arcpy.Describe(zone_path).OIDFieldName:
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{}! + 1'.format(zone_value), 'PYTHON')
-
-    # If zone value is an INT, save it into a field first
-    elif type(zone_value) is int:
-        # zone_value = int(zone_value)
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field, zone_value, 'PYTHON')
-    # Use zone_value field directly
-    else:
-        # zone_value_field = zone_value
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{}!'.format(zone_value), 'PYTHON')
-
-    # Calculate area of HRU cell if necessary
-    # if not arcpy.ListFields(zone_path, area_field):
-    #    arcpy.AddField_management(zone_path, area_field, 'DOUBLE')
-    #    cell_area_func(zone_path, area_field)
-
-    # Intersect the zone layer with the fishnet
-    # zone_int_path = os.path.join('in_memory', 'hru_lakes')
-    zone_int_path = zone_path.replace('.shp', '_intersect.shp')
-    arcpy.Intersect_analysis(
-        (hru_param_path, zone_path), zone_int_path)
-
-    # Calculate using cell_area_func to force units to match
-    cell_area_func(zone_int_path, int_area_field)
-
-    n = int(arcpy.GetCount_management(zone_int_path).getOutput(0))
-    block_size = 200000
-    for i, x in enumerate(range(0, n, block_size)):
-        logging.debug('    FIDS: {}-{}'.format(x, x + block_size))
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
-            # arcpy.Describe(zone_int_path).OIDFieldName, x, x + block_size)
-
-        # Read in FID of selected cells
-        hru_cell_dict = dict()
-        fields = [
-            hru_param.fid_field, hru_area_field,
-            int_area_field, zone_value_field]
-        with arcpy.da.SearchCursor(zone_int_path, fields, subset_str) as s_cursor:
-            for row in s_cursor:
-                if (100 * float(row[2]) / float(row[1])) >= area_pct:
-                    hru_cell_dict[int(row[0])] = [float(row[3]), float(row[2])]
-
-        # Set value of selected HRU cells
-        fields = [hru_param.fid_field, zone_field]
-        if zone_area_field:
-            fields.append(zone_area_field)
-        with arcpy.da.UpdateCursor(hru_param_path, fields, subset_str) as u_cursor:
-            for row in u_cursor:
-                # Remove items to speed up subsequent searches
-                try:
-                    if len(fields) == 3:
-                        row[1], row[2] = hru_cell_dict.pop(int(row[0]))
-                    elif len(fields) == 2:
-                        row[1] = hru_cell_dict.pop(int(row[0]))
-                    u_cursor.updateRow(row)
-                except KeyError:
-                    pass
-        del hru_cell_dict
+    logging.debug('\nzone_by_area_func')
+    logging.debug('  {}'.format(zone_path))
+    polygon_list, value_list = zone_polygons(zone_path, zone_value)
+
+    # Cell coverage fraction of each zone
+    cell_array, zone_array, fraction_array = polygon.zone_coverage(
+        polygon_list, np.array(value_list, dtype=np.int64),
+        hru_param.extent.XMin, hru_param.extent.YMax, hru_param.cs,
+        hru_param.rows, hru_param.cols)
+    del polygon_list, value_list
+
+    # Keep the largest zone fraction of each cell that is large enough
+    fraction_mask = (100 * fraction_array) >= area_pct
+    cell_array = cell_array[fraction_mask]
+    zone_array = zone_array[fraction_mask]
+    fraction_array = fraction_array[fraction_mask]
+    sort_i = np.lexsort((-fraction_array, cell_array))
+    cell_array, first_i = np.unique(cell_array[sort_i], return_index=True)
+    zone_array = zone_array[sort_i][first_i]
+    fraction_array = fraction_array[sort_i][first_i]
+    logging.debug('    Cells in a zone: {}'.format(cell_array.size))
+    if not cell_array.size:
+        return
+
+    # Set value of selected HRU cells
+    fields = [hru_param.row_field, hru_param.col_field, zone_field]
+    if zone_area_field:
+        fields.extend([hru_area_field, zone_area_field])
+    hru_table = HRUTable(hru_param, fields)
+    hru_cell_array = (
+        (hru_table[hru_param.row_field].astype(np.int64) - 1) *
+        hru_param.cols + hru_table[hru_param.col_field].astype(np.int64) - 1)
+    hru_index = sorted_index(cell_array, hru_cell_array)
+    hru_mask = hru_index >= 0
+    hru_table[zone_field] = np.where(
+        hru_mask, zone_array[hru_index], hru_table[zone_field])
+    if zone_area_field:
+        hru_table[zone_area_field] = np.where(
+            hru_mask, fraction_array[hru_index] * hru_table[hru_area_field],
+            hru_table[zone_area_field])
+    hru_table.flush()
+    del hru_table
 
 
 def zone_by_centroid_func(zone_path, zone_field, zone_value,
@@ -1129,12 +2084,20 @@ def zone_by_centroid_func(zone_path, zone_field, zone_value,
 
     Set values that are in zone, but don't reset values that are out of zone
 
+    The HRU centroids are the cell centers of the fishnet lattice, so the
+    zone polygons are rasterized directly to the fishnet rows and columns
+    (see polygon_functions.rasterize_polygons()) instead of intersecting
+    the centroids with the zones.  Where zones overlap, the value of the
+    last zone feature is used.
+
     Args:
         zone_path (str):
         zone_field (str):
-        zone_value (int):
+        zone_value (int): Value (int) or field name.  If the field is the
+            OID field, the OID + 1 is used so that only zone cells are 0
         hru_param_path (str):
-        hru_point_path (str):
+        hru_point_path (str): Not read (the centroids are on the fishnet
+            lattice)
         hru_param: class:`HRUParameters`
 
     Returns:
@@ -1142,70 +2105,96 @@ def zone_by_centroid_func(zone_path, zone_field, zone_value,
     """
     logging.debug('\nzone_by_centroid_func')
     logging.debug('  {}'.format(zone_path))
-    # Need to set zone value into a field before intersect
-    # If zone_value is FID, add 1 so that only zone cells are 0
-    zone_value_field = 'ZONE_VALUE'
-    arcpy.AddField_management(zone_path, zone_value_field, 'LONG')
-    if zone_value == arcpy.Describe(zone_path).OIDFieldName:
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{}! + 1'.format(zone_value), 'PYTHON')
-    # Save zone value into a field first
-    elif type(zone_value) is int:
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field, zone_value, 'PYTHON')
-        # DEADBEEF
-        # Use zone_value field directly
-        # zone_value = int(zone_value)
+
+    polygon_list, value_list = zone_polygons(zone_path, zone_value)
+
+    # Zone values of the fishnet cells
+    zone_array, zone_mask = polygon.rasterize_polygons(
+        polygon_list, np.array(value_list, dtype=np.int64),
+        hru_param.extent.XMin, hru_param.extent.YMax, hru_param.cs,
+        hru_param.rows, hru_param.cols)
+    del polygon_list, value_list
+
+    # Set value of HRU cells in a zone
+    hru_table = HRUTable(
+        hru_param, [hru_param.row_field, hru_param.col_field, zone_field])
+    row_array = hru_table[hru_param.row_field].astype(np.int64) - 1
+    col_array = hru_table[hru_param.col_field].astype(np.int64) - 1
+    cell_mask = (
+        (row_array >= 0) & (row_array < hru_param.rows) &
+        (col_array >= 0) & (col_array < hru_param.cols))
+    hru_mask = np.zeros(hru_table.count, dtype=np.bool)
+    hru_mask[cell_mask] = zone_mask[row_array[cell_mask], col_array[cell_mask]]
+    logging.debug('    HRUs in a zone: {}'.format(np.sum(hru_mask)))
+    hru_table[zone_field] = np.where(
+        hru_mask,
+        zone_array[np.where(cell_mask, row_array, 0),
+                   np.where(cell_mask, col_array, 0)],
+        hru_table[zone_field])
+    hru_table.flush()
+    del hru_table
+
+
+def zone_polygons(zone_path, zone_value):
+    """Read the zone polygon rings and values
+
+    Args:
+        zone_path (str): File path of the zone polygons
+        zone_value (int): Value (int) or field name.  If the field is the
+            OID field, the OID + 1 is used so that only non-zone cells
+            are 0
+
+    Returns:
+        tuple: list of the polygon rings (see geometry_rings()) and list
+            of the zone values
+    """
+    if type(zone_value) is int:
+        fields = ['SHAPE@']
     else:
-        arcpy.CalculateField_management(
-            zone_path, zone_value_field,
-            '!{}!'.format(zone_value), 'PYTHON')
-        # DEADBEEF
-        # Use zone_value field directly
-        # zone_value_field = zone_value
-
-    # Intersect the zone layer with the fishnet
-    # zone_int_path = os.path.join('in_memory', 'hru_ppt_zones')
-    zone_int_path = zone_path.replace('.shp', '_intersect.shp')
-    arcpy.Intersect_analysis(
-        (hru_point_path, zone_path), zone_int_path)
-
-    # DEADBEEF - Why do I make a layer and select all features?
-    zone_int_layer = 'zone_int_layer'
-    arcpy.MakeFeatureLayer_management(zone_int_path, zone_int_layer)
-    arcpy.SelectLayerByAttribute_management(zone_int_layer, 'CLEAR_SELECTION')
-    arcpy.SelectLayerByAttribute_management(zone_int_layer, 'SWITCH_SELECTION')
-
-    n = int(arcpy.GetCount_management(zone_int_layer).getOutput(0))
-    block_size = 200000
-    for i, x in enumerate(range(0, n, block_size)):
-        logging.debug('    FIDS: {}-{}'.format(x, x + block_size))
-        subset_str = '"{0}" >= {1} AND "{0}" < {2}'.format(
-            hru_param.fid_field, x, x + block_size)
-            # arcpy.Describe(zone_int_layer).OIDFieldName, x, x + block_size)
-
-        # Read in FID of selected cells
-        hru_point_dict = dict()
-        fields = (hru_param.fid_field, zone_value_field)
-        with arcpy.da.SearchCursor(zone_int_layer, fields, subset_str) as s_cursor:
-            for row in s_cursor:
-                hru_point_dict[int(row[0])] = row[1]
+        fields = ['SHAPE@', zone_value]
+    oid_flag = (zone_value == arcpy.Describe(zone_path).OIDFieldName)
+    polygon_list = []
+    value_list = []
+    with arcpy.da.SearchCursor(zone_path, fields) as s_cursor:
+        for row in s_cursor:
+            if row[0] is None:
+                continue
+            polygon_list.append(geometry_rings(row[0]))
+            if type(zone_value) is int:
+                value_list.append(zone_value)
+            elif oid_flag:
+                value_list.append(int(row[1]) + 1)
+            else:
+                value_list.append(int(row[1]))
+    logging.debug('    Zones: {}'.format(len(polygon_list)))
+    return polygon_list, value_list
 
-        # Set value of selected HRU cells
-        fields = (hru_param.fid_field, zone_field)
-        with arcpy.da.UpdateCursor(hru_param_path, fields, subset_str) as u_cursor:
-            for row in u_cursor:
-                # Remove items to speed up subsequent searches
-                try:
-                    row[1] = hru_point_dict.pop(int(row[0]))
-                    u_cursor.updateRow(row)
-                except KeyError:
-                    pass
-        del hru_point_dict
 
-    # Cleanup
-    arcpy.Delete_management(zone_int_layer)
+def geometry_rings(geometry):
+    """Rings of a polygon geometry as lists of x, y points
+
+    The interior rings of a part follow the exterior ring and are
+    separated by a null point.
+
+    Args:
+        geometry: arcpy Polygon geometry
+
+    Returns:
+        list
+    """
+    ring_list = []
+    for part in geometry:
+        ring = []
+        for pnt in part:
+            if pnt is None:
+                if ring:
+                    ring_list.append(ring)
+                ring = []
+            else:
+                ring.append((pnt.X, pnt.Y))
+        if ring:
+            ring_list.append(ring)
+    return ring_list
 
 
 def jensen_haise_func(hru_param_path, jh_coef_field, dem_field,
@@ -1368,15 +2357,6 @@ def remap_code_block(remap_path):
 #    return raster_obj
 
 
-def is_number(s):
-    """"""
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
-
-
 def raster_path_to_array(input_path, mask_extent=None, return_nodata=False):
     """"""
     return raster_obj_to_array(
@@ -1415,6 +2395,37 @@ def raster_obj_to_array(input_obj, mask_extent=None, return_nodata=False):
         return output_array
 
 
+def fill_raster_func(input_obj, output_path, epsilon=0):
+    """Fill depressions in a raster (see flow.priority_flood_fill())
+
+    Nodata cells (i.e. SWALE/OUTLET cells) are treated as outlets like
+    arcpy.sa.Fill.
+
+    Args:
+        input_obj: arcpy.sa.Raster object of the elevations
+        output_path (str): File path of the filled raster
+        epsilon (float): Elevation increment added to each filled cell
+
+    Returns:
+        arcpy.sa.Raster object of the filled raster
+    """
+    input_nodata = input_obj.noDataValue
+    input_array = arcpy.RasterToNumPyArray(input_obj).astype(np.float64)
+    if input_nodata is not None:
+        input_array[input_array == input_nodata] = np.nan
+    output_array = flow.priority_flood_fill(input_array, epsilon)
+    output_nodata = -9999
+    output_array[np.isnan(output_array)] = output_nodata
+    output_obj = arcpy.NumPyArrayToRaster(
+        output_array.astype(np.float32), input_obj.extent.lowerLeft,
+        input_obj.meanCellWidth, input_obj.meanCellHeight, output_nodata)
+    output_obj.save(output_path)
+    del output_obj
+    arcpy.DefineProjection_management(
+        output_path, input_obj.spatialReference)
+    return arcpy.sa.Raster(output_path)
+
+
 def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
     """"""
     output_array = np.copy(input_array)
@@ -1430,6 +2441,9 @@ def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
         output_nodata = 255
     elif output_array.dtype == np.uint8:
         output_nodata = 255
+    # Signed integer arrays (i.e. flow accumulation) use the float nodata
+    elif output_array.dtype.kind == 'i':
+        output_nodata = -9999
 
     # If a mask array is give, assume all 0 values are nodata
     if np.any(mask_array):
@@ -1442,113 +2456,3 @@ def array_to_raster(input_array, output_path, pnt, cs, mask_array=None):
     arcpy.DefineProjection_management(
         output_path, env.outputCoordinateSystem)
     arcpy.CalculateStatistics_management(output_path)
-
-
-# def flood_fill(test_array, four_way_flag=True, edge_flt=None):
-#     """Flood fill algorithm"""
-#     input_array = np.copy(test_array)
-#     input_rows, input_cols = input_array.shape
-#     h_max = np.nanmax(input_array) + 10.0
-#     logging.debug("  Hmax: %s" % (h_max / 2.0))
-#
-#     # Since ArcGIS doesn't ship with SciPy (only numpy), don't use ndimage module
-#     if four_way_flag:
-#         el = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]]).astype(np.bool)
-#     else:
-#         el = np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]).astype(np.bool)
-#     # if four_way_flag:
-#     #    el = ndimage.generate_binary_structure(2,1).astype(np.int)
-#     # else:
-#     #    el = ndimage.generate_binary_structure(2,2).astype(np.int)
-#
-#     # Build data/inside/edge masks
-#     data_mask = ~np.isnan(input_array)
-#
-#     # Since ArcGIS doesn't ship with SciPy (only numpy), don't use ndimage module
-#     inside_mask = np_binary_erosion(data_mask, structure=el)
-#     # inside_mask = ndimage.binary_erosion(data_mask, structure=el)
-#
-#     edge_mask = (data_mask & ~inside_mask)
-#     # Initialize output array as max value test_array except edges
-#     output_array = np.copy(input_array)
-#     output_array[inside_mask] = h_max
-#     # Set edge pixels less than edge_flt to edge_flt
-#     if edge_flt:
-#         output_array[edge_mask & (output_array <= edge_flt)] = edge_flt
-#
-#     # Build priority queue and place edge pixels into queue
-#     put = heapq.heappush
-#     get = heapq.heappop
-#     fill_heap = [
-#         (output_array[t_row, t_col], int(t_row), int(t_col), 1)
-#         for t_row, t_col in np.transpose(np.where(edge_mask))]
-#     heapq.heapify(fill_heap)
-#     # logging.info("    Queue Size: %s" % len(fill_heap))
-#
-#     # Cleanup
-#     del data_mask, edge_mask, el
-#     # logging.info("    Prep Time: %s" % (clock()-start_total))
-#
-#     while True:
-#         try:
-#             h_crt, t_row, t_col, edge_flag = get(fill_heap)
-#         except IndexError:
-#             break
-#         for n_row, n_col in [
-#             ((t_row-1), t_col), ((t_row+1), t_col),
-#             (t_row, (t_col-1)), (t_row, (t_col+1))]:
-#             # Skip cell if outside array edges
-#             if edge_flag:
-#                 try:
-#                     if not inside_mask[n_row, n_col]:
-#                         continue
-#                 except IndexError:
-#                     continue
-#             if output_array[n_row, n_col] == h_max:
-#                 output_array[n_row, n_col] = max(
-#                     h_crt, input_array[n_row, n_col])
-#                 put(fill_heap,
-#                     (output_array[n_row, n_col], n_row, n_col, 0))
-#     return output_array
-#
-#
-# def np_binary_erosion(input_array,
-#                       structure=np.ones((3, 3)).astype(np.bool)):
-#     """NumPy binary erosion function
-#
-#     No error checking on input array (type)
-#     No error checking on structure element (# of dimensions, shape, type, etc.)
-#
-#     Args:
-#         input_array: Binary NumPy array to be eroded. Non-zero (True) elements
-#             form the subset to be eroded
-#         structure: Structuring element used for the erosion. Non-zero elements
-#             are considered True. If no structuring element is provided, an
-#             element is generated with a square connectivity equal to one.
-#
-#     Returns:
-#         binary_erosion: Erosion of the input by the stucturing element
-#     """
-#     rows, cols = input_array.shape
-#
-#     # Pad output array (binary_erosion) with extra cells around the edge
-#     # so that structuring element will fit without wrapping.
-#     # A 3x3 structure, will need 1 additional cell around the edge
-#     # A 5x5 structure, will need 2 additional cells around the edge
-#     output_shape = tuple(
-#         ss + dd - 1 for ss, dd in zip(input_array.shape, structure.shape))
-#     input_pad_array = np.zeros(output_shape).astype(np.bool)
-#     input_pad_array[1: rows+1, 1: cols+1] = input_array
-#     binary_erosion = np.zeros(output_shape).astype(np.bool)
-#
-#     # Cast structure element to boolean
-#     struc_mask = structure.astype(np.bool)
-#
-#     # Iterate over each cell
-#     for row in range(rows):
-#         for col in range(cols):
-#             # The value of the output pixel is the minimum value of all the
-#             #   pixels in the input pixel's neighborhood.
-#             binary_erosion[row+1, col+1] = np.min(
-#                 input_pad_array[row: row+3, col: col+3][struc_mask])
-#     return binary_erosion[1: rows+1, 1: cols+1]
@@ -6,7 +6,6 @@
 #--------------------------------
 
 import argparse
-from collections import defaultdict
 import ConfigParser
 import datetime as dt
 import logging
@@ -16,6 +15,7 @@ import sys
 
 import arcpy
 from arcpy import env
+import numpy as np
 
 import support_functions as support
 
@@ -414,70 +414,59 @@ def temp_adjust_parameters(config_path):
             hru.polygon_path, hru.temp_zone_id_field, 1, 'PYTHON')
 
     # Calculate adjustments
+    # Temperature arrays are (HRUs or zones) x 12 months x 2 (tmax, tmin)
     logging.info('\nCalculating mean monthly temperature adjustments')
+    hru_table = support.HRUTable(
+        hru, [hru.temp_zone_id_field] + tmax_field_list + tmin_field_list +
+        tmax_adj_field_list + tmin_adj_field_list)
+    temp_array = np.dstack([
+        np.column_stack([hru_table[f].astype(np.float64) for f in field_list])
+        for field_list in [tmax_field_list, tmin_field_list]])
+
     if temp_calc_method == 'ZONES':
         # Read mean monthly values for each zone
-        tmax_obs_dict = dict()
-        tmin_obs_dict = dict()
         tmax_obs_field_list = [tmax_obs_field_fmt.format(m) for m in month_list]
         tmin_obs_field_list = [tmin_obs_field_fmt.format(m) for m in month_list]
-        tmax_fields = [temp_zone_id_field] + tmax_obs_field_list
-        tmin_fields = [temp_zone_id_field] + tmin_obs_field_list
-        logging.debug('  Tmax Obs. Fields: {}'.format(', '.join(tmax_fields)))
-        logging.debug('  Tmin Obs. Fields: {}'.format(', '.join(tmax_fields)))
-
-        with arcpy.da.SearchCursor(temp_zone_path, tmax_fields) as s_cursor:
-            for row in s_cursor:
-                tmax_obs_dict[int(row[0])] = map(float, row[1:13])
-        with arcpy.da.SearchCursor(temp_zone_path, tmin_fields) as s_cursor:
+        fields = (
+            [temp_zone_id_field] + tmax_obs_field_list + tmin_obs_field_list)
+        logging.debug('  Tmax Obs. Fields: {}'.format(
+            ', '.join(tmax_obs_field_list)))
+        logging.debug('  Tmin Obs. Fields: {}'.format(
+            ', '.join(tmin_obs_field_list)))
+        temp_obs_dict = dict()
+        with arcpy.da.SearchCursor(temp_zone_path, fields) as s_cursor:
             for row in s_cursor:
-                tmin_obs_dict[int(row[0])] = map(float, row[1:13])
+                temp_obs_dict[int(row[0])] = map(float, row[1:25])
+        temp_zone_list = sorted(temp_obs_dict.keys())
+        logging.debug('  Temperature Zones: {}'.format(temp_zone_list))
 
         # Convert values to Celsius if necessary to match PRISM
-        if temp_obs_units == 'F':
-            tmax_obs_dict = {
-                z: [(t - 32) * (5.0 / 9) for t in t_list]
-                for z, t_list in tmax_obs_dict.items()}
-            tmin_obs_dict = {
-                z: [(t - 32) * (5.0 / 9) for t in t_list]
-                for z, t_list in tmin_obs_dict.items()}
-        elif temp_obs_units == 'K':
-            tmax_obs_dict = {
-                z: [(t - 273.15) for t in t_list]
-                for z, t_list in tmax_obs_dict.items()}
-            tmin_obs_dict = {
-                z: [(t - 273.15) for t in t_list]
-                for z, t_list in tmin_obs_dict.items()}
-
-        tmax_zone_list = sorted(tmax_obs_dict.keys())
-        tmin_zone_list = sorted(tmin_obs_dict.keys())
-        logging.debug('  Tmax Zones: {}'.format(tmax_zone_list))
-        logging.debug('  Tmin Zones: {}'.format(tmin_zone_list))
+        # Zone arrays are in temp_zone_list order
+        temp_obs_array = np.array(
+            [temp_obs_dict[z] for z in temp_zone_list], dtype=np.float64)
+        temp_obs_array = temp_units_func(
+            temp_obs_array.reshape(-1, 2, 12).transpose(0, 2, 1),
+            temp_obs_units)
+        del temp_obs_dict
 
         # Print the observed temperature values
-        logging.debug('  Observed Tmax')
-        for zone, tmax_obs in tmax_obs_dict.items():
-            logging.debug('    {}: {}'.format(
-                zone, ', '.join(['{:.2f}'.format(x) for x in tmax_obs])))
-        logging.debug('  Observed Tmin')
-        for zone, tmin_obs in tmin_obs_dict.items():
-            logging.debug('    {}: {}'.format(
-                zone, ', '.join(['{:.2f}'.format(x) for x in tmin_obs])))
+        for name, j in [('Tmax', 0), ('Tmin', 1)]:
+            logging.debug('  Observed {}'.format(name))
+            for zone, temp_obs in zip(temp_zone_list, temp_obs_array):
+                logging.debug('    {}: {}'.format(
+                    zone, ', '.join(['{:.2f}'.format(x)
+                                     for x in temp_obs[:, j]])))
 
-        # Default all zones to an adjustment of 0
-        tmax_adj_dict = {z: [0] * 12 for z in tmax_zone_list}
-        tmin_adj_dict = {z: [0] * 12 for z in tmin_zone_list}
+        # Index of each HRU's zone in the zone arrays (-1 if not a zone)
+        hru_zone_array = hru_table[hru.temp_zone_id_field].astype(np.int64)
+        zone_index = support.sorted_index(temp_zone_list, hru_zone_array)
 
-        # Get list of HRU_IDs for each zone
-        fields = [hru.temp_zone_id_field, hru.id_field]
-        zone_hru_id_dict = defaultdict(list)
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as s_cursor:
-            for row in s_cursor:
-                zone_hru_id_dict[int(row[0])].append(int(row[1]))
+        # Default all zones to an adjustment of 0
+        temp_offset_array = np.zeros(temp_obs_array.shape, dtype=np.float64)
 
         # Check that TEMP_HRU_IDs are in the correct zone
-        # Default all temperature zone HRU IDs to 0
-        temp_hru_id_dict = {z: 0 for z in tmax_zone_list}
+        # Difference of the observed and gridded temperature at the
+        #   TEMP_HRU_ID
         if temp_hru_id_field is not None:
             fields = [temp_zone_id_field, temp_hru_id_field]
             logging.debug('  Temp Zone ID field: {}'.format(temp_zone_id_field))
@@ -486,159 +475,130 @@ def temp_adjust_parameters(config_path):
                 for row in s_cursor:
                     temp_zone = int(row[0])
                     hru_id = int(row[1])
-                    if hru_id == 0 or hru_id in zone_hru_id_dict[temp_zone]:
-                        temp_hru_id_dict[temp_zone] = hru_id
-                        logging.debug('    {}: {}'.format(temp_zone, hru_id))
-                    else:
+                    if hru_id == 0:
+                        continue
+                    hru_i = support.sorted_index(hru_table.id_array, hru_id)
+                    if hru_i < 0 or hru_zone_array[hru_i] != temp_zone:
                         logging.error(
                             '\nERROR: HRU_ID {} is not in temperature ZONE {}'.format(
-                                hru_id, temp_hru_id_dict[temp_zone]))
+                                hru_id, temp_zone))
                         sys.exit()
-
-        # Get gridded tmax values for each TEMP_HRU_ID
-        fields = [hru.temp_zone_id_field, hru.id_field] + tmax_field_list
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as s_cursor:
-            for row in s_cursor:
-                temp_zone = int(row[0])
-                hru_id = int(row[1])
-                if hru_id == 0:
-                    pass
-                elif hru_id in temp_hru_id_dict.values():
-                    tmax_gridded_list = map(float, row[2:14])
-                    tmax_obs_list = tmax_obs_dict[temp_zone]
-                    tmax_adj_list = [
-                        float(o) - t
-                        for o, t in zip(tmax_obs_list, tmax_gridded_list)]
-                    tmax_adj_dict[temp_zone] = tmax_adj_list
-
-        # Get gridded tmin values for each TEMP_HRU_ID
-        fields = [hru.temp_zone_id_field, hru.id_field] + tmin_field_list
-        with arcpy.da.SearchCursor(hru.polygon_path, fields) as s_cursor:
-            for row in s_cursor:
-                temp_zone = int(row[0])
-                hru_id = int(row[1])
-                if hru_id == 0:
-                    pass
-                elif hru_id in temp_hru_id_dict.values():
-                    tmin_gridded_list = map(float, row[2:14])
-                    tmin_obs_list = tmin_obs_dict[temp_zone]
-                    tmin_adj_list = [
-                        float(o) - t
-                        for o, t in zip(tmin_obs_list, tmin_gridded_list)]
-                    tmin_adj_dict[temp_zone] = tmin_adj_list
-        del temp_hru_id_dict, zone_hru_id_dict, fields
-
-        logging.debug('  Tmax Adjustment Factors:')
-        for k, v in tmax_adj_dict.items():
-            logging.debug('    {}: {}'.format(
-                k, ', '.join(['{:.3f}'.format(x) for x in v])))
-
-        logging.debug('  Tmin Adjustment Factors:')
-        for k, v in tmin_adj_dict.items():
-            logging.debug('    {}: {}'.format(
-                k, ', '.join(['{:.3f}'.format(x) for x in v])))
-
-        logging.debug('\nWriting adjustment values to hru_params')
-        fields = [hru.temp_zone_id_field]
-        fields.extend(tmax_field_list + tmax_adj_field_list)
-        fields.extend(tmin_field_list + tmin_adj_field_list)
-        with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-            for row in u_cursor:
-                zone = int(row[0])
-                for i, month in enumerate(month_list):
-                    tmax_i = fields.index(tmax_field_fmt.format(month))
-                    tmax_adj_i = fields.index(tmax_adj_field_fmt.format(month))
-                    row[tmax_adj_i] = (
-                        row[tmax_i] - tmax_obs_dict[zone][i] +
-                        tmax_adj_dict[zone][i])
-
-                    tmin_i = fields.index(tmin_field_fmt.format(month))
-                    tmin_adj_i = fields.index(tmin_adj_field_fmt.format(month))
-                    row[tmin_adj_i] = (
-                        row[tmin_i] - tmin_obs_dict[zone][i] +
-                        tmin_adj_dict[zone][i])
-                u_cursor.updateRow(row)
-            del row
+                    logging.debug('    {}: {}'.format(temp_zone, hru_id))
+                    zone_i = temp_zone_list.index(temp_zone)
+                    temp_offset_array[zone_i] = (
+                        temp_obs_array[zone_i] - temp_array[hru_i])
+
+        for name, j in [('Tmax', 0), ('Tmin', 1)]:
+            logging.debug('  {} Adjustment Factors:'.format(name))
+            for zone, temp_offset in zip(temp_zone_list, temp_offset_array):
+                logging.debug('    {}: {}'.format(
+                    zone, ', '.join(['{:.3f}'.format(x)
+                                     for x in temp_offset[:, j]])))
 
     elif temp_calc_method == '1STA':
-        # Get gridded temperature at temp_HRU_ID
-        tmax_fields = [hru.id_field] + tmax_field_list
-        tmin_fields = [hru.id_field] + tmin_field_list
-        logging.debug('  Tmax Fields: {}'.format(', '.join(tmax_field_list)))
-        logging.debug('  Tmin Fields: {}'.format(', '.join(tmin_field_list)))
-
         # Convert values to Celsius if necessary to match PRISM
-        if temp_obs_units == 'F':
-            tmax_obs_list = [(t - 32) * (5.0 / 9) for t in tmax_obs_list]
-            tmin_obs_list = [(t - 32) * (5.0 / 9) for t in tmin_obs_list]
-        elif temp_obs_units == 'K':
-            tmax_obs_list = [t - 273.15 for t in tmax_obs_list]
-            tmin_obs_list = [t - 273.15 for t in tmin_obs_list]
+        temp_obs_array = temp_units_func(
+            np.array([zip(tmax_obs_list, tmin_obs_list)], dtype=np.float64),
+            temp_obs_units)
         if temp_obs_units != 'C':
-            logging.info(
-                '\nConverted Mean Monthly Tmax ({}):\n  {}'.format(
-                    temp_obs_units, ', '.join(map(str, tmax_obs_list))))
-            logging.info(
-                'Converted Mean Monthly Tmin ({}):\n  {}'.format(
-                    temp_obs_units, ', '.join(map(str, tmin_obs_list))))
+            for name, j in [('Tmax', 0), ('Tmin', 1)]:
+                logging.info('\nConverted Mean Monthly {} ({}):\n  {}'.format(
+                    name, temp_obs_units,
+                    ', '.join(map(str, temp_obs_array[0, :, j]))))
 
         # Scale all adjustments so gridded temperature will match observed
         # temperature at target cell
         if temp_hru_id != 0:
-            tmax_gridded_list = map(float, arcpy.da.SearchCursor(
-                hru.polygon_path, tmax_fields,
-                '"{}" = {}'.format(hru.id_field, temp_hru_id)).next()[1:])
-            logging.debug('  Gridded Tmax: {}'.format(
-                ', '.join(['{:.2f}'.format(p) for p in tmax_gridded_list])))
-
-            tmin_gridded_list = map(float, arcpy.da.SearchCursor(
-                hru.polygon_path, tmin_fields,
-                '"{}" = {}'.format(hru.id_field, temp_hru_id)).next()[1:])
-            logging.debug('  Gridded Tmin: {}'.format(
-                ', '.join(['{:.2f}'.format(p) for p in tmin_gridded_list])))
+            hru_i = support.sorted_index(hru_table.id_array, temp_hru_id)
+            if hru_i < 0:
+                logging.error(
+                    '\nERROR: TEMP_HRU_ID {} is not in the fishnet'.format(
+                        temp_hru_id))
+                sys.exit()
+            temp_gridded_array = temp_array[hru_i]
+            for name, j in [('Tmax', 0), ('Tmin', 1)]:
+                logging.debug('  Gridded {}: {}'.format(name, ', '.join(
+                    ['{:.2f}'.format(p) for p in temp_gridded_array[:, j]])))
 
             # Difference of MEASURED or OBSERVED TEMP to GRIDDED TEMP
-            tmax_adj_list = [
-                float(o) - t
-                for o, t in zip(tmax_obs_list, tmax_gridded_list)]
-            logging.info('  Obs./Gridded: {}'.format(
-                ', '.join(['{:.3f}'.format(p) for p in tmax_adj_list])))
-
-            tmin_adj_list = [
-                float(o) - t
-                for o, t in zip(tmin_obs_list, tmin_gridded_list)]
-            logging.info('  Obs./Gridded: {}'.format(
-                ', '.join(['{:.3f}'.format(p) for p in tmin_adj_list])))
+            temp_offset_array = temp_obs_array - temp_gridded_array
+            for j in [0, 1]:
+                logging.info('  Obs./Gridded: {}'.format(', '.join(
+                    ['{:.3f}'.format(p) for p in temp_offset_array[0, :, j]])))
         else:
-            tmax_adj_list = [0 for p in tmax_obs_list]
-            tmin_adj_list = [0 for p in tmin_obs_list]
-
-        # Use single mean monthly tmax for all cells
-        # Assume tmax_obs_list is in month order
-        fields = tmax_field_list + tmax_adj_field_list
-        with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-            for row in u_cursor:
-                for i, month in enumerate(month_list):
-                    tmax_i = fields.index(tmax_field_fmt.format(month))
-                    tmax_adj_i = fields.index(tmax_adj_field_fmt.format(month))
-                    row[tmax_adj_i] = (
-                            row[tmax_i] - tmax_obs_list[i] + tmax_adj_list[i])
-                u_cursor.updateRow(row)
-            del row
-
-        # Use single mean monthly tmax for all cells
-        # Assume tmax_obs_list is in month order
-        fields = tmin_field_list + tmin_adj_field_list
-        with arcpy.da.UpdateCursor(hru.polygon_path, fields) as u_cursor:
-            for row in u_cursor:
-                for i, month in enumerate(month_list):
-                    tmin_i = fields.index(tmin_field_fmt.format(month))
-                    tmin_adj_i = fields.index(
-                        tmin_adj_field_fmt.format(month))
-                    row[tmin_adj_i] = (
-                            row[tmin_i] - tmin_obs_list[i] + tmin_adj_list[i])
-                u_cursor.updateRow(row)
-            del row
+            temp_offset_array = np.zeros(
+                temp_obs_array.shape, dtype=np.float64)
+
+        # Use single mean monthly tmax/tmin for all cells
+        # Assume tmax_obs_list and tmin_obs_list are in month order
+        zone_index = np.zeros(hru_table.count, dtype=np.int64)
+
+    # Compute all of the adjustments at once and write them in a single pass
+    logging.debug('\nWriting adjustment values to hru_params')
+    temp_adj_array = temp_adjust_func(
+        temp_array, temp_obs_array, temp_offset_array, zone_index)
+    for i in range(12):
+        hru_table[tmax_adj_field_list[i]] = temp_adj_array[:, i, 0]
+        hru_table[tmin_adj_field_list[i]] = temp_adj_array[:, i, 1]
+    hru_table.flush()
+    del hru_table, temp_array, temp_adj_array
+
+
+def temp_units_func(temp_array, temp_units):
+    """Convert observed temperatures to Celsius
+
+    Parameters
+    ----------
+    temp_array : np.array
+        Temperatures.
+    temp_units : str
+        Temperature units (C, F or K).
+
+    Returns
+    -------
+    np.array
+
+    """
+    if temp_units == 'F':
+        return (temp_array - 32) * (5.0 / 9)
+    elif temp_units == 'K':
+        return temp_array - 273.15
+    else:
+        return temp_array
+
+
+def temp_adjust_func(temp_array, temp_obs_array, temp_offset_array,
+                     zone_index):
+    """Mean monthly temperature adjustments of every HRU
+
+    Adjustments are the gridded temperature minus the observed temperature
+    of the HRU's zone plus the zone offset (observed - gridded temperature
+    at the zone station HRU).  HRUs that are not in a zone are not
+    adjusted (0).
+
+    Parameters
+    ----------
+    temp_array : np.array
+        Gridded mean monthly tmax and tmin (HRUs x 12 x 2).
+    temp_obs_array : np.array
+        Observed mean monthly tmax and tmin (zones x 12 x 2).
+    temp_offset_array : np.array
+        Zone offsets (zones x 12 x 2).
+    zone_index : np.array
+        Zone array row of each HRU (-1 if the HRU is not in a zone).
+
+    Returns
+    -------
+    np.array: Tmax and tmin adjustments (HRUs x 12 x 2)
+
+    """
+    # Zone values are broadcast to the HRUs through the zone index
+    zone_mask = zone_index >= 0
+    temp_adj_array = np.zeros(temp_array.shape, dtype=np.float64)
+    temp_adj_array[zone_mask] = (
+        temp_array[zone_mask] - temp_obs_array[zone_index[zone_mask]] +
+        temp_offset_array[zone_index[zone_mask]])
+    return temp_adj_array
 
 
 def arg_parse():
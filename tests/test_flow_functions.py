@@ -0,0 +1,305 @@
+#--------------------------------
+# Name:         test_flow_functions.py
+# Purpose:      Tests for the NumPy DEM fill and flow functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import flow_functions as flow
+
+
+def reference_fill(input_array, four_way_flag=False):
+    """Fill depressions by iterating the water level to a fixed point
+
+    Cells next to nodata cells (or the array edge) are the outlets and
+    every other cell is lowered to the minimum of its neighbors'
+    levels (but not below its elevation) until nothing changes.
+    """
+    z_array = flow.pad_array(input_array)
+    data_mask = np.isfinite(z_array)
+    rows, cols = z_array.shape
+    shifts = [(i, j) for i in [-1, 0, 1] for j in [-1, 0, 1]
+              if (i, j) != (0, 0) and not (four_way_flag and i and j)]
+    edge_mask = np.zeros(z_array.shape, dtype=np.bool)
+    for i, j in shifts:
+        edge_mask[1:-1, 1:-1] |= ~data_mask[1 + i:rows - 1 + i,
+                                            1 + j:cols - 1 + j]
+    w_array = np.where(data_mask & ~edge_mask, np.inf, z_array)
+    while True:
+        nbr_min = np.full((rows - 2, cols - 2), np.inf)
+        for i, j in shifts:
+            nbr_w = w_array[1 + i:rows - 1 + i, 1 + j:cols - 1 + j]
+            nbr_min = np.fmin(nbr_min, nbr_w)
+        w_center = w_array[1:-1, 1:-1]
+        new_w = np.where(
+            data_mask[1:-1, 1:-1],
+            np.maximum(z_array[1:-1, 1:-1], np.minimum(w_center, nbr_min)),
+            np.nan)
+        if np.allclose(new_w, w_center, rtol=0, atol=0, equal_nan=True):
+            return new_w
+        w_array[1:-1, 1:-1] = new_w
+
+
+def random_dem(seed, rows=20, cols=25, nodata_count=20):
+    """Rough random surface with a few nodata cells"""
+    random_state = np.random.RandomState(seed)
+    dem_array = (
+        random_state.uniform(0, 10, (rows, cols)) +
+        np.add.outer(np.arange(rows), np.arange(cols)) * 0.5)
+    dem_array.ravel()[random_state.choice(
+        rows * cols, nodata_count, replace=False)] = np.nan
+    return dem_array
+
+
+# Priority-Flood fill
+def test_fill_pit():
+    dem_array = np.array([
+        [5, 5, 5, 5, 5],
+        [5, 4, 4, 4, 5],
+        [5, 4, 1, 4, 5],
+        [5, 4, 4, 4, 3],
+        [5, 5, 5, 5, 5]], dtype=np.float64)
+    fill_array = flow.priority_flood_fill(dem_array)
+    expected = dem_array.copy()
+    expected[2, 2] = 4
+    np.testing.assert_array_equal(fill_array, expected)
+
+
+def test_fill_flat_epsilon():
+    dem_array = np.array([
+        [5, 5, 5, 5, 5],
+        [5, 2, 2, 2, 5],
+        [5, 2, 2, 2, 3],
+        [5, 5, 5, 5, 5]], dtype=np.float64)
+    # Without epsilon the depression is filled flat to the spill elevation
+    fill_array = flow.priority_flood_fill(dem_array)
+    np.testing.assert_array_equal(fill_array[1:3, 1:4], 3)
+
+    # With epsilon the filled cells increase away from the outlet
+    fill_array = flow.priority_flood_fill(dem_array, epsilon=0.1)
+    np.testing.assert_allclose(
+        fill_array[1:3, 1:4], [[3.3, 3.2, 3.1], [3.3, 3.2, 3.1]])
+    np.testing.assert_array_equal(fill_array[0], dem_array[0])
+
+
+def test_fill_four_way():
+    # The pit only drains through its diagonal neighbor
+    dem_array = np.array([
+        [1, 9, 9, 9],
+        [9, 2, 9, 9],
+        [9, 9, 9, 9],
+        [9, 9, 9, 9]], dtype=np.float64)
+    fill_array = flow.priority_flood_fill(dem_array)
+    np.testing.assert_array_equal(fill_array, dem_array)
+    fill_array = flow.priority_flood_fill(dem_array, four_way_flag=True)
+    assert fill_array[1, 1] == 9
+
+
+def test_fill_nodata_sink():
+    # Nodata cells are outlets, so the pit next to the nodata cell drains
+    dem_array = np.array([
+        [5, 5, 5, 5, 5],
+        [5, 1, 5, 2, 5],
+        [5, 5, 5, np.nan, 5],
+        [5, 5, 5, 5, 5]], dtype=np.float64)
+    fill_array = flow.priority_flood_fill(dem_array)
+    assert fill_array[1, 1] == 5
+    assert fill_array[1, 3] == 2
+    assert np.isnan(fill_array[2, 3])
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('four_way_flag', [False, True])
+def test_fill_reference(seed, four_way_flag):
+    dem_array = random_dem(seed)
+    np.testing.assert_array_equal(
+        flow.priority_flood_fill(dem_array, four_way_flag=four_way_flag),
+        reference_fill(dem_array, four_way_flag))
+
+
+
+def test_fill_outlet_mask():
+    dem_array = np.array([
+        [5, 5, 5, np.nan, 5, 5, 5],
+        [5, 2, 5, np.nan, 5, 1, 4],
+        [5, 5, 5, np.nan, 5, 5, 5]], dtype=np.float64)
+    fill_array = flow.priority_flood_fill(dem_array)
+    assert fill_array[1, 1] == 5
+    assert fill_array[1, 5] == 4
+
+    # Only the outlet cell drains, cells that can't reach it aren't filled
+    outlet_mask = np.zeros(dem_array.shape, dtype=np.bool)
+    outlet_mask[1, 6] = True
+    fill_array = flow.priority_flood_fill(dem_array, outlet_mask=outlet_mask)
+    np.testing.assert_array_equal(fill_array[:, :3], dem_array[:, :3])
+    assert fill_array[1, 5] == 4
+    np.testing.assert_array_equal(fill_array[0, 4:], dem_array[0, 4:])
+
+
+# D8 flow direction and accumulation
+def test_d8_flow_direction_slope():
+    dem_array = np.array([
+        [3, 2, 1],
+        [4, 3, 2],
+        [5, 4, 3]], dtype=np.float64)
+    # The diagonal drop is divided by the square root of 2 and the
+    #   edge cell without a downslope neighbor flows out of the grid
+    np.testing.assert_array_equal(
+        flow.d8_flow_direction(dem_array),
+        [[1, 1, 1], [128, 128, 64], [128, 128, 64]])
+
+
+def test_d8_flow_direction_force():
+    dem_array = np.array([
+        [3, 2, 1],
+        [4, 3, 2],
+        [5, 4, 3]], dtype=np.float64)
+    flow_dir_array = flow.d8_flow_direction(dem_array, force_flag=True)
+    # All edge cells flow out of the grid, the center cell is unchanged
+    down_array = flow.downstream_index(flow_dir_array).reshape(3, 3)
+    assert flow_dir_array[1, 1] == 128
+    assert np.all(down_array[[0, 0, 0, 1, 1, 2, 2, 2],
+                             [0, 1, 2, 0, 2, 0, 1, 2]] == -1)
+
+
+def test_d8_flow_direction_flat():
+    fill_array = np.array([
+        [5, 5, 5, 5, 5],
+        [5, 3, 3, 3, 5],
+        [5, 3, 3, 3, 3],
+        [5, 5, 5, 5, 5]], dtype=np.float64)
+    flow_dir_array = flow.d8_flow_direction(fill_array)
+    # The flat cells drain toward the outlet cell, which flows east
+    #   out of the grid (the edge cell above it flows south into it)
+    np.testing.assert_array_equal(
+        flow_dir_array[1:3, 1:], [[2, 2, 2, 4], [1, 1, 1, 1]])
+
+
+def test_d8_flow_direction_nodata():
+    dem_array = np.array([
+        [3, 2, 1],
+        [4, np.nan, 2],
+        [5, 4, 3]], dtype=np.float64)
+    flow_dir_array = flow.d8_flow_direction(dem_array)
+    assert flow_dir_array[1, 1] == 0
+    # Flow doesn't go into the nodata cell
+    assert flow_dir_array[2, 0] == 1
+    assert flow_dir_array.dtype == np.uint8
+
+
+def test_flow_accumulation():
+    flow_dir_array = np.array([
+        [1, 1, 4],
+        [1, 1, 4],
+        [1, 1, 1]], dtype=np.uint8)
+    np.testing.assert_array_equal(
+        flow.flow_accumulation(flow_dir_array),
+        [[0, 1, 2], [0, 1, 5], [0, 1, 8]])
+
+    # Nodata cells are NaN and aren't accumulated
+    flow_dir_array[2, 0] = 0
+    np.testing.assert_array_equal(
+        flow.flow_accumulation(flow_dir_array),
+        [[0, 1, 2], [0, 1, 5], [np.nan, 0, 7]])
+
+
+def test_flow_accumulation_weight():
+    flow_dir_array = np.array([
+        [1, 1, 4],
+        [1, 1, 4],
+        [1, 1, 1]], dtype=np.uint8)
+    weight_array = np.arange(9, dtype=np.float64).reshape(3, 3)
+    weight_array[0, 0] = np.nan
+    np.testing.assert_array_equal(
+        flow.flow_accumulation(flow_dir_array, weight_array),
+        [[0, 0, 1], [0, 3, 10], [0, 6, 28]])
+
+
+# Stream links and order
+def test_stream_links():
+    flow_dir_array = np.array([
+        [1, 1, 4],
+        [1, 1, 4],
+        [1, 1, 1]], dtype=np.uint8)
+    link_array, link_down = flow.stream_links(
+        np.ones((3, 3), dtype=np.bool), flow_dir_array)
+    # Links are numbered in raster order of their first cell and a new
+    #   link starts below each junction
+    np.testing.assert_array_equal(
+        link_array, [[1, 1, 1], [2, 2, 3], [4, 4, 5]])
+    np.testing.assert_array_equal(link_down, [0, 3, 3, 5, 5, 0])
+    np.testing.assert_array_equal(
+        flow.shreve_order(link_down), [0, 1, 1, 2, 1, 3])
+
+
+def test_stream_links_mask():
+    flow_dir_array = np.array([
+        [1, 1, 4],
+        [1, 1, 4],
+        [1, 1, 1]], dtype=np.uint8)
+    # Without the middle row tributary the first link continues to the
+    #   outlet, and non-stream cells are 0
+    stream_mask = np.array([
+        [1, 1, 1],
+        [0, 0, 1],
+        [0, 1, 1]], dtype=np.bool)
+    link_array, link_down = flow.stream_links(stream_mask, flow_dir_array)
+    np.testing.assert_array_equal(
+        link_array, [[1, 1, 1], [0, 0, 1], [0, 2, 3]])
+    np.testing.assert_array_equal(link_down, [0, 3, 3, 0])
+    np.testing.assert_array_equal(
+        flow.shreve_order(link_down), [0, 1, 1, 2])
+
+
+# Incremental D8 update
+def test_d8_flow_direction_update_unchanged():
+    fill_array = flow.priority_flood_fill(random_dem(0), epsilon=0.001)
+    flow_dir_array = flow.d8_flow_direction(fill_array)
+    update_array, update_count = flow.d8_flow_direction_update(
+        fill_array, fill_array.copy(), flow_dir_array)
+    np.testing.assert_array_equal(update_array, flow_dir_array)
+    assert update_count == 0
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('epsilon', [0, 0.001])
+def test_d8_flow_direction_update(seed, epsilon):
+    dem_array = random_dem(seed, rows=30, cols=30)
+    old_array = flow.priority_flood_fill(dem_array, epsilon=epsilon)
+    flow_dir_array = flow.d8_flow_direction(old_array)
+
+    # Raise a few cells (like the CRT fill) and refill
+    random_state = np.random.RandomState(seed)
+    r, c = random_state.randint(5, 25, 2)
+    dem_array[r:r + 2, c:c + 2] += random_state.uniform(0.1, 2, (2, 2))
+    new_array = flow.priority_flood_fill(dem_array, epsilon=epsilon)
+
+    update_array, update_count = flow.d8_flow_direction_update(
+        old_array, new_array, flow_dir_array)
+    np.testing.assert_array_equal(
+        update_array, flow.d8_flow_direction(new_array))
+
+
+def test_d8_flow_direction_update_window():
+    random_state = np.random.RandomState(0)
+    old_array = (
+        np.add.outer(np.arange(20), np.arange(20)) +
+        random_state.uniform(0, 0.5, (20, 20)))
+    flow_dir_array = flow.d8_flow_direction(old_array)
+    new_array = old_array.copy()
+    new_array[8:10, 8:10] += 3
+
+    # Without flats only the changed cells and their neighbors are updated
+    update_array, update_count = flow.d8_flow_direction_update(
+        old_array, new_array, flow_dir_array)
+    np.testing.assert_array_equal(
+        update_array, flow.d8_flow_direction(new_array))
+    assert update_count == 16
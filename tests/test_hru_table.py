@@ -0,0 +1,103 @@
+#--------------------------------
+# Name:         test_hru_table.py
+# Purpose:      Tests for the in-memory HRU fishnet table
+# Notes:        ArcPy is replaced by a stub module if it isn't installed
+# Python:       2.7
+#--------------------------------
+
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+try:
+    import arcpy
+except ImportError:
+    # The fishnet cursors are replaced below, so an empty arcpy is enough
+    arcpy = types.ModuleType('arcpy')
+    arcpy.da = types.ModuleType('arcpy.da')
+    arcpy.env = types.ModuleType('arcpy.env')
+    sys.modules['arcpy'] = arcpy
+    sys.modules['arcpy.da'] = arcpy.da
+    sys.modules['arcpy.env'] = arcpy.env
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import support_functions as support
+
+
+class FishnetParam(object):
+    polygon_path = 'fishnet'
+    id_field = 'HRU_ID'
+
+
+class Fishnet(object):
+    """In-memory fishnet table that counts the updated rows"""
+    def __init__(self, fishnet_array):
+        self.array = fishnet_array
+        self.updated = 0
+
+    def read(self, path, fields):
+        return self.array[fields].copy()
+
+    def update_cursor(self, path, fields):
+        return FishnetCursor(self, fields)
+
+
+class FishnetCursor(object):
+    def __init__(self, fishnet, fields):
+        self.fishnet = fishnet
+        self.fields = fields
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __iter__(self):
+        for i in range(self.fishnet.array.size):
+            self.i = i
+            yield [self.fishnet.array[f][i].item() for f in self.fields]
+
+    def updateRow(self, row):
+        for field, value in zip(self.fields, row):
+            self.fishnet.array[field][self.i] = value
+        self.fishnet.updated += 1
+
+
+@pytest.fixture
+def fishnet(monkeypatch):
+    fishnet = Fishnet(np.array(
+        [(0, 3, 1.0), (1, 1, np.nan), (2, 2, 2.0)],
+        dtype=[('OID@', np.int32), ('HRU_ID', np.int32),
+               ('VALUE', np.float64)]))
+    monkeypatch.setattr(
+        support.arcpy.da, 'FeatureClassToNumPyArray', fishnet.read,
+        raising=False)
+    monkeypatch.setattr(
+        support.arcpy.da, 'UpdateCursor', fishnet.update_cursor,
+        raising=False)
+    return fishnet
+
+
+def test_hru_table_sorted(fishnet):
+    hru_table = support.HRUTable(FishnetParam())
+    assert hru_table.id_array.tolist() == [1, 2, 3]
+    assert hru_table.index([3, 1]).tolist() == [2, 0]
+
+
+def test_hru_table_flush_nan(fishnet):
+    hru_table = support.HRUTable(FishnetParam(), ['VALUE'])
+    hru_table['VALUE'] = np.where(
+        hru_table.id_array == 3, 5.0, hru_table['VALUE'])
+    hru_table.flush()
+    assert fishnet.updated == 1
+    assert fishnet.array['VALUE'][0] == 5.0
+
+    # NaN values that didn't change are not written again
+    hru_table.flush()
+    assert fishnet.updated == 1
+    assert hru_table.rows_written == 1
@@ -0,0 +1,226 @@
+#--------------------------------
+# Name:         test_polygon_functions.py
+# Purpose:      Tests for the NumPy polygon/grid functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import polygon_functions as polygon
+
+
+def box(x0, y0, x1, y1):
+    """Counter-clockwise rectangle ring"""
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+# Rasterize
+def test_rasterize_polygons():
+    # Centers on the left/bottom edges are inside, right/top are not
+    value_array, value_mask = polygon.rasterize_polygons(
+        [[box(0.5, 0.5, 2.5, 2.5)]], [7], 0, 4, 1, 4, 4)
+    expected = np.zeros((4, 4), dtype=np.int64)
+    expected[2:4, 0:2] = 7
+    np.testing.assert_array_equal(value_array, expected)
+    np.testing.assert_array_equal(value_mask, expected > 0)
+
+
+def test_rasterize_polygons_overlap():
+    # The later polygon is used where polygons overlap, and polygons
+    #   outside the grid are skipped
+    value_array, value_mask = polygon.rasterize_polygons(
+        [[box(0, 0, 4, 4)], [box(2, 0, 6, 2)], [box(10, 10, 12, 12)]],
+        [1, 2, 3], 0, 4, 1, 4, 4, nodata_value=-1)
+    np.testing.assert_array_equal(value_array, [
+        [1, 1, 1, 1], [1, 1, 1, 1], [1, 1, 2, 2], [1, 1, 2, 2]])
+    assert np.all(value_mask)
+
+
+def test_rasterize_polygons_hole():
+    value_array, value_mask = polygon.rasterize_polygons(
+        [[box(0, 0, 4, 4), box(1, 1, 3, 3)[::-1]]], [1.5], 0, 4, 1, 4, 4)
+    expected = np.ones((4, 4), dtype=np.bool)
+    expected[1:3, 1:3] = False
+    np.testing.assert_array_equal(value_mask, expected)
+    np.testing.assert_array_equal(value_array, np.where(expected, 1.5, 0))
+
+
+def test_rasterize_polygon_diagonal():
+    # Triangle below the line x + y = 4, centers on the line are not in
+    value_mask = polygon.rasterize_polygon(
+        [[(0, 0), (4, 0), (0, 4)]], 0, 4, 1, 4, 4)
+    row_array, col_array = np.indices((4, 4))
+    np.testing.assert_array_equal(
+        value_mask, (col_array + 0.5) + (3.5 - row_array) < 4)
+
+
+# Coverage fractions
+def coverage_array(ring_list, xmin, ymax, cs, rows, cols):
+    """polygon_coverage() as a (rows, cols) array"""
+    cell_array, fraction_array = polygon.polygon_coverage(
+        ring_list, xmin, ymax, cs, rows, cols)
+    output_array = np.zeros(rows * cols, dtype=np.float64)
+    output_array[cell_array] = fraction_array
+    return output_array.reshape(rows, cols)
+
+
+@pytest.mark.parametrize('reverse_flag', [False, True])
+def test_polygon_coverage_box(reverse_flag):
+    ring = box(0.5, 0.5, 2.5, 2.5)
+    if reverse_flag:
+        ring = ring[::-1]
+    np.testing.assert_allclose(
+        coverage_array([ring], 0, 4, 1, 4, 4), [
+            [0, 0, 0, 0],
+            [0.25, 0.5, 0.25, 0],
+            [0.5, 1, 0.5, 0],
+            [0.25, 0.5, 0.25, 0]])
+
+
+@pytest.mark.parametrize('reverse_flag', [False, True])
+def test_polygon_coverage_diagonal(reverse_flag):
+    # Triangle and diamond edges cross the cells diagonally
+    triangle = [(0, 0), (2, 0), (0, 2)]
+    diamond = [(1, 0), (2, 1), (1, 2), (0, 1)]
+    if reverse_flag:
+        triangle, diamond = triangle[::-1], diamond[::-1]
+    np.testing.assert_allclose(
+        coverage_array([triangle], 0, 2, 1, 2, 2), [[0.5, 0], [1, 0.5]])
+    np.testing.assert_allclose(
+        coverage_array([diamond], 0, 2, 1, 2, 2), [[0.5, 0.5], [0.5, 0.5]])
+
+    # Same triangle on a grid with a different origin and cellsize
+    triangle = [(100 + 20 * x, 500 + 20 * y) for x, y in triangle]
+    np.testing.assert_allclose(
+        coverage_array([triangle], 100, 540, 20, 2, 2), [[0.5, 0], [1, 0.5]])
+
+
+def test_polygon_coverage_hole():
+    # The interior ring has the opposite orientation
+    np.testing.assert_allclose(
+        coverage_array(
+            [box(0, 0, 3, 3), box(0.5, 0.5, 1.5, 1.5)[::-1]], 0, 3, 1, 3, 3),
+        [[1, 1, 1], [0.75, 0.75, 1], [0.75, 0.75, 1]])
+
+
+def test_polygon_coverage_grid_edge():
+    # Only the part of the polygon in the grid is counted
+    np.testing.assert_allclose(
+        coverage_array([box(-1, -1, 1.5, 1.5)], 0, 3, 1, 3, 3),
+        [[0, 0, 0], [0.5, 0.25, 0], [1, 0.5, 0]])
+    np.testing.assert_allclose(
+        coverage_array([box(2.5, 1, 5, 6)], 0, 3, 1, 3, 3),
+        [[0, 0, 0.5], [0, 0, 0.5], [0, 0, 0]])
+    cell_array, fraction_array = polygon.polygon_coverage(
+        [box(5, 5, 6, 6)], 0, 3, 1, 3, 3)
+    assert cell_array.size == 0 and fraction_array.size == 0
+
+
+def test_polygon_coverage_area():
+    # Fractions of an irregular polygon sum to its area (in cells)
+    rs = np.random.RandomState(0)
+    angle = np.sort(rs.uniform(0, 2 * np.pi, 40))
+    radius = rs.uniform(2, 4, 40)
+    ring = np.column_stack([
+        5 + radius * np.cos(angle), 5 + radius * np.sin(angle)])
+    area = 0.5 * np.sum(
+        ring[:, 0] * np.roll(ring[:, 1], -1) -
+        np.roll(ring[:, 0], -1) * ring[:, 1])
+    cell_array, fraction_array = polygon.polygon_coverage(
+        [ring], 0, 10, 0.5, 20, 20)
+    assert np.sum(fraction_array) * 0.25 == pytest.approx(area)
+    assert np.all((fraction_array > 0) & (fraction_array <= 1))
+
+
+def test_zone_coverage():
+    # Polygons of the same zone are combined, the table is sorted by cell
+    #   and zone
+    cell_array, zone_array, fraction_array = polygon.zone_coverage(
+        [[box(0, 0, 0.5, 2)], [box(0.5, 1, 2, 2)], [box(0.5, 0, 1, 0.5)]],
+        [20, 10, 10], 0, 2, 1, 2, 2)
+    np.testing.assert_array_equal(cell_array, [0, 0, 1, 2, 2])
+    np.testing.assert_array_equal(zone_array, [10, 20, 10, 10, 20])
+    np.testing.assert_allclose(fraction_array, [0.5, 0.5, 1, 0.25, 0.5])
+
+    cell_array, zone_array, fraction_array = polygon.zone_coverage(
+        [], [], 0, 2, 1, 2, 2)
+    assert cell_array.size == 0 and zone_array.size == 0
+
+
+# Sparse weights
+def test_edge_pieces():
+    # Edge (in grid units) crosses two column lines and one row line
+    edge_i, piece_rows, piece_cols, piece_du, piece_area = \
+        polygon.edge_pieces(
+            np.array([0.5]), np.array([0.5]),
+            np.array([2.5]), np.array([1.5]))
+    np.testing.assert_array_equal(edge_i, [0, 0, 0, 0])
+    np.testing.assert_array_equal(piece_rows, [0, 0, 1, 1])
+    np.testing.assert_array_equal(piece_cols, [0, 1, 1, 2])
+    np.testing.assert_allclose(piece_du, [0.5, 0.5, 0.5, 0.5])
+    # Area between each piece and the bottom of its cell
+    np.testing.assert_allclose(
+        piece_area, [0.1875, 0.0625, 0.4375, 0.3125])
+
+
+def test_polygon_weights():
+    # Model cells (rotated squares) projected to a coarser source grid
+    rs = np.random.RandomState(0)
+    count = 25
+    center_x = rs.uniform(1, 9, count)
+    center_y = rs.uniform(1, 9, count)
+    angle = rs.uniform(0, np.pi / 2, count)[:, np.newaxis] + \
+        np.array([0, 0.5, 1, 1.5]) * np.pi
+    x_array = center_x[:, np.newaxis] + 0.6 * np.cos(angle)
+    y_array = center_y[:, np.newaxis] + 0.6 * np.sin(angle)
+    # Clockwise polygons have the same weights
+    x_array[::2], y_array[::2] = x_array[::2, ::-1], y_array[::2, ::-1]
+
+    # Small chunks so the chunks are combined
+    indptr, index_array, area_array = polygon.polygon_weights(
+        x_array, y_array, 0, 10, 2, 5, 5, chunk_size=4)
+    assert indptr.size == count + 1
+    assert indptr[-1] == index_array.size == area_array.size
+
+    # Each row sums to the area of the model cell (in source cells)
+    np.testing.assert_allclose(
+        np.add.reduceat(area_array, indptr[:-1]), 0.72 / 4)
+    for i in range(count):
+        cell_array, fraction_array = polygon.polygon_coverage(
+            [np.column_stack([x_array[i], y_array[i]])], 0, 10, 2, 5, 5)
+        row_slice = slice(indptr[i], indptr[i + 1])
+        np.testing.assert_array_equal(
+            np.sort(index_array[row_slice]), cell_array)
+        np.testing.assert_allclose(
+            area_array[row_slice][np.argsort(index_array[row_slice])],
+            fraction_array)
+
+
+def test_polygon_weights_grid_edge():
+    # Cells outside the source grid are dropped, rows can be empty
+    x_array = np.array([box(-1, -1, 1, 1), box(20, 20, 21, 21)])[:, :, 0]
+    y_array = np.array([box(-1, -1, 1, 1), box(20, 20, 21, 21)])[:, :, 1]
+    indptr, index_array, area_array = polygon.polygon_weights(
+        x_array, y_array, 0, 2, 1, 2, 2)
+    np.testing.assert_array_equal(indptr, [0, 1, 1])
+    np.testing.assert_array_equal(index_array, [2])
+    np.testing.assert_allclose(area_array, [1])
+
+
+def test_weighted_mean():
+    indptr = np.array([0, 2, 3, 3, 5])
+    index_array = np.array([0, 1, 2, 0, 3])
+    weight_array = np.array([0.25, 0.75, 1, 0.5, 0.5])
+    value_array = np.array([[2, 4], [np.nan, 8]])
+    mean_array, weight_sum = polygon.weighted_mean(
+        indptr, index_array, weight_array, value_array)
+    # Rows without any values (or only NaN values) are NaN
+    np.testing.assert_allclose(mean_array, [3.5, np.nan, np.nan, 5])
+    np.testing.assert_allclose(weight_sum, [1, 0, 0, 1])
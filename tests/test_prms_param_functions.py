@@ -0,0 +1,236 @@
+#--------------------------------
+# Name:         test_prms_param_functions.py
+# Purpose:      Tests for the PRMS parameter file functions
+# Notes:        Does not require ArcGIS
+# Python:       2.7
+#--------------------------------
+
+import os
+from StringIO import StringIO
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'misc'))
+import prms_param_functions as prms_param
+from param_writer_benchmark import legacy_write_param_file
+
+HEADER_STR = 'PRMS parameter file generated with gsflow-arcpy-tools version X\n'
+
+
+def build_params():
+    """Small set of dimensions and parameters of each type"""
+    rs = np.random.RandomState(0)
+    dimen_list = [('nhru', 7), ('nmonths', 12), ('one', 1)]
+    param_list = [
+        ('hru_area', ['nhru'], 7, 2, np.full(7, 24.710538), 3),
+        ('hru_type', ['nhru'], 7, 1,
+         rs.randint(0, 4, 7).astype(np.int32), 3),
+        ('rain_adj', ['nhru', 'nmonths'], 84, 2, np.asfortranarray(
+            np.round(0.5 + rs.rand(7, 12), 6)), 3),
+        ('tmax_index', ['nmonths'], 12, 3, np.round(
+            50 + 30 * rs.rand(12), 6), 1),
+        ('basin_name', ['one'], 1, 4, np.array(['sagehen'], dtype=object), 1)]
+    return dimen_list, param_list
+
+
+def read_bytes(file_path):
+    with open(file_path, 'rb') as input_f:
+        return input_f.read()
+
+
+# Chunked writer
+@pytest.mark.parametrize('param_type', [1, 2, 4])
+@pytest.mark.parametrize('n', [1, 3, 5])
+def test_write_param_values(param_type, n):
+    rs = np.random.RandomState(n)
+    if param_type == 1:
+        values = rs.randint(-100, 100, 23)
+    elif param_type == 2:
+        values = 1000 * rs.randn(23)
+    else:
+        values = np.array(['a{}'.format(i) for i in range(23)], dtype=object)
+    # Small chunks so the chunk boundaries and the partial last line
+    #   are both checked
+    output_f = StringIO()
+    prms_param.write_param_values(
+        output_f, values, param_type, n, chunk_size=4)
+    param_formats = {1: '{:d}', 2: '{:f}', 3: '{:f}', 4: '{}'}
+    value_list = values.tolist()
+    expected = ''.join(
+        ' '.join(param_formats[param_type].format(v)
+                 for v in value_list[i:i + n]) + '\n'
+        for i in range(0, len(value_list), n))
+    assert output_f.getvalue() == expected
+
+
+@pytest.mark.parametrize('thread_flag', [True, False])
+def test_write_param_files_legacy(tmpdir, thread_flag):
+    dimen_list, param_list = build_params()
+    param_file_dict = {
+        str(tmpdir.join('dimensions.param')): (dimen_list, []),
+        str(tmpdir.join('parameters.param')): ([], param_list),
+        str(tmpdir.join('both.param')): (dimen_list, param_list)}
+    prms_param.write_param_files(
+        param_file_dict, HEADER_STR, thread_flag=thread_flag)
+    for output_path, (dimen_list, param_list) in param_file_dict.items():
+        legacy_path = output_path + '.legacy'
+        legacy_write_param_file(
+            legacy_path, HEADER_STR, dimen_list, param_list)
+        assert read_bytes(output_path) == read_bytes(legacy_path)
+
+
+def test_write_param_file_skip(tmpdir):
+    dimen_list, param_list = build_params()
+    output_path = str(tmpdir.join('skip.param'))
+    prms_param.write_param_file(
+        output_path, HEADER_STR, dimen_list + [('nsegment', None)],
+        param_list + [('seg_length', ['nsegment'], 0, 2, None, 1)])
+    legacy_path = str(tmpdir.join('legacy.param'))
+    legacy_write_param_file(legacy_path, HEADER_STR, dimen_list, param_list)
+    assert read_bytes(output_path) == read_bytes(legacy_path)
+
+
+# Indexed reader
+def test_param_file(tmpdir):
+    dimen_list, param_list = build_params()
+    param_path = str(tmpdir.join('test.param'))
+    prms_param.write_param_file(
+        param_path, HEADER_STR, dimen_list, param_list)
+
+    param_file = prms_param.ParamFile(param_path)
+    assert param_file.header == HEADER_STR
+    assert param_file.dimensions.items() == dimen_list
+    assert list(param_file.params.keys()) == [p[0] for p in param_list]
+    for name, dimen_names, value_count, param_type, values, n in \
+            param_list:
+        param = param_file.params[name]
+        assert param['dimen_names'] == dimen_names
+        assert param['count'] == value_count
+        assert param['type'] == param_type
+        assert param['n'] == n
+        assert name in param_file
+        value_array = param_file[name]
+        assert value_array.dtype == prms_param.PARAM_DTYPES[param_type]
+        if param_type == 4:
+            assert value_array.tolist() == values.tolist()
+        else:
+            # Floats are written with 6 decimal places
+            np.testing.assert_allclose(
+                value_array, np.ravel(values, order='F'), atol=0.0000005)
+    assert 'missing' not in param_file
+
+
+def test_param_file_no_titles(tmpdir):
+    # i.e. the CRT cascade.param file
+    param_path = str(tmpdir.join('cascade.param'))
+    with open(param_path, 'w') as output_f:
+        output_f.write(
+            '####\nncascade\n3\n'
+            '####\nhru_up_id\n1\nncascade\n3\n1\n1\n2\n2\n'
+            '####\nhru_pct_up\n1\nncascade\n3\n2\n0.5\n0.5\n1.0\n')
+    param_file = prms_param.ParamFile(param_path)
+    assert param_file.header == ''
+    assert param_file.dimensions.items() == [('ncascade', 3)]
+    assert param_file['hru_up_id'].tolist() == [1, 2, 2]
+    assert param_file['hru_pct_up'].tolist() == [0.5, 0.5, 1.0]
+
+
+def test_param_file_count(tmpdir):
+    param_path = str(tmpdir.join('count.param'))
+    with open(param_path, 'w') as output_f:
+        output_f.write('####\nhru_up_id\n1\nncascade\n3\n1\n1\n2\n')
+    param_file = prms_param.ParamFile(param_path)
+    with pytest.raises(ValueError):
+        param_file.read('hru_up_id')
+
+
+def test_param_diff(tmpdir):
+    dimen_list, param_list = build_params()
+    path_a = str(tmpdir.join('a.param'))
+    path_b = str(tmpdir.join('b.param'))
+    prms_param.write_param_file(path_a, HEADER_STR, dimen_list, param_list)
+
+    # Change a few parameters and drop/add one
+    param_dict = {p[0]: list(p) for p in param_list}
+    param_dict['hru_area'][4] = param_dict['hru_area'][4].copy()
+    param_dict['hru_area'][4][2] += 0.5
+    param_dict['basin_name'][4] = np.array(['other'], dtype=object)
+    param_dict['tmax_index'][1:4] = [['one'], 1, 3]
+    param_dict['tmax_index'][4] = np.array([50.0])
+    del param_dict['hru_type']
+    param_dict['hru_slope'] = [
+        'hru_slope', ['nhru'], 7, 2, np.zeros(7), 3]
+    prms_param.write_param_file(
+        path_b, HEADER_STR, dimen_list[:2] + [('one', 2)],
+        [tuple(param_dict[p[0]]) for p in param_list if p[0] in param_dict] +
+        [tuple(param_dict['hru_slope'])])
+
+    diff_dict = {
+        d[0]: d[1:] for d in prms_param.param_diff(path_a, path_b)}
+    assert diff_dict['nhru'] == ('OK', 0, 0, 0)
+    assert diff_dict['one'] == ('DIFF', 1, 1, 1)
+    assert diff_dict['hru_area'][:2] == ('DIFF', 1)
+    assert diff_dict['hru_area'][2] == pytest.approx(0.5)
+    assert diff_dict['hru_type'] == ('ONLY_A', 0, 0, 0)
+    assert diff_dict['hru_slope'] == ('ONLY_B', 0, 0, 0)
+    assert diff_dict['rain_adj'] == ('OK', 0, 0, 0)
+    assert diff_dict['tmax_index'] == ('SHAPE', 0, 0, 0)
+    assert diff_dict['basin_name'] == ('DIFF', 1, 0, 0)
+
+
+# NPZ format
+@pytest.mark.parametrize('compress_flag', [True, False])
+def test_param_npz(tmpdir, compress_flag):
+    dimen_list, param_list = build_params()
+    npz_path = str(tmpdir.join('test.npz'))
+    prms_param.write_param_npz(
+        npz_path, HEADER_STR, dimen_list + [('nsegment', None)],
+        param_list, compress_flag=compress_flag)
+    assert os.path.isfile(npz_path)
+
+    header_str, npz_dimen_list, npz_param_list = prms_param.read_param_npz(
+        npz_path)
+    assert header_str == HEADER_STR
+    assert npz_dimen_list == dimen_list
+    for param, npz_param in zip(param_list, npz_param_list):
+        assert npz_param[:4] == param[:4]
+        assert npz_param[5] == param[5]
+        assert npz_param[4].dtype == prms_param.PARAM_DTYPES[param[3]]
+        np.testing.assert_array_equal(npz_param[4], param[4])
+
+
+def test_convert_param_file(tmpdir):
+    # ASCII -> NPZ -> ASCII gives the same file
+    dimen_list, param_list = build_params()
+    ascii_path = str(tmpdir.join('test.param'))
+    npz_path = str(tmpdir.join('test.npz'))
+    output_path = str(tmpdir.join('output.param'))
+    prms_param.write_param_file(
+        ascii_path, HEADER_STR, dimen_list, param_list)
+    prms_param.convert_param_file(ascii_path, npz_path)
+    prms_param.convert_param_file(npz_path, output_path)
+    assert read_bytes(output_path) == read_bytes(ascii_path)
+
+    # Parameters are reshaped when the dimensions are in the file
+    header_str, npz_dimen_list, npz_param_list = prms_param.read_param_npz(
+        npz_path)
+    assert npz_param_list[2][4].shape == (7, 12)
+    np.testing.assert_array_equal(npz_param_list[2][4], param_list[2][4])
+
+
+def test_write_param_files_npz(tmpdir):
+    dimen_list, param_list = build_params()
+    npz_path = str(tmpdir.join('test.npz'))
+    prms_param.write_param_files(
+        {npz_path: (dimen_list, param_list)}, HEADER_STR,
+        param_format='npz')
+    assert prms_param.read_param_npz(npz_path)[1] == dimen_list
+    with pytest.raises(ValueError):
+        prms_param.write_param_files(
+            {npz_path: (dimen_list, param_list)}, HEADER_STR,
+            param_format='CSV')